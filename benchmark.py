@@ -0,0 +1,332 @@
+"""
+Benchmark harness for the Dash Cam Video Joiner.
+
+Generates synthetic dashcam clip sets with the bundled ffmpeg and times the
+hot paths of main.py separately. Results are written as JSON so runs from
+different versions can be compared.
+
+Example:
+    python benchmark.py --count 20 --duration 5 --output bench_results.json
+"""
+import argparse
+import configparser
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import main
+
+
+def generate_clips(directory, count, duration, codec, resolution, gap_every, gap_seconds,
+                   timestamp_format, extension, start=None):
+    """
+    Write a synthetic set of dashcam segments.
+
+    Args:
+        directory (str): Where to write the clips.
+        count (int): Number of clips.
+        duration (float): Length of each clip in seconds.
+        codec (str): ffmpeg video encoder, e.g. 'libx264'.
+        resolution (str): Frame size such as '1280x720'.
+        gap_every (int): Insert a recording gap after every N clips (0 for none).
+        gap_seconds (float): Length of each gap in seconds.
+        timestamp_format (str): strftime format used for the filenames.
+        extension (str): File extension, including the dot.
+        start (datetime.datetime): Timestamp of the first clip.
+
+    Returns:
+        list: Paths of the generated clips in chronological order.
+    """
+    ffmpeg = main.get_ffmpeg_exe()
+    timestamp = start or datetime.datetime(2024, 11, 11, 8, 0, 0)
+    paths = []
+    first_path = None
+    for index in range(count):
+        path = os.path.join(directory, timestamp.strftime(timestamp_format) + extension)
+        if first_path is None:
+            # Encode one clip; the rest are copies, since content does not matter for timing
+            subprocess.run([
+                ffmpeg, '-y', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', f"testsrc2=size={resolution}:rate=30",
+                '-f', 'lavfi', '-i', 'sine=frequency=440',
+                '-t', str(duration), '-c:v', codec, '-pix_fmt', 'yuv420p', '-c:a', 'aac',
+                '-f', main.CONTAINER_FORMATS.get(extension, 'mp4'), path
+            ], check=True)
+            first_path = path
+        else:
+            shutil.copyfile(first_path, path)
+        paths.append(path)
+        timestamp += datetime.timedelta(seconds=duration)
+        if gap_every and (index + 1) % gap_every == 0:
+            timestamp += datetime.timedelta(seconds=gap_seconds)
+    return paths
+
+
+def make_handler(directory, args, scheduler, join_mode='compose'):
+    """Create a VideoFileHandler wired to a throwaway catalog."""
+    catalog = main.TripCatalog(os.path.join(directory, 'bench_catalog.db'))
+    return main.VideoFileHandler(
+        time_threshold=args.threshold,
+        timestamp_format=args.format,
+        video_extension=args.extension,
+        root=None,
+        scheduler=scheduler,
+        catalog=catalog,
+        join_mode=join_mode,
+    )
+
+
+def bench_extract_timestamp(args):
+    """Time parsing of synthetic filenames with extract_timestamp."""
+    scheduler = main.JoinScheduler(main.ResourcePolicy())
+    with tempfile.TemporaryDirectory() as directory:
+        handler = make_handler(directory, args, scheduler)
+        base = datetime.datetime(2024, 11, 11, 8, 0, 0)
+        names = [(base + datetime.timedelta(seconds=60 * i)).strftime(args.format) + args.extension
+                 for i in range(args.parse_iterations)]
+        started = time.perf_counter()
+        for name in names:
+            handler.extract_timestamp(name)
+        elapsed = time.perf_counter() - started
+        handler.catalog.close()
+    return {'files': len(names), 'seconds': elapsed, 'per_file_us': elapsed / len(names) * 1e6}
+
+
+def bench_grouping(args):
+    """Time group_videos, the grouping step of process_videos."""
+    scheduler = main.JoinScheduler(main.ResourcePolicy())
+    with tempfile.TemporaryDirectory() as directory:
+        handler = make_handler(directory, args, scheduler)
+        base = datetime.datetime(2024, 11, 11, 8, 0, 0)
+        video_files = []
+        timestamp = base
+        for index in range(args.group_files):
+            video_files.append((f"clip{index}{args.extension}", timestamp))
+            timestamp += datetime.timedelta(seconds=args.duration)
+            if args.gap_every and (index + 1) % args.gap_every == 0:
+                timestamp += datetime.timedelta(seconds=args.gap_seconds)
+        started = time.perf_counter()
+        groups = handler.group_videos(video_files)
+        elapsed = time.perf_counter() - started
+        handler.catalog.close()
+    return {'files': len(video_files), 'groups': len(groups), 'seconds': elapsed}
+
+
+def bench_join(args, join_mode):
+    """Time an end-to-end join of a synthetic trip in the given mode."""
+    policy = main.ResourcePolicy(niceness=0, io_priority_class='none', min_workers=1, max_workers=1)
+    scheduler = main.JoinScheduler(policy)
+    scheduler.start()
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_clips(directory, args.count, args.duration, args.codec, args.resolution,
+                               0, 0, args.format, args.extension)
+        source_bytes = sum(os.path.getsize(path) for path in paths)
+        handler = make_handler(directory, args, scheduler, join_mode)
+        group = [(path, handler.extract_timestamp(path)) for path in paths]
+        output_path = handler.output_path_for(group)
+        started = time.perf_counter()
+        # Join the whole trip as one group, the way process_videos hands it over
+        handler.join_videos(group)
+        scheduler.wait_until_idle()
+        elapsed = time.perf_counter() - started
+        scheduler.shutdown()
+        handler.catalog.close()
+        # A failed job finishes quickly too; only time a join that produced its output
+        joined = handler.metrics.value('joins_total', status='done') >= 1
+        if not joined or not os.path.exists(output_path):
+            return {'clips': len(paths), 'error': f"{join_mode} join failed; see the log for details",
+                    'output_written': os.path.exists(output_path), 'joins_done': joined}
+    return {
+        'clips': len(paths),
+        'source_seconds': args.count * args.duration,
+        'source_bytes': source_bytes,
+        'seconds': elapsed,
+        'realtime_factor': args.count * args.duration / elapsed,
+    }
+
+
+def write_ungroupable_files(directory, count, args):
+    """Write small placeholder segments spaced beyond the threshold, so they never form a group."""
+    base = datetime.datetime(2024, 11, 11, 8, 0, 0)
+    for index in range(count):
+        # Space the files beyond the threshold so the benchmark measures scanning, not joining
+        timestamp = base + datetime.timedelta(seconds=(args.threshold + 1) * index)
+        with open(os.path.join(directory, timestamp.strftime(args.format) + args.extension), 'wb') as f:
+            f.write(b'\0' * 1024)
+
+
+def bench_backfill(args):
+    """Time process_existing_files over N files that do not form any joinable group."""
+    scheduler = main.JoinScheduler(main.ResourcePolicy())
+    with tempfile.TemporaryDirectory() as directory:
+        write_ungroupable_files(directory, args.backfill_files, args)
+        handler = make_handler(directory, args, scheduler)
+        started = time.perf_counter()
+        handler.process_existing_files(directory)
+        elapsed = time.perf_counter() - started
+        handler.catalog.close()
+    return {'files': args.backfill_files, 'seconds': elapsed, 'files_per_second': args.backfill_files / elapsed}
+
+
+def bench_startup(args):
+    """Time from main.py starting to load until its window is drawn, over several launches."""
+    runs = []
+    # A throwaway configuration, so the runs neither read nor rewrite the user's config.ini
+    # and retention never sees their archive
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = os.path.join(directory, 'config.ini')
+        with open(config_file, 'w') as f:
+            f.write("[Settings]\n")
+        for _ in range(args.startup_runs):
+            started = time.perf_counter()
+            result = subprocess.run([sys.executable, os.path.abspath(main.__file__), '--startup-benchmark',
+                                     '--config', config_file], capture_output=True, text=True)
+            wall = time.perf_counter() - started
+            if result.returncode != 0:
+                # Typically no display is available
+                return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed'}
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            runs.append({'time_to_window_seconds': report['time_to_window_seconds'], 'process_seconds': wall})
+    return {
+        'runs': runs,
+        'best_time_to_window_seconds': min(run['time_to_window_seconds'] for run in runs),
+    }
+
+
+def bench_ui_latency(args):
+    """
+    Measure how late Tk timers fire while the window starts monitoring a large backlog.
+
+    A short after() tick runs on the Tk thread during the backfill; any delay beyond
+    its interval is time the UI thread was blocked. Scanning and grouping run on the
+    command and engine threads, so the worst delay must stay under the bound.
+    """
+    import tkinter as tk
+
+    with tempfile.TemporaryDirectory() as directory:
+        watch_directory = os.path.join(directory, 'watch')
+        os.makedirs(watch_directory)
+        write_ungroupable_files(watch_directory, args.ui_files, args)
+        config = configparser.ConfigParser(interpolation=None)
+        config['Settings'] = {
+            'selected_directory': watch_directory,
+            'time_threshold': str(args.threshold),
+            'timestamp_format': args.format,
+            'video_extension': args.extension,
+        }
+        config_file = os.path.join(directory, 'config.ini')
+        with open(config_file, 'w') as f:
+            config.write(f)
+
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            # Typically no display is available; without a measurement the gate fails
+            return {'error': str(e), 'passed': False}
+        app = main.DashCamVideoJoinerApp(root, config_file=config_file)
+        tick_seconds = 0.01
+        delays = []
+        state = {'ticks': 0}
+
+        def tick():
+            now = time.perf_counter()
+            delays.append(max(0.0, now - state['due']))
+            state['ticks'] += 1
+            # Check for completion every tenth tick to keep the probe itself cheap
+            if state['ticks'] % 10 == 0:
+                # Read the snapshot the window renders from, as the window itself does
+                seen = app.state['metrics'].get('segments_seen_total', 0) if app.state else 0
+                if seen >= args.ui_files or now - state['started'] > args.ui_timeout:
+                    state['seen'] = seen
+                    state['seconds'] = now - state['started']
+                    root.quit()
+                    return
+            state['due'] = time.perf_counter() + tick_seconds
+            root.after(int(tick_seconds * 1000), tick)
+
+        def begin():
+            if app.state is None:
+                # The service is still being built on the command thread
+                root.after(50, begin)
+                return
+            state['started'] = time.perf_counter()
+            state['due'] = state['started']
+            app.toggle_monitoring()
+            tick()
+
+        # Start once the window is up
+        root.after(200, begin)
+        root.mainloop()
+        # Shutdown runs on the command thread and closes the window when done
+        app.exit_app(save_config=False)
+        root.mainloop()
+
+    delays.sort()
+    max_delay_ms = delays[-1] * 1000 if delays else 0.0
+    return {
+        'files': args.ui_files,
+        'files_seen': state.get('seen', 0),
+        'seconds': state.get('seconds'),
+        'ticks': len(delays),
+        'p99_delay_ms': delays[int(len(delays) * 0.99)] * 1000 if delays else 0.0,
+        'max_delay_ms': max_delay_ms,
+        'bound_ms': args.ui_latency_bound_ms,
+        'passed': state.get('seen', 0) >= args.ui_files and max_delay_ms <= args.ui_latency_bound_ms,
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Dash Cam Video Joiner hot paths.")
+    parser.add_argument('--count', type=int, default=10, help="clips per synthetic trip")
+    parser.add_argument('--duration', type=float, default=5, help="seconds per clip")
+    parser.add_argument('--codec', default='libx264', help="ffmpeg encoder for the synthetic clips")
+    parser.add_argument('--resolution', default='1280x720', help="synthetic frame size")
+    parser.add_argument('--gap-every', type=int, default=5, help="insert a gap after every N clips")
+    parser.add_argument('--gap-seconds', type=float, default=600, help="length of each gap")
+    parser.add_argument('--format', default='%Y-%m-%d %Hh %Mm %Ss', help="filename timestamp format")
+    parser.add_argument('--extension', default='.mp4', help="clip file extension")
+    parser.add_argument('--threshold', type=int, default=90, help="grouping time threshold in seconds")
+    parser.add_argument('--parse-iterations', type=int, default=10000, help="filenames to parse")
+    parser.add_argument('--group-files', type=int, default=10000, help="files to group")
+    parser.add_argument('--backfill-files', type=int, default=1000, help="files to backfill")
+    parser.add_argument('--startup-runs', type=int, default=3, help="launches for the startup benchmark")
+    parser.add_argument('--ui-files', type=int, default=10000, help="files backfilled by the UI responsiveness check")
+    parser.add_argument('--ui-latency-bound-ms', type=float, default=100,
+                        help="largest Tk timer delay allowed during the UI backfill")
+    parser.add_argument('--ui-timeout', type=float, default=600, help="give up on the UI backfill after this long")
+    parser.add_argument('--skip-ui-latency', action='store_true',
+                        help="skip the UI responsiveness check, e.g. on a machine without a display")
+    parser.add_argument('--modes', nargs='*', default=main.JOIN_MODES, help="join modes to benchmark")
+    parser.add_argument('--output', default='bench_results.json', help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    # Per-file log lines would dominate the timings
+    main.logging.getLogger().setLevel(main.logging.WARNING)
+
+    results = {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': vars(args),
+        'startup': bench_startup(args),
+        'extract_timestamp': bench_extract_timestamp(args),
+        'grouping': bench_grouping(args),
+        'backfill': bench_backfill(args),
+        'ui_latency': {'skipped': True} if args.skip_ui_latency else bench_ui_latency(args),
+        'join': {mode: bench_join(args, mode) for mode in args.modes},
+    }
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2, default=str)
+    print(json.dumps(results, indent=2, default=str))
+    # The UI responsiveness check is a pass/fail gate unless explicitly skipped; the timings are informational
+    return 0 if args.skip_ui_latency or results['ui_latency'].get('passed') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -1,24 +1,95 @@
+import time
+# Reference point for the time-to-window measurement
+STARTUP_BEGAN = time.perf_counter()
 import os  # Import os module to handle file paths
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox  # Import messagebox for dialog boxes
 from tkinter import filedialog  # Import filedialog for directory selection
-from PIL import Image, ImageTk  # Import PIL modules to handle images
 from watchdog.observers import Observer  # Used to monitor file system events
-from watchdog.events import FileSystemEventHandler  # Base class for handling events
+from watchdog.events import FileSystemEventHandler, FileCreatedEvent  # Base class for handling events
 import threading  # Used for running the observer in a separate thread
-import time
-import pystray  # Import pystray for system tray icon handling
-from pystray import MenuItem as item  # Import MenuItem for creating menu items in the tray icon
+import asyncio  # Event loop owning the grouping state
 import datetime
-from moviepy.editor import VideoFileClip, concatenate_videoclips  # Import MoviePy for video processing
 import configparser  # For handling configuration files
 import logging
+import logging.handlers  # Queue-based, non-blocking logging
+import contextvars
 import queue  # Import queue module for thread-safe communication between threads
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import collections
+import heapq  # Priority queue for pending jobs
+import itertools
+import shutil
+import subprocess
+import argparse
+import contextlib
+import copy
+import tracemalloc
+import json
+import csv
+import bisect
+import re
+import tempfile
+import sqlite3  # Catalog of trips and segments
+import socket
+import hashlib
+import struct  # MP4 box headers
+import signal
+import sys
+# PIL, pystray, MoviePy, cProfile and http.server are imported where first used to keep startup fast
+
+# Directory containing this script; images and settings are resolved relative to it
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Pre-scaled copies of the GUI images, so later launches skip decoding and resizing
+IMAGE_CACHE_DIR = os.path.join(APP_DIR, '.cache')
+
+
+def load_scaled_image(filename, size, keep_aspect=False):
+    """
+    Load an image from the application directory scaled to `size`, using a PNG cache.
+
+    Tk reads PNG natively, so a cache hit needs neither PIL nor a resize. On a
+    miss the image is scaled with PIL and the result is cached for next time.
+
+    Args:
+        filename (str): Image file name in the application directory.
+        size (tuple): (width, height) in pixels.
+        keep_aspect (bool): Fit inside `size` instead of stretching to it.
+
+    Returns:
+        tk.PhotoImage or ImageTk.PhotoImage: The scaled image.
+    """
+    source_path = os.path.join(APP_DIR, filename)
+    cache_name = f"{os.path.splitext(filename)[0]}_{size[0]}x{size[1]}{'_fit' if keep_aspect else ''}.png"
+    cache_path = os.path.join(IMAGE_CACHE_DIR, cache_name)
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(source_path):
+            return tk.PhotoImage(file=cache_path)
+    except (OSError, tk.TclError):
+        pass
+
+    from PIL import Image, ImageTk  # Only needed when the cache is cold
+    image = Image.open(source_path)
+    if keep_aspect:
+        # Resize the image while maintaining aspect ratio
+        image.thumbnail(size, Image.LANCZOS)
+    else:
+        image = image.resize(size, Image.LANCZOS)
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        image.save(cache_path)
+    except OSError as e:
+        logging.warning(f"Could not cache scaled image {cache_name}: {e}")
+    return ImageTk.PhotoImage(image)
+
+# How often the window applies state snapshots from the service
+GUI_POLL_INTERVAL_MS = 100
+# Seconds between state snapshots while no commands arrive
+STATE_INTERVAL_SECONDS = 1.0
+
 
 class DashCamVideoJoinerApp:
-    def __init__(self, root):
+    def __init__(self, root, profile=False, config_file=None):
         # Initialize the main application window
         self.root = root
         self.root.title("Dash Cam Video Joiner")
@@ -34,21 +105,14 @@ class DashCamVideoJoinerApp:
 
         # Load the logo image
         try:
-            # Determine the path to the logo image
-            logo_filename = "logo-tranparentBG.png"  # Use your actual logo file name
-            logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), logo_filename)
-            # Open the logo image file
-            logo_image = Image.open(logo_path)
-            # Resize the image while maintaining aspect ratio
-            logo_image.thumbnail((300, 300), Image.LANCZOS)
-            # Convert the image to a Tkinter-compatible photo image
-            logo_photo = ImageTk.PhotoImage(logo_image)
+            # Load the logo scaled to fit 300x300 while maintaining aspect ratio
+            logo_photo = load_scaled_image("logo-tranparentBG.png", (300, 300), keep_aspect=True)
             # Create a label to display the logo image
             self.logo_label = ttk.Label(self.root, image=logo_photo)
             self.logo_label.image = logo_photo  # Keep a reference to prevent garbage collection
             self.logo_label.grid(row=0, column=0, pady=(20, 10), sticky=tk.N)
         except Exception as e:
-            print(f"Error loading logo image: {e}")
+            logging.error(f"Error loading logo image: {e}")
 
         # Create a frame to organize the main controls
         main_frame = ttk.Frame(self.root, padding="10")
@@ -58,15 +122,9 @@ class DashCamVideoJoinerApp:
         self.root.columnconfigure(0, weight=1)
         main_frame.columnconfigure((0, 1, 2), weight=1)
 
-        # Load and resize the 'play.jpg' image
-        play_image = Image.open('play.jpg')  # Open the play image file
-        play_image = play_image.resize((50, 50), Image.LANCZOS)  # Resize to 50x50 pixels using LANCZOS filter
-        self.play_photo = ImageTk.PhotoImage(play_image)  # Convert the image to a Tkinter-compatible PhotoImage
-
-        # Load and resize the 'pause.jpg' image
-        pause_image = Image.open('pause.jpg')  # Open the pause image file
-        pause_image = pause_image.resize((50, 50), Image.LANCZOS)  # Resize to 50x50 pixels using LANCZOS filter
-        self.pause_photo = ImageTk.PhotoImage(pause_image)  # Convert the image to a Tkinter-compatible PhotoImage
+        # Load the 'play.jpg' and 'pause.jpg' images resized to 50x50 pixels
+        self.play_photo = load_scaled_image('play.jpg', (50, 50))
+        self.pause_photo = load_scaled_image('pause.jpg', (50, 50))
 
         # Create the Start/Stop monitoring button with the 'play' image
         self.start_stop_button = tk.Button(
@@ -92,45 +150,70 @@ class DashCamVideoJoinerApp:
         )
         self.log_button.grid(row=0, column=2, padx=5, pady=5)
 
+        # Create a button to preview what a backfill would do
+        self.plan_button = ttk.Button(
+            main_frame, text="Plan Backfill", command=lambda: self.send('plan')
+        )
+        self.plan_button.grid(row=1, column=1, padx=5, pady=(0, 10))
+
+        # Create a button to find footage by time range in the catalog
+        self.search_button = ttk.Button(
+            main_frame, text="Search Footage", command=self.open_search_window
+        )
+        self.search_button.grid(row=1, column=2, padx=5, pady=(0, 10))
+
         # Create a label to display the status
         self.status_label = ttk.Label(main_frame, text="Status: Idle")
         self.status_label.grid(row=2, column=0, columnspan=3, padx=5, pady=10)
 
-        # Variable to store the selected directory path
-        self.selected_directory = None
-
-        # Variable to store the time threshold value
-        self.time_threshold = 90  # Default time threshold in seconds
-
-        # Flag to indicate if monitoring is active
-        self.is_monitoring = False
-
-        # Initialize the observer object for directory monitoring
-        self.observer = None
-
         # System tray icon setup
         self.tray_icon = None  # Placeholder for the tray icon object
 
-        # Variable to store the timestamp format
-        self.timestamp_format = '%Y-%m-%d %Hh %Mm %Ss'  # Updated default format to '2024-11-11 15h 49m 23s'
-
-        # Variable to store the selected video file extension
-        self.video_extension = '.mp4'  # Default extension
-
-        # Path to the configuration file
-        self.config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
-
-        # Load configurations
-        self.load_config()
+        # Compact stats panel below the status line
+        self.stats_label = ttk.Label(main_frame, text="", foreground="gray")
+        self.stats_label.grid(row=3, column=0, columnspan=3, padx=5, pady=(0, 10))
+
+        # Settings shown by the window, filled in from the first state snapshot
+        self.dir_var = tk.StringVar(value="No directory selected")
+        self.threshold_var = tk.StringVar()
+        self.format_var = tk.StringVar()
+        self.extension_var = tk.StringVar()
+        self.output_extension_var = tk.StringVar()
+
+        # The non-GUI core (configuration, job scheduler, catalog and directory monitoring)
+        # is built and driven on the command thread
+        self.start_service(config_file or os.path.join(APP_DIR, 'config.ini'), profile)
+        self.poll_updates()
+
+        # Keep recent log records in a bounded ring buffer for the log window
+        self.log_buffer = LogRingBuffer(LOG_BUFFER_SIZE)
+        text_handler = TextHandler(self.log_buffer)
+        text_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        attach_log_handler(text_handler)
+
+    def start_service(self, config_file, profile=False):
+        """
+        Start the command thread, which builds the JoinerService and then runs the window's commands.
 
-        # Update GUI elements with loaded configurations
-        self.dir_var = tk.StringVar(value=self.selected_directory or "No directory selected")
-        self.threshold_var = tk.StringVar(value=str(self.time_threshold))
-        self.format_var = tk.StringVar(value=self.timestamp_format)
-        self.extension_var = tk.StringVar(value=self.video_extension)
+        The window never touches the service: commands go to the command thread through
+        one queue and state snapshots come back through another, polled with after().
 
-        # Initialize the log queue
-        self.log_queue = queue.Queue()
+        Args:
+            config_file (str): Path of the configuration file.
+            profile (bool): Turn profiling on for this run.
+        """
+        self.service = None
+        self.commands = queue.Queue()
+        self.updates = queue.Queue()
+        # Latest state snapshot from the command thread; None until the service is up
+        self.state = None
+        # Whether monitoring has been started at least once, for the Idle/Stopped status text
+        self.has_monitored = False
+        # Set once exit has been requested; the window closes when the service has shut down
+        self.exiting = False
+        self.command_thread = threading.Thread(target=self._command_loop, args=(config_file, profile),
+                                               name="gui-commands", daemon=True)
+        self.command_thread.start()
 
     def hide_window(self):
         """Hide the main window and show the tray icon."""
@@ -149,8 +232,13 @@ class DashCamVideoJoinerApp:
 
     def show_tray_icon(self):
         """Create and display the system tray icon."""
+        # Imported on first use; pystray and PIL are not needed until the window is minimized
+        import pystray  # Import pystray for system tray icon handling
+        from pystray import MenuItem as item  # Import MenuItem for creating menu items in the tray icon
+        from PIL import Image
+
         # Load an icon image for the system tray (ensure 'icon.png' exists)
-        icon_image = Image.open("icon.png")  # Provide an icon image for the tray
+        icon_image = Image.open(os.path.join(APP_DIR, "icon.png"))  # Provide an icon image for the tray
         # Create a menu for the tray icon
         menu = pystray.Menu(
             item('Restore', self.show_window),
@@ -161,17 +249,22 @@ class DashCamVideoJoinerApp:
         # Run the icon in a separate thread to prevent blocking the main thread
         threading.Thread(target=self.tray_icon.run, daemon=True).start()
 
-    def exit_app(self):
-        """Exit the application gracefully."""
-        # Stop monitoring if it is active
-        if self.is_monitoring:
-            self.stop_monitoring()
+    def exit_app(self, save_config=True):
+        """
+        Exit the application gracefully.
 
-        # Save configuration before exiting
-        self.save_config()
+        Saving the configuration and waiting for running joins happen on the command
+        thread, after whatever the window already asked for, so the Tk thread keeps
+        drawing meanwhile; poll_updates destroys the window once the service is down.
+        Safe to call from the tray icon's thread.
 
-        # Destroy the main window to exit the application
-        self.root.destroy()
+        Args:
+            save_config (bool): Write the configuration back to config.ini first.
+        """
+        if self.exiting:
+            return
+        self.exiting = True
+        self.commands.put(('exit', (save_config,)))
 
     def on_closing(self):
         """Handle the window closing event."""
@@ -194,12 +287,8 @@ class DashCamVideoJoinerApp:
         dir_label = ttk.Label(config_frame, text="Selected Directory:")
         dir_label.grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
 
-        # Variable to display the selected directory
-        self.dir_var = tk.StringVar()
-        if self.selected_directory:
-            self.dir_var.set(self.selected_directory)
-        else:
-            self.dir_var.set("No directory selected")
+        # Show the settings of the latest snapshot; nothing is applied until Save
+        self.load_settings()
 
         dir_display = ttk.Label(config_frame, textvariable=self.dir_var)
         dir_display.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
@@ -226,7 +315,6 @@ class DashCamVideoJoinerApp:
         threshold_label.grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
 
         # Entry widget for the time threshold
-        self.threshold_var = tk.StringVar(value=str(self.time_threshold))
         threshold_entry = ttk.Entry(config_frame, textvariable=self.threshold_var)
         threshold_entry.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
 
@@ -247,7 +335,6 @@ class DashCamVideoJoinerApp:
         format_label.grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
 
         # Entry widget for the timestamp format
-        self.format_var = tk.StringVar(value=self.timestamp_format)
         format_entry = ttk.Entry(config_frame, textvariable=self.format_var, width=30)
         format_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W, columnspan=2)
 
@@ -267,20 +354,18 @@ class DashCamVideoJoinerApp:
         help_button = ttk.Button(config_frame, text="?", command=show_format_help, width=2)
         help_button.grid(row=2, column=3, padx=5, pady=5)
 
-        # Supported video extensions
-        video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.ts']
+        # Supported video extensions (a comma separated list may be typed to watch several)
+        video_extensions = ['.mp4', '.mov', '.avi', '.mkv', '.ts', '.ts, .mp4']
 
         # Label for the video extension selection
         extension_label = ttk.Label(config_frame, text="Video File Extension:")
         extension_label.grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
 
         # Combobox for selecting the video extension
-        self.extension_var = tk.StringVar(value=self.video_extension)
         extension_combobox = ttk.Combobox(
             config_frame,
             textvariable=self.extension_var,
             values=video_extensions,
-            state='readonly',
             width=10
         )
         extension_combobox.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
@@ -290,6 +375,7 @@ class DashCamVideoJoinerApp:
             message = (
                 "Select the file extension used by your dashcam videos.\n"
                 "The application will monitor and process files with this extension.\n"
+                "Several extensions may be given as a comma separated list, e.g. '.ts, .mp4'.\n"
             )
             messagebox.showinfo("Video File Extension Help", message)
 
@@ -298,48 +384,64 @@ class DashCamVideoJoinerApp:
         )
         extension_help_button.grid(row=3, column=2, padx=5, pady=5)
 
+        # Container of the joined files; empty keeps the extension of the segments
+        output_label = ttk.Label(config_frame, text="Output Container:")
+        output_label.grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
+        output_combobox = ttk.Combobox(
+            config_frame,
+            textvariable=self.output_extension_var,
+            values=[''] + list(CONTAINER_FORMATS),
+            state='readonly',
+            width=10
+        )
+        output_combobox.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+
         # Adjust the position of the Save button
         def save_config():
             """Save the configuration settings and close the window."""
             # Save the time threshold
             try:
-                self.time_threshold = int(self.threshold_var.get())
-                if self.time_threshold <= 0:
+                time_threshold = int(self.threshold_var.get())
+                if time_threshold <= 0:
                     raise ValueError("Time threshold must be a positive integer.")
             except ValueError as e:
                 messagebox.showerror("Invalid Threshold", f"Invalid time threshold: {e}")
                 return
 
             # Save the timestamp format
-            self.timestamp_format = self.format_var.get()
-            if not self.validate_timestamp_format(self.timestamp_format):
+            timestamp_format = self.format_var.get()
+            if not self.validate_timestamp_format(timestamp_format):
                 messagebox.showerror("Invalid Format", "The timestamp format is invalid.")
                 return
 
-            # Save the video file extension
-            self.video_extension = self.extension_var.get()
+            # Apply the threshold, format and extension; while monitoring they take effect live
+            self.send('apply_settings', time_threshold, timestamp_format, self.extension_var.get(),
+                      self.output_extension_var.get())
 
             # Save the selected directory
             if self.dir_var.get() != "No directory selected":
-                self.selected_directory = self.dir_var.get()
+                self.send('set_directory', self.dir_var.get())
 
-            # Save the configurations to file
-            self.save_config()
+            # Save the configurations to file, after the settings above are applied
+            self.send('save_config')
 
             config_window.destroy()
 
         save_button = ttk.Button(
             config_frame, text="Save", command=save_config
         )
-        save_button.grid(row=4, column=1, padx=5, pady=10)
+        save_button.grid(row=5, column=1, padx=5, pady=10)
 
-        # Update the directory display variable
-        self.dir_var.set(self.selected_directory or "No directory selected")
-
-        # Update other configuration variables
-        self.threshold_var.set(str(self.time_threshold))
-        self.format_var.set(self.timestamp_format)
-        self.extension_var.set(self.video_extension)
+    def load_settings(self):
+        """Copy the settings of the latest state snapshot into the configuration variables."""
+        if not self.state:
+            return
+        settings = self.state['settings']
+        self.dir_var.set(settings['selected_directory'] or "No directory selected")
+        self.threshold_var.set(str(settings['time_threshold']))
+        self.format_var.set(settings['timestamp_format'])
+        self.extension_var.set(settings['video_extension'])
+        self.output_extension_var.set(settings['output_extension'])
 
     def validate_timestamp_format(self, format_str):
         """
@@ -356,67 +458,520 @@ class DashCamVideoJoinerApp:
             datetime.datetime.now().strftime(format_str)
             return True
         except Exception as e:
-            print(f"Invalid timestamp format: {e}")
+            logging.warning(f"Invalid timestamp format: {e}")
             return False
 
     def select_directory(self):
-        """Open a dialog to select a directory and store the selected path."""
+        """Open a dialog to select a directory; it is sent to the service when the configuration is saved."""
         try:
             # Open a directory selection dialog and get the selected path
-            self.selected_directory = filedialog.askdirectory()
-            if self.selected_directory:
-                print(f"Selected directory: {self.selected_directory}")
+            directory = filedialog.askdirectory()
+            if directory:
+                logging.info(f"Selected directory: {directory}")
                 # Update the directory display variable
-                self.dir_var.set(self.selected_directory)
+                self.dir_var.set(directory)
+        except Exception as e:
+            logging.error(f"Error selecting directory: {e}")
+
+    def send(self, command, *args):
+        """
+        Ask the command thread to call a JoinerService method.
+
+        Args:
+            command (str): Name of the method.
+            *args: Its arguments.
+        """
+        self.commands.put((command, args))
+
+    def _command_loop(self, config_file, profile):
+        """
+        Build the service, then run the commands sent by the window and publish state snapshots.
+        Runs on its own thread.
+        """
+        try:
+            self.service = JoinerService(config_file, root=self.root, profile=profile)
+        except Exception as e:
+            logging.error(f"Could not start the service: {e}", exc_info=True)
+            self.updates.put(('error', f"Could not start: {e}"))
+            self.updates.put(('exited', None))
+            return
+        self.updates.put(('state', self.service.status()))
+        while True:
+            try:
+                command = self.commands.get(timeout=STATE_INTERVAL_SECONDS)
+            except queue.Empty:
+                command = ()
+            if command and command[0] == 'exit':
+                self._shut_down(*command[1])
+                return
+            if command:
+                name, args = command
+                try:
+                    result = getattr(self.service, name)(*args)
+                    if name in ('plan', 'search'):
+                        self.updates.put((name, result))
+                except Exception as e:
+                    logging.error(f"Command {name} failed: {e}", exc_info=True)
+                    self.updates.put(('error', f"An error occurred: {e}"))
+            self.updates.put(('state', self.service.status()))
+
+    def _shut_down(self, save_config):
+        """Save the configuration and shut the service down, then tell the window. Runs on the command thread."""
+        try:
+            # Save configuration before exiting (shutdown also stops monitoring)
+            if save_config:
+                self.service.save_config()
+            # Let running join jobs finish before the window goes away
+            self.service.shutdown()
         except Exception as e:
-            print(f"Error selecting directory: {e}")
+            logging.error(f"Shutdown failed: {e}", exc_info=True)
+        self.updates.put(('exited', None))
+
+    def poll_updates(self):
+        """Apply the newest state snapshot and show any errors from the command thread."""
+        state = None
+        while True:
+            try:
+                kind, payload = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'error':
+                messagebox.showerror("Error", payload)
+            elif kind == 'plan':
+                self.show_plan(payload)
+            elif kind == 'search':
+                self.show_search_results(payload)
+            elif kind == 'exited':
+                # The service is down; closing the window ends mainloop
+                self.root.destroy()
+                return
+            else:
+                # Only the latest snapshot matters
+                state = payload
+        if state:
+            first = self.state is None
+            self.state = state
+            if first:
+                # The service has loaded its configuration
+                self.load_settings()
+            self.show_state(state)
+        self.root.after(GUI_POLL_INTERVAL_MS, self.poll_updates)
+
+    def show_state(self, state):
+        """
+        Update the widgets from a state snapshot.
+
+        Args:
+            state (dict): A snapshot from JoinerService.status().
+        """
+        if state['monitoring']:
+            self.has_monitored = True
+            self.status_label.config(text=f"Status: Monitoring {len(state['watch_roots'])} folder(s)")
+            self.start_stop_button.config(image=self.pause_photo)
+            self.start_stop_label.config(text="Pause Monitoring")  # Update label text
+        else:
+            self.status_label.config(text="Status: Stopped" if self.has_monitored else "Status: Idle")
+            self.start_stop_button.config(image=self.play_photo)
+            self.start_stop_label.config(text="Start Monitoring")  # Update label text
+
+        # Compact stats panel
+        stats = state['metrics']
+        joins = stats.get('join_duration_seconds_count', 0)
+        average = stats.get('join_duration_seconds_sum', 0) / joins if joins else 0
+        self.stats_label.config(text=(
+            f"Segments: {stats.get('segments_seen_total', 0):.0f}   "
+            f"Parse errors: {stats.get('parse_failures_total', 0):.0f}   "
+            f"Trips: {stats.get('groups_formed_total', 0):.0f}   "
+            f"Queue: {state['queue_depth']}{' (paused)' if state['paused'] else ''}   "
+            f"Avg join: {average:.1f}s   "
+            f"Out: {stats.get('bytes_out_total', 0) / 1048576:.0f} MB"
+        ))
+
+    def show_plan(self, plan):
+        """
+        Open a window listing the trips a backfill would produce.
+
+        Args:
+            plan (dict): The result of JoinerService.plan().
+        """
+        plan_window = tk.Toplevel(self.root)
+        plan_window.title("Backfill Plan")
+        plan_window.geometry("900x400")
+
+        columns = ('start', 'end', 'clips', 'channel', 'mode', 'source', 'output_size', 'time', 'output')
+        headings = ('Start', 'End', 'Clips', 'Channel', 'Mode', 'Source MB', 'Est. MB', 'Est. time', 'Output')
+        frame = ttk.Frame(plan_window, padding=10)
+        frame.pack(expand=True, fill='both')
+        table = ttk.Treeview(frame, columns=columns, show='headings')
+        for column, heading in zip(columns, headings):
+            table.heading(column, text=heading)
+            table.column(column, width=80, stretch=column == 'output')
+        scrollbar = ttk.Scrollbar(frame, command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        table.pack(side='left', expand=True, fill='both')
+        for trip in plan['trips']:
+            table.insert('', tk.END, values=(
+                trip['start'], trip['end'], len(trip['segments']),
+                f"{trip['root']}/{trip['channel']}".rstrip('/'), trip['join_mode'],
+                f"{trip['source_bytes'] / 1048576:.0f}", f"{trip['output_bytes'] / 1048576:.0f}",
+                datetime.timedelta(seconds=round(trip['seconds'])), trip['output']))
+
+        # Totals below the table
+        summary = JoinPlanner.format_table(plan).splitlines()[-2:]
+        ttk.Label(plan_window, text='\n'.join(summary), padding=(10, 0, 10, 10)).pack(anchor='w')
+
+    def open_search_window(self):
+        """Open a window for finding footage between two times in the trip catalog."""
+        search_window = tk.Toplevel(self.root)
+        search_window.title("Search Footage")
+        search_window.geometry("900x400")
+
+        # From, to and camera fields on one row
+        form = ttk.Frame(search_window, padding=10)
+        form.pack(fill='x')
+        today = datetime.date.today().isoformat()
+        from_var = tk.StringVar(value=f"{today} 00:00")
+        to_var = tk.StringVar(value=f"{today} 23:59")
+        camera_var = tk.StringVar()
+        for column, (label, variable, width) in enumerate((("From:", from_var, 18), ("To:", to_var, 18),
+                                                           ("Camera:", camera_var, 12))):
+            ttk.Label(form, text=label).grid(row=0, column=column * 2, padx=5, sticky=tk.W)
+            ttk.Entry(form, textvariable=variable, width=width).grid(row=0, column=column * 2 + 1, padx=5)
+
+        columns = ('start', 'end', 'duration', 'camera', 'kind', 'size', 'path')
+        headings = ('Start', 'End', 'Duration', 'Camera', 'Kind', 'MB', 'Path')
+        frame = ttk.Frame(search_window, padding=10)
+        frame.pack(expand=True, fill='both')
+        self.search_table = ttk.Treeview(frame, columns=columns, show='headings')
+        for column, heading in zip(columns, headings):
+            self.search_table.heading(column, text=heading)
+            self.search_table.column(column, width=80, stretch=column == 'path')
+        scrollbar = ttk.Scrollbar(frame, command=self.search_table.yview)
+        self.search_table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self.search_table.pack(side='left', expand=True, fill='both')
+        self.search_summary = ttk.Label(search_window, text="", padding=(10, 0, 10, 10))
+        self.search_summary.pack(anchor='w')
+
+        def search():
+            """Validate the range and run the query on the command thread."""
+            try:
+                start = datetime.datetime.fromisoformat(from_var.get().strip())
+                end = datetime.datetime.fromisoformat(to_var.get().strip())
+            except ValueError:
+                messagebox.showerror("Invalid Time", "Enter times as YYYY-MM-DD HH:MM.", parent=search_window)
+                return
+            self.send('search', start, end, camera_var.get().strip() or None)
+
+        ttk.Button(form, text="Search", command=search).grid(row=0, column=6, padx=5)
+
+    def show_search_results(self, entries):
+        """
+        List the footage found by a search in the search window.
+
+        Args:
+            entries (list): The result of JoinerService.search().
+        """
+        if not getattr(self, 'search_table', None) or not self.search_table.winfo_exists():
+            return
+        self.search_table.delete(*self.search_table.get_children())
+        for entry in entries:
+            self.search_table.insert('', tk.END, values=(
+                entry['start'].isoformat(sep=' ', timespec='seconds'),
+                entry['end'].isoformat(sep=' ', timespec='seconds'),
+                datetime.timedelta(seconds=round(entry['duration'])) if entry['duration'] else '',
+                entry['channel'], entry['kind'], f"{entry['size_bytes'] / 1048576:.0f}", entry['path']))
+        self.search_summary.config(text=f"{len(entries)} file(s), "
+                                        f"{sum(entry['size_bytes'] for entry in entries) / 1048576:.0f} MB")
 
     def toggle_monitoring(self):
         """Toggle monitoring on or off."""
-        if not self.is_monitoring:
-            # Start monitoring
-            started = self.start_monitoring()
-            if started:
-                self.start_stop_button.config(image=self.pause_photo)
-                self.start_stop_label.config(text="Pause Monitoring")  # Update label text
+        if self.state is None:
+            # The service is still starting
+            return
+        if not self.state['monitoring']:
+            # Start monitoring; the button changes once the service reports it is running
+            self.start_monitoring()
         else:
             # Stop monitoring
             self.stop_monitoring()
-            self.start_stop_button.config(image=self.play_photo)
-            self.start_stop_label.config(text="Start Monitoring")  # Update label text
 
     def start_monitoring(self):
-        """Start monitoring the selected directory."""
-        if self.selected_directory:
-            if not self.is_monitoring:
+        """Start monitoring the selected directory and any additional watch roots."""
+        settings = self.state['settings']
+        if settings['selected_directory'] or settings['watch_roots']:
+            if not self.state['monitoring']:
                 # Validate the time threshold value
                 try:
-                    self.time_threshold = int(self.threshold_var.get())
-                    if self.time_threshold <= 0:
+                    time_threshold = int(self.threshold_var.get())
+                    if time_threshold <= 0:
                         raise ValueError("Time threshold must be a positive integer.")
                 except ValueError as e:
                     messagebox.showerror("Invalid Threshold", f"Invalid time threshold: {e}")
                     return False
+                if time_threshold != settings['time_threshold']:
+                    self.send('apply_settings', time_threshold, settings['timestamp_format'],
+                              settings['video_extension'])
+
+                # Scheduling the observers and scanning the existing files happen on the command thread
+                self.status_label.config(text="Status: Starting...")
+                self.send('start_monitoring')
+                return True
+            else:
+                logging.info("Monitoring is already active.")
+                return False
+        else:
+            logging.warning("Please select a directory first.")
+            messagebox.showwarning("No Directory Selected", "Please select a directory before starting monitoring.")
+            return False
+
+    def stop_monitoring(self):
+        """Stop monitoring the directory."""
+        if self.state and self.state['monitoring']:
+            # Joining the observer threads can take a moment; the status updates when it is done
+            self.status_label.config(text="Status: Stopping...")
+            self.send('stop_monitoring')
+        else:
+            logging.info("Monitoring is not active.")
+
+    def open_log_window(self):
+        """Open a window to display logged output."""
+        # Create a new Toplevel window for the log
+        log_window = tk.Toplevel(self.root)
+        log_window.title("Log Output")
+        log_window.geometry("700x450")
+
+        # Filter controls: minimum level, search text and auto-scroll
+        controls = ttk.Frame(log_window, padding=(10, 10, 10, 0))
+        controls.pack(fill='x')
+        ttk.Label(controls, text="Level:").pack(side='left')
+        level_var = tk.StringVar(value='INFO')
+        level_combobox = ttk.Combobox(controls, textvariable=level_var, state='readonly', width=9,
+                                      values=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+        level_combobox.pack(side='left', padx=(5, 15))
+        ttk.Label(controls, text="Search:").pack(side='left')
+        search_var = tk.StringVar()
+        ttk.Entry(controls, textvariable=search_var, width=30).pack(side='left', padx=5)
+        autoscroll_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(controls, text="Auto-scroll", variable=autoscroll_var).pack(side='right')
+
+        # Create a Text widget to display the logs; it only ever holds the newest matching lines
+        text_frame = ttk.Frame(log_window, padding=10)
+        text_frame.pack(expand=True, fill='both')
+        log_text = tk.Text(text_frame, wrap='word', height=15, width=60)
+        scrollbar = ttk.Scrollbar(text_frame, command=log_text.yview)
+        log_text.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        log_text.pack(side='left', expand=True, fill='both')
+        log_text.tag_configure('WARNING', foreground='darkorange')
+        log_text.tag_configure('ERROR', foreground='red')
+
+        # State shared by the polling and filtering callbacks
+        view = {'sequence': 0, 'open': True, 'matches': None, 'pending': None}
+
+        def make_filter():
+            """
+            Read the filter controls once and return a predicate over plain values.
+
+            Tk variables may only be read on the Tk thread and each read is a round trip
+            through the interpreter, so they must not be consulted per record.
+            """
+            min_level = logging.getLevelName(level_var.get())
+            needle = search_var.get().lower()
+
+            def matches(levelno, text):
+                """Return True if a record passes the level and search filters."""
+                return levelno >= min_level and (not needle or needle in text.lower())
+            return matches
+
+        def show(records):
+            """Append records to the widget in a single insert and trim the oldest lines."""
+            chunks = []
+            for _, levelno, text in records:
+                chunks += [text + '\n', logging.getLevelName(min(levelno, logging.ERROR))]
+            if not chunks:
+                return
+            log_text.insert(tk.END, *chunks)
+            line_count = int(log_text.index('end-1c').split('.')[0])
+            if line_count > LOG_VIEW_LINES:
+                log_text.delete('1.0', f"{line_count - LOG_VIEW_LINES + 1}.0")
+            if autoscroll_var.get():
+                log_text.see(tk.END)
+
+        def refilter(*_):
+            """Rebuild the view from the ring buffer after a filter change."""
+            view['pending'] = None
+            view['matches'] = make_filter()
+            log_text.delete('1.0', tk.END)
+            view['sequence'], records = self.log_buffer.tail(view['matches'], LOG_VIEW_LINES)
+            show(records)
+
+        def schedule_refilter(*_):
+            """Re-filter once typing in the search box pauses, not on every keystroke."""
+            if view['pending'] is not None:
+                log_window.after_cancel(view['pending'])
+            view['pending'] = log_window.after(LOG_SEARCH_DEBOUNCE_MS, refilter)
+
+        def poll():
+            """Show the records logged since the last tick."""
+            if not view['open']:
+                return
+            records = self.log_buffer.since(view['sequence'])
+            if records:
+                view['sequence'] = records[-1][0]
+                matches = view['matches']
+                show([record for record in records if matches(record[1], record[2])])
+            log_window.after(LOG_POLL_INTERVAL_MS, poll)
+
+        level_combobox.bind('<<ComboboxSelected>>', refilter)
+        search_var.trace_add('write', schedule_refilter)
+        refilter()
+        poll()
+
+        # Define what happens when the log window is closed
+        def on_log_window_close():
+            # Stop polling and destroy the log window
+            view['open'] = False
+            if view['pending'] is not None:
+                log_window.after_cancel(view['pending'])
+            log_window.destroy()
+
+        # Bind the close event to the on_log_window_close function
+        log_window.protocol("WM_DELETE_WINDOW", on_log_window_close)
+
+class JoinerService:
+    """
+    The non-GUI core of the application: configuration, the job scheduler, the
+    catalog and directory monitoring.
+
+    The Tk window drives it from button callbacks; in headless mode it runs on its own.
+    """
+
+    def __init__(self, config_file, root=None, profile=False):
+        # Path to the configuration file
+        self.config_file = config_file
+        # Tk root window used for error popups (None when headless)
+        self.root = root
 
+        # Variable to store the selected directory path
+        self.selected_directory = None
+
+        # Variable to store the time threshold value
+        self.time_threshold = 90  # Default time threshold in seconds
+
+        # Flag to indicate if monitoring is active
+        self.is_monitoring = False
+        # Set once monitoring has fed the files already on disk to the handlers
+        self.initial_scan_done = False
+
+        # Initialize the observer objects for directory monitoring
+        self.observer = None
+        self.polling_observer = None
+
+        # Event routers, one per watch root, while monitoring is active
+        self.routers = []
+        # Composite renderers by watch root name
+        self.composite_renderers = {}
+
+        # Variable to store the timestamp format
+        self.timestamp_format = '%Y-%m-%d %Hh %Mm %Ss'  # Updated default format to '2024-11-11 15h 49m 23s'
+
+        # Variable to store the selected video file extension(s)
+        self.video_extension = '.mp4'  # Default extension
+        # Container of the joined files ('' keeps the source extension)
+        self.output_extension = ''
+        # Streamable MP4/MOV outputs, and keyframe index sidecars for seeking
+        self.faststart = False
+        self.keyframe_index = False
+
+        # Load configurations
+        self.load_config()
+
+        # The --profile command line flag turns profiling on for this run only; it is
+        # kept apart from the policy so save_config never writes it to config.ini
+        self.profile_override = profile
+
+        # Shared scheduler that runs join jobs under the configured resource policy
+        self.scheduler = JoinScheduler(self.resource_policy, self.storage_policy,
+                                       profiler=JobProfiler(self.profiling_policy, override=self.profile_override))
+        self.scheduler.start()
+
+        # Catalog of trips and segments, kept next to the configuration file
+        self.catalog = TripCatalog(os.path.join(os.path.dirname(self.config_file), 'catalog.db'))
+
+        # Retention rules run as low-priority jobs on the shared scheduler
+        self.retention = RetentionEngine(self.retention_policy, self.catalog, self.scheduler,
+                                         pending=self.pending_paths)
+        self.retention.start()
+
+        # Keyframe summaries share the worker pool with joins
+        self.summarizer = TripSummarizer(self.summary_policy, self.scheduler, self.catalog)
+
+        # Pipeline metrics, published on localhost and/or a stats file
+        self.metrics = PipelineMetrics()
+        self.metrics.gauge('queue_depth', self.scheduler.queue_depth)
+        self.metrics.gauge('running_jobs', lambda: len(self.scheduler.running))
+        self.metrics_publisher = MetricsPublisher(self.metrics_policy, self.metrics)
+        self.metrics_publisher.start()
+
+        # Content hash index rejecting duplicate segments
+        self.dedup = Deduplicator(self.dedup_policy, self.catalog) if self.dedup_policy.enabled else None
+
+        # Event loop owning the grouping state of every handler
+        self.engine = EngineLoop()
+        self.engine.start()
+
+        # Leases shared with the other joiner instances working on the same archive
+        self.cluster = None
+        if self.cluster_policy.enabled:
+            self.cluster = LeaseQueue(self.cluster_policy, self.scheduler, on_requeue=self.process_existing_files)
+            self.cluster.start()
+
+        # Local HTTP API for scripts and dashboards
+        self.control = ControlServer(self.control_policy, self)
+        self.control.start()
+
+    def start_monitoring(self):
+        """
+        Start watching every watch root and feed the files already there through the handlers.
+
+        Returns:
+            bool: True if monitoring started, False if there is nothing to watch or it is already active.
+        """
+        if self.selected_directory or self.watch_roots:
+            if not self.is_monitoring:
                 self.is_monitoring = True
-                self.status_label.config(text="Status: Monitoring")
+                roots = self.active_watch_roots()
                 logging.info("Monitoring started...")
 
-                # Initialize the event handler with the current configurations and root window
-                self.event_handler = VideoFileHandler(
-                    time_threshold=self.time_threshold,
-                    timestamp_format=self.timestamp_format,
-                    video_extension=self.video_extension,
-                    root=self.root  # Pass the root window here
-                )
-
-                # Create the observer and schedule it
+                # One native observer watches every root (plus one polling observer for network
+                # shares); each root routes events to per-channel handlers
                 self.observer = Observer()
-                self.observer.schedule(self.event_handler, self.selected_directory, recursive=False)
+                self.polling_observer = ScandirPollingObserver(self.poll_min_seconds, self.poll_max_seconds)
+                self.routers = []
+                # Recursive roots hold one subfolder per camera, so they can get a composite
+                self.composite_renderers = {
+                    watch_root.name: CompositeRenderer(self.composite_policy, watch_root, self.catalog, self.engine,
+                                                        self.scheduler)
+                    for watch_root in roots if watch_root.recursive and self.composite_policy.enabled
+                }
+                for watch_root in roots:
+                    if self.output_policy.for_root(watch_root) is not self.output_policy:
+                        logging.warning(f"Watch root '{watch_root.name}' is recursive and has no output_directory; "
+                                        f"writing its trips without dated directories so they are not "
+                                        f"mistaken for camera channels.")
+                    router = ChannelRouter(watch_root, self.create_event_handler)
+                    observer = self.polling_observer if watch_root.observer == 'polling' else self.observer
+                    observer.schedule(router, watch_root.directory, recursive=watch_root.recursive)
+                    self.routers.append(router)
                 self.observer.start()
+                self.polling_observer.start()
 
-                # Process existing video files in the directory:
+                # Process existing video files in the directories:
                 self.process_existing_files()
+                # The handlers now know every segment on disk (their events are queued on the loop)
+                self.initial_scan_done = True
 
                 return True
             else:
@@ -424,77 +979,87 @@ class DashCamVideoJoinerApp:
                 return False
         else:
             logging.warning("Please select a directory first.")
-            messagebox.showwarning("No Directory Selected", "Please select a directory before starting monitoring.")
             return False
 
+    def active_watch_roots(self):
+        """
+        Return every watch root to monitor.
+
+        The directory chosen in the Configuration window is the 'default' root and
+        uses the main settings; [Watch:<name>] sections in config.ini add more.
+        """
+        roots = []
+        if self.selected_directory:
+            roots.append(WatchRoot('default', self.selected_directory, self.time_threshold,
+                                   self.timestamp_format, self.video_extension, observer=self.observer_type,
+                                   output_extension=self.output_extension))
+        roots.extend(self.watch_roots)
+        return roots
+
+    def create_event_handler(self, watch_root, channel):
+        """
+        Create the VideoFileHandler for one camera channel of a watch root.
+
+        Args:
+            watch_root (WatchRoot): The root the channel belongs to.
+            channel (str): Subfolder of the channel relative to the root ('' for the root itself).
+
+        Returns:
+            VideoFileHandler: The handler, sharing the scheduler, catalog and metrics.
+        """
+        output_directory = None
+        if watch_root.output_directory:
+            output_directory = os.path.join(watch_root.output_directory, channel)
+            os.makedirs(output_directory, exist_ok=True)
+        # Initialize the event handler with the root's profile and the root window
+        return VideoFileHandler(
+            time_threshold=watch_root.time_threshold,
+            timestamp_format=watch_root.timestamp_format,
+            video_extension=watch_root.video_extension,
+            root=self.root,  # Pass the root window here (None when headless)
+            output_extension=watch_root.output_extension,
+            faststart=self.faststart,
+            keyframe_index=self.keyframe_index,
+            output_policy=self.output_policy.for_root(watch_root),
+            scheduler=self.scheduler,  # Joins run on the shared job scheduler
+            catalog=self.catalog,  # Segments and trips are recorded in the catalog
+            join_mode=self.join_mode,
+            renditions=self.renditions,
+            summarizer=self.summarizer,
+            metrics=self.metrics,
+            output_directory=output_directory,
+            channel=channel,
+            composite=self.composite_renderers.get(watch_root.name),
+            cluster=self.cluster,
+            lease_scope=f"{watch_root.name}/{channel}",
+            engine=self.engine,
+            dedup=self.dedup
+        )
+
     def process_existing_files(self):
-        """Process existing video files in the selected directory when monitoring starts."""
-        # Iterate over all files in the selected directory
-        for filename in os.listdir(self.selected_directory):
-            if filename.lower().endswith(self.video_extension):
-                file_path = os.path.join(self.selected_directory, filename)
-                logging.info(f"Found existing video file: {file_path}")
-                # Create a mock event object to simulate a file creation event
-                event = type('Event', (object,), {})()
-                event.src_path = file_path
-                event.is_directory = False
-                # Manually trigger the on_created event handler for each file
-                self.event_handler.on_created(event)
+        """Process existing video files in every watch root when monitoring starts."""
+        for router in self.routers:
+            router.process_existing_files()
 
     def stop_monitoring(self):
         """Stop monitoring the directory."""
         if self.is_monitoring:
             # Set the monitoring flag to False to indicate that monitoring has stopped
             self.is_monitoring = False
-            # Update the status label to indicate monitoring has stopped
-            self.status_label.config(text="Status: Stopped")
-            print("Monitoring stopped.")
+            self.initial_scan_done = False
+            logging.info("Monitoring stopped.")
 
-            # Stop the observer if it is running
+            # Stop the observers if they are running
             if self.observer:
                 self.observer.stop()   # Stop the observer thread
                 self.observer.join()   # Wait for the observer thread to finish
                 self.observer = None   # Reset the observer to None
+            if self.polling_observer:
+                self.polling_observer.stop()
+                self.polling_observer.join()
+                self.polling_observer = None
         else:
-            print("Monitoring is not active.")
-
-    def open_log_window(self):
-        """Open a window to display logged output."""
-        # Create a new Toplevel window for the log
-        log_window = tk.Toplevel(self.root)
-        log_window.title("Log Output")
-        log_window.geometry("600x400")
-
-        # Create a Text widget to display the logs
-        log_text = tk.Text(log_window, wrap='word', height=15, width=60)
-        log_text.pack(expand=True, fill='both', padx=10, pady=10)
-
-        # Create a logging handler to display logs in the Text widget
-        text_handler = TextHandler(self.log_queue)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        text_handler.setFormatter(formatter)
-        logging.getLogger().addHandler(text_handler)
-
-        # Start polling the log queue
-        self.poll_log_queue(log_text)
-
-        # Store a reference to the handler so we can remove it later
-        self.current_text_handler = text_handler
-
-        # Define what happens when the log window is closed
-        def on_log_window_close():
-            # Remove the logging handler
-            logging.getLogger().removeHandler(text_handler)
-            # Destroy the log window
-            log_window.destroy()
-            # Clear the reference to the handler
-            self.current_text_handler = None
-
-        # Bind the close event to the on_log_window_close function
-        log_window.protocol("WM_DELETE_WINDOW", on_log_window_close)
-
-        # Set the logging level if needed
-        logging.getLogger().setLevel(logging.INFO)
+            logging.info("Monitoring is not active.")
 
     def load_config(self):
         """
@@ -511,6 +1076,49 @@ class DashCamVideoJoinerApp:
                 self.time_threshold = config.getint('Settings', 'time_threshold', fallback=90)
                 self.timestamp_format = config.get('Settings', 'timestamp_format', fallback='%Y-%m-%d %Hh %Mm %Ss')
                 self.video_extension = config.get('Settings', 'video_extension', fallback='.mp4')
+                # Container of the joined files, and whether MP4/MOV outputs get their index up front
+                self.output_extension = config.get('Settings', 'output_extension', fallback='')
+                self.faststart = config.getboolean('Settings', 'faststart', fallback=False)
+                self.keyframe_index = config.getboolean('Settings', 'keyframe_index', fallback=False)
+                self.join_mode = config.get('Settings', 'join_mode', fallback='compose')
+                if self.join_mode not in JOIN_MODES:
+                    logging.warning(f"Unknown join mode '{self.join_mode}', using 'compose'.")
+                    self.join_mode = 'compose'
+                # 'native' notifications or 'polling' for network shares, and the polling interval bounds
+                self.observer_type = config.get('Settings', 'observer', fallback='native')
+                self.poll_min_seconds = config.getfloat('Settings', 'poll_min_seconds', fallback=2.0)
+                self.poll_max_seconds = config.getfloat('Settings', 'poll_max_seconds', fallback=60.0)
+                # Load the extra outputs produced per trip
+                self.renditions = load_renditions(config)
+                if self.renditions and self.join_mode == 'compose':
+                    logging.warning("Renditions are only produced when trips are transcoded; "
+                                    "'compose' join mode ignores them.")
+                elif self.renditions and self.join_mode == 'copy':
+                    logging.info("Renditions are produced only for trips whose streams cannot be copied "
+                                 "in 'copy' join mode.")
+                # Load the resource limits applied to join jobs
+                self.resource_policy = ResourcePolicy.from_config(config)
+                # Load the disk space and output staging rules
+                self.storage_policy = StoragePolicy.from_config(config)
+                # Load the retention and compaction rules
+                self.retention_policy = RetentionPolicy.from_config(config)
+                # Load the trip summary settings
+                self.summary_policy = SummaryPolicy.from_config(config)
+                # Load where metrics are published
+                self.metrics_policy = MetricsPolicy.from_config(config)
+                # Load which jobs are profiled
+                self.profiling_policy = ProfilingPolicy.from_config(config)
+                # Load the front/rear composite settings
+                self.composite_policy = CompositePolicy.from_config(config)
+                # Load the settings for sharing the archive with other nodes
+                self.cluster_policy = ClusterPolicy.from_config(config)
+                # Load the control API settings
+                self.control_policy = ControlPolicy.from_config(config)
+                # Load the duplicate detection settings
+                self.dedup_policy = DedupPolicy.from_config(config)
+                self.output_policy = OutputPolicy.from_config(config)
+                # Load the additional watch roots
+                _, self.watch_roots = WatchRoot.from_config(config)
             else:
                 # Set default values if 'Settings' section is missing
                 self.set_default_config()
@@ -528,12 +1136,33 @@ class DashCamVideoJoinerApp:
             'selected_directory': self.selected_directory if self.selected_directory else '',
             'time_threshold': str(self.time_threshold),
             'timestamp_format': self.timestamp_format,
-            'video_extension': self.video_extension
+            'video_extension': self.video_extension,
+            'output_extension': self.output_extension,
+            'faststart': str(self.faststart).lower(),
+            'keyframe_index': str(self.keyframe_index).lower(),
+            'join_mode': self.join_mode,
+            'observer': self.observer_type,
+            'poll_min_seconds': str(self.poll_min_seconds),
+            'poll_max_seconds': str(self.poll_max_seconds)
         }
+        config['Renditions'] = {rendition.name: rendition.to_spec() for rendition in self.renditions}
+        config['Resources'] = self.resource_policy.to_config()
+        config['Storage'] = self.storage_policy.to_config()
+        config['Retention'] = self.retention_policy.to_config()
+        config['Summary'] = self.summary_policy.to_config()
+        config['Metrics'] = self.metrics_policy.to_config()
+        config['Profiling'] = self.profiling_policy.to_config()
+        config['Composite'] = self.composite_policy.to_config()
+        config['Cluster'] = self.cluster_policy.to_config()
+        config['Control'] = self.control_policy.to_config()
+        config['Dedup'] = self.dedup_policy.to_config()
+        config['Output'] = self.output_policy.to_config()
+        for watch_root in self.watch_roots:
+            config[WatchRoot.SECTION_PREFIX + watch_root.name] = watch_root.to_config()
 
         with open(self.config_file, 'w') as configfile:
             config.write(configfile)
-        print("Configuration saved to config.ini")
+        logging.info("Configuration saved to config.ini")
 
     def set_default_config(self):
         """
@@ -543,93 +1172,495 @@ class DashCamVideoJoinerApp:
         self.time_threshold = 90
         self.timestamp_format = '%Y-%m-%d %Hh %Mm %Ss'  # Updated default format
         self.video_extension = '.mp4'
+        self.output_extension = ''
+        self.faststart = False
+        self.keyframe_index = False
+        self.join_mode = 'compose'
+        self.observer_type = 'native'
+        self.poll_min_seconds = 2.0
+        self.poll_max_seconds = 60.0
+        self.renditions = []
+        self.resource_policy = ResourcePolicy()
+        self.storage_policy = StoragePolicy()
+        self.retention_policy = RetentionPolicy()
+        self.summary_policy = SummaryPolicy()
+        self.metrics_policy = MetricsPolicy()
+        self.profiling_policy = ProfilingPolicy()
+        self.composite_policy = CompositePolicy()
+        self.cluster_policy = ClusterPolicy()
+        self.control_policy = ControlPolicy()
+        self.dedup_policy = DedupPolicy()
+        self.output_policy = OutputPolicy()
+        self.watch_roots = []
+
+    def apply_settings(self, time_threshold, timestamp_format, video_extension, output_extension=None):
+        """
+        Change the main grouping settings. While monitoring, the default watch root
+        picks them up without restarting the observer.
 
-    def poll_log_queue(self, log_text_widget):
-        """Periodically poll the log queue and display log records in the Text widget."""
-        try:
-            while True:
-                record = self.log_queue.get_nowait()
-                log_text_widget.insert(tk.END, record + '\n')
-                log_text_widget.see(tk.END)
-        except queue.Empty:
-            pass
-        if self.current_text_handler:
-            # Schedule the poll_log_queue method to be called again after 100 milliseconds
-            log_text_widget.after(100, self.poll_log_queue, log_text_widget)
-
-class VideoFileHandler(FileSystemEventHandler):
-    """Handles events related to video files in the monitored directory."""
-
-    def __init__(self, time_threshold, timestamp_format, video_extension, root):
-        super().__init__()
-        # Store the time threshold value (in seconds) for use in processing
+        Args:
+            time_threshold (int): Maximum gap in seconds between segments of a trip.
+            timestamp_format (str): strftime format of the segment file names.
+            video_extension (str): Extension(s) of the segment files, comma separated.
+            output_extension (str): Container of the joined files (None leaves it unchanged).
+        """
         self.time_threshold = time_threshold
-        # Store the timestamp format for parsing
         self.timestamp_format = timestamp_format
-        # Store the video file extension
-        self.video_extension = video_extension.lower()
-        # Initialize a list to keep track of video files and their timestamps
-        self.video_files = []
-        # Keep track of processed time ranges
-        self.processed_time_ranges = []  # List to store tuples of (start_time, end_time)
-        # Reference to the main Tkinter window for GUI operations
-        self.root = root
-
-    def on_created(self, event):
-        """Called when a file or directory is created."""
-        if not event.is_directory:
-            file_path = event.src_path
-            # Check if the file has the selected video extension
-            if file_path.lower().endswith(self.video_extension):
-                logging.info(f"New video file detected: {file_path}")
-
-                # Extract the timestamp from the filename using the user-specified format
-                video_timestamp = self.extract_timestamp(file_path)
-
-                if video_timestamp:
-                    # Add the video file and its timestamp to the list
-                    self.video_files.append((file_path, video_timestamp))
-                    # Sort the list by timestamp to maintain chronological order
-                    self.video_files.sort(key=lambda x: x[1])
-                    logging.info(f"Video timestamp extracted and stored: {video_timestamp}")
-
-                    # Call process_videos to handle the new video files
-                    self.process_videos()
-                else:
-                    logging.info(f"Failed to extract timestamp from filename: {file_path}")
-            else:
-                logging.info(f"Ignored non-video file: {file_path}")
+        self.video_extension = video_extension
+        if output_extension is not None:
+            self.output_extension = output_extension
+        if self.is_monitoring:
+            for router in self.routers:
+                if router.watch_root.name == 'default':
+                    # The handlers apply the change on the engine loop; only a rescan for a new
+                    # extension runs on this (command) thread
+                    router.update_settings(time_threshold, timestamp_format, video_extension, self.output_extension)
 
-    def extract_timestamp(self, file_path):
+    def set_directory(self, directory):
         """
-        Extracts the timestamp from the video filename using the specified format.
+        Select the directory of the default watch root. Takes effect the next time monitoring starts.
 
         Args:
-            file_path (str): The full path to the video file.
+            directory (str): The directory.
+        """
+        self.selected_directory = directory
 
-        Returns:
-            datetime.datetime or None: The extracted timestamp, or None if parsing fails.
+    def reload_config(self):
         """
-        filename = os.path.basename(file_path)
-        # Remove the file extension to get the base name
-        base_name = os.path.splitext(filename)[0]
-        logging.info(f"Attempting to extract timestamp from filename: {base_name}")
+        Re-read the grouping settings of every watch root and apply them live.
 
-        try:
-            # Parse the timestamp using the user-specified format
-            timestamp = datetime.datetime.strptime(base_name, self.timestamp_format)
-            logging.info(f"Successfully extracted timestamp: {timestamp}")
+        Only WatchRoot.GROUPING_FIELDS are taken from the file, and they are copied onto
+        the existing watch roots. Every other setting, including the --profile override
+        and changes not yet saved, is left as it is. Added or removed [Watch:<name>]
+        sections take effect after a restart.
+        """
+        config = configparser.ConfigParser(interpolation=None)
+        if not config.read(self.config_file):
+            logging.warning(f"Could not read {self.config_file}; keeping the current settings.")
+            return
+        defaults, watch_roots = WatchRoot.from_config(config)
+        # The default root's profile lives on the service itself
+        for field in WatchRoot.GROUPING_FIELDS:
+            setattr(self, field, getattr(defaults, field))
+        reloaded = {watch_root.name: watch_root for watch_root in watch_roots}
+        for watch_root in self.watch_roots:
+            source = reloaded.pop(watch_root.name, None)
+            if source is None:
+                logging.warning(f"Watch root '{watch_root.name}' is no longer configured; "
+                                f"it is kept until the next restart.")
+                continue
+            for field in WatchRoot.GROUPING_FIELDS:
+                setattr(watch_root, field, getattr(source, field))
+        for name in reloaded:
+            logging.warning(f"Watch root '{name}' was added; it is watched after the next restart.")
+        logging.info(f"Reloaded grouping settings from {self.config_file}")
+        if self.is_monitoring:
+            watch_roots = {watch_root.name: watch_root for watch_root in self.active_watch_roots()}
+            for router in self.routers:
+                watch_root = watch_roots.get(router.watch_root.name)
+                if watch_root:
+                    router.update_settings(watch_root.time_threshold, watch_root.timestamp_format,
+                                           watch_root.video_extension, watch_root.output_extension)
+
+    def plan(self):
+        """
+        Dry-run the grouping of the files currently in the watch roots.
 
-            # Add a print statement for validation
-            print(f"Extracted timestamp from '{filename}': {timestamp}")
+        Returns:
+            dict: The plan, see JoinPlanner.plan().
+        """
+        return JoinPlanner(self.active_watch_roots(), self.catalog, self.join_mode,
+                           self.resource_policy.max_workers, self.output_policy).plan()
 
-            return timestamp
-        except ValueError as e:
-            # Handle the case where the filename does not match the expected format
-            logging.error(f"Error parsing timestamp from filename '{filename}': {e}")
-            return None
+    def pending_paths(self):
+        """
+        Return the paths of every segment still waiting to be grouped or joined.
 
-    def process_videos(self):
+        Returns:
+            set or None: The paths, or None until monitoring has scanned the watch roots
+            (nothing is tracking the segments yet).
+        """
+        if not self.is_monitoring or not self.initial_scan_done:
+            return None
+        handlers = [handler for router in self.routers for handler in list(router.handlers.values())]
+        return self.engine.run(lambda: set().union(*(handler.pending_paths() for handler in handlers)))
+
+    def search(self, start, end, camera=None, kind=None):
+        """
+        Find the cataloged trips and loose segments overlapping a time range.
+
+        Args:
+            start (datetime.datetime): Start of the range.
+            end (datetime.datetime): End of the range.
+            camera (str): Optionally only one camera, '<root>/<subfolder>' or just the subfolder
+                ('' for files directly in a watch root).
+            kind (str): Optionally only 'trip' or 'segment' entries.
+
+        Returns:
+            list: The matching entries, see TripCatalog.search().
+        """
+        return self.catalog.search(start, end, kind=kind, channel=camera)
+
+    def status(self):
+        """
+        Summarize the state of the service for the control API and the window.
+
+        Returns:
+            dict: Monitoring state, watch roots, scheduler state, the metrics snapshot and
+            the default watch root's settings.
+        """
+        return {
+            'monitoring': self.is_monitoring,
+            'watch_roots': [{'name': watch_root.name, 'directory': watch_root.directory}
+                            for watch_root in (router.watch_root for router in self.routers)],
+            'paused': self.scheduler.paused,
+            'queue_depth': self.scheduler.queue_depth(),
+            'running_jobs': len(self.scheduler.running),
+            'node': self.cluster.node if self.cluster else None,
+            'metrics': self.metrics.snapshot(),
+            # Settings of the default watch root, shown by the configuration window
+            'settings': {
+                'selected_directory': self.selected_directory,
+                'time_threshold': self.time_threshold,
+                'timestamp_format': self.timestamp_format,
+                'video_extension': self.video_extension,
+                'output_extension': self.output_extension,
+                'watch_roots': [watch_root.name for watch_root in self.watch_roots],
+            },
+        }
+
+    def router_for(self, path):
+        """Return the router of the watch root containing `path`, or None."""
+        path = os.path.abspath(path)
+        for router in self.routers:
+            directory = os.path.abspath(router.watch_root.directory)
+            if os.path.commonpath([path, directory]) == directory:
+                return router
+        return None
+
+    def join_paths(self, paths):
+        """
+        Join the given segments, one trip per camera channel, regardless of the time threshold.
+
+        Args:
+            paths (list): Segment paths inside the watch roots.
+
+        Returns:
+            int: The number of groups queued.
+
+        Raises:
+            RuntimeError: If monitoring is not active.
+        """
+        if not self.is_monitoring:
+            raise RuntimeError("Monitoring is not active.")
+        # The handlers' processed ranges belong to the engine loop
+        return self.engine.run(self._join_paths, paths)
+
+    def _join_paths(self, paths):
+        groups = collections.defaultdict(list)
+        for path in paths:
+            router = self.router_for(path)
+            if router is None or not os.path.exists(path):
+                logging.warning(f"Not joining {path}: not an existing file in a watch root.")
+                continue
+            handler = router.handler_for(router.channel_for(path))
+            timestamp = handler.extract_timestamp(path)
+            if timestamp:
+                groups[handler].append((path, timestamp))
+        queued = 0
+        for handler, group in groups.items():
+            group.sort(key=lambda video: video[1])
+            if len(group) < 2:
+                continue
+            if any(group[0][1] <= processed_end and group[-1][1] >= processed_start
+                   for processed_start, processed_end in handler.processed_time_ranges):
+                logging.info(f"Not joining the group starting at {group[0][1]}: it overlaps a processed range.")
+                continue
+            if handler.cluster and not handler.claim_group(group):
+                continue
+            handler.join_videos(group)
+            handler.processed_time_ranges.append((group[0][1], group[-1][1]))
+            queued += 1
+        return queued
+
+    def join_range(self, start, end):
+        """
+        Join the loose segments the catalog has between two times.
+
+        Args:
+            start (datetime.datetime): Start of the range.
+            end (datetime.datetime): End of the range.
+
+        Returns:
+            int: The number of groups queued.
+        """
+        return self.join_paths([path for path, kind, _, _ in self.catalog.overlapping(start, end) if kind == 'segment'])
+
+    def backfill(self, directory=None):
+        """
+        Feed the existing files of one directory, or of every watch root, through the handlers
+        on a background thread.
+
+        Args:
+            directory (str): A directory inside a watch root, or None for all of them.
+
+        Raises:
+            RuntimeError: If monitoring is not active.
+            ValueError: If the directory is not inside a watch root.
+        """
+        if not self.is_monitoring:
+            raise RuntimeError("Monitoring is not active.")
+        if directory is None:
+            target = self.process_existing_files
+        else:
+            router = self.router_for(directory)
+            if router is None or not os.path.isdir(directory):
+                raise ValueError(f"{directory} is not a directory inside a watch root")
+            handler = router.handler_for(router.channel_for(os.path.join(directory, 'placeholder')))
+            target = lambda: handler.process_existing_files(directory)
+        threading.Thread(target=target, name="backfill", daemon=True).start()
+
+    def shutdown(self):
+        """Stop monitoring and background work. Running jobs are allowed to finish."""
+        self.control.stop()
+        if self.is_monitoring:
+            self.stop_monitoring()
+        self.retention.stop()
+        self.scheduler.shutdown()
+        # Apply the bookkeeping posted by the last jobs, then stop the loop
+        self.engine.stop()
+        # Jobs that were still queued give their trips back to the other nodes
+        if self.cluster:
+            self.cluster.stop()
+        self.metrics_publisher.stop()
+        self.catalog.close()
+
+class VideoFileHandler(FileSystemEventHandler):
+    """Handles events related to video files in the monitored directory."""
+
+    def __init__(self, time_threshold, timestamp_format, video_extension, root, scheduler, catalog,
+                 output_extension='', faststart=False, keyframe_index=False, output_policy=None,
+                 join_mode='compose', renditions=None, summarizer=None, metrics=None, output_directory=None,
+                 channel='', composite=None, cluster=None, lease_scope='', engine=None, dedup=None):
+        super().__init__()
+        # Store the time threshold value (in seconds) for use in processing
+        self.time_threshold = time_threshold
+        # Store the timestamp format for parsing
+        self.timestamp_format = timestamp_format
+        # Store the video file extension(s); several may be watched at once, e.g. '.ts, .mp4'
+        self.video_extension = video_extension.lower()
+        self.video_extensions = parse_extensions(video_extension)
+        # Container of the joined files ('' keeps the first source extension)
+        self.output_extension = output_extension.lower()
+        # Put the MP4/MOV index at the front of the output so it streams
+        self.faststart = faststart
+        # Write a <output>.keyframes.json seek index next to each joined MP4/MOV
+        self.keyframe_index = keyframe_index
+        # Shard limits and dated folders of the joined files
+        self.output_policy = output_policy or OutputPolicy()
+        # Initialize a list to keep track of video files and their timestamps
+        self.video_files = []
+        # Paths in video_files, for constant time membership checks
+        self.video_paths = set()
+        # Keep track of processed time ranges
+        self.processed_time_ranges = []  # List to store tuples of (start_time, end_time)
+        # Video files whose names did not match the timestamp format, re-parsed when it changes
+        self.unmatched_files = set()
+        # Reference to the main Tkinter window for GUI operations
+        self.root = root
+        # Scheduler that runs the join jobs
+        self.scheduler = scheduler
+        # Catalog that tracks loose segments and joined trips
+        self.catalog = catalog
+        # How groups are joined: 'compose' (MoviePy) or 'transcode' (single ffmpeg pass)
+        self.join_mode = join_mode
+        # Extra outputs produced alongside the joined video whenever it is transcoded
+        # ('transcode' mode, and 'copy' mode trips that fall back to it)
+        self.renditions = renditions or []
+        # Writes keyframe summaries for finished trips
+        self.summarizer = summarizer
+        # Counters and latency histograms for the event and join stages
+        self.metrics = metrics or PipelineMetrics()
+        # Where joined files are written (None writes them next to the sources)
+        self.output_directory = output_directory
+        # Camera channel (subfolder) this handler groups, and the composite renderer of its watch root
+        self.channel = channel
+        self.composite = composite
+        # Shared lease queue when several nodes work on the same archive, and the prefix of
+        # this handler's lease keys (watch root and channel, identical on every node)
+        self.cluster = cluster
+        self.lease_scope = lease_scope
+        # Event loop that owns video_files and processed_time_ranges (None: the caller's thread does)
+        self.engine = engine
+        # Rejects re-imported or copied segments before they are grouped (None disables it)
+        self.dedup = dedup
+        # Segments waiting for their duplicate check to finish
+        self.dedup_pending = set()
+        # Segments of queued or running join jobs
+        self.joining_paths = set()
+
+    def on_created(self, event):
+        """Called when a file or directory is created."""
+        if self.engine and not self.engine.in_loop():
+            # The grouping state belongs to the engine loop; hand the event over
+            self.engine.call(self.on_created, event)
+            return
+        if not event.is_directory:
+            event_started = time.perf_counter()
+            # Tag the log records of this event with the file it concerns
+            token = correlation_id.set(f"file-{os.path.basename(event.src_path)}")
+            try:
+                self.metrics.inc('events_total')
+                file_path = event.src_path
+                # Check if the file has the selected video extension
+                if file_path.lower().endswith(self.video_extensions):
+                    logging.info(f"New video file detected: {file_path}")
+                    self.metrics.inc('segments_seen_total')
+
+                    # Extract the timestamp from the filename using the user-specified format
+                    parse_started = time.perf_counter()
+                    video_timestamp = self.extract_timestamp(file_path)
+                    self.metrics.observe('parse_seconds', time.perf_counter() - parse_started)
+
+                    if video_timestamp and (file_path in self.video_paths or file_path in self.dedup_pending):
+                        # Already pending, e.g. found again by a rescan after leases were re-queued
+                        logging.debug(f"Already tracking {file_path}")
+                    elif video_timestamp and self.dedup and self.engine and self.engine.thread:
+                        # The file may still be being written: wait for it to settle and hash it
+                        # on a worker thread, then add it back on the loop
+                        self.dedup_pending.add(file_path)
+                        self.engine.spawn(self._check_duplicate(file_path, video_timestamp))
+                    elif video_timestamp and self.dedup and self.dedup.is_duplicate(file_path):
+                        # Same footage under another name, or a card imported twice
+                        self.metrics.inc('duplicates_total')
+                    elif video_timestamp:
+                        self._add_segment(file_path, video_timestamp)
+                    else:
+                        logging.info(f"Failed to extract timestamp from filename: {file_path}")
+                        self.metrics.inc('parse_failures_total')
+                        self.unmatched_files.add(file_path)
+                else:
+                    logging.info(f"Ignored non-video file: {file_path}")
+                self.metrics.observe('event_seconds', time.perf_counter() - event_started)
+            finally:
+                correlation_id.reset(token)
+
+    async def _check_duplicate(self, file_path, video_timestamp):
+        """Run the duplicate check of a new segment off the loop and add the segment if it is new."""
+        try:
+            duplicate = await self.engine.loop.run_in_executor(None, self.dedup.is_duplicate, file_path)
+        except Exception as e:
+            logging.error(f"Duplicate check of {file_path} failed: {e}", exc_info=True)
+            duplicate = False
+        finally:
+            self.dedup_pending.discard(file_path)
+        if duplicate:
+            # Same footage under another name, or a card imported twice
+            self.metrics.inc('duplicates_total')
+        elif os.path.exists(file_path):
+            self._add_segment(file_path, video_timestamp)
+
+    def _add_segment(self, file_path, video_timestamp):
+        """Start tracking a segment and regroup the pending segments."""
+        # Add the video file and its timestamp to the list
+        self.video_files.append((file_path, video_timestamp))
+        self.video_paths.add(file_path)
+        # Sort the list by timestamp to maintain chronological order
+        self.video_files.sort(key=lambda x: x[1])
+        logging.info(f"Video timestamp extracted and stored: {video_timestamp}")
+        self.unmatched_files.discard(file_path)
+        # Record the loose segment until it is joined into a trip
+        self.catalog.add(file_path, 'segment', video_timestamp, video_timestamp,
+                         os.path.getsize(file_path), channel=self.lease_scope, segment_seconds=self.time_threshold)
+
+        # Call process_videos to handle the new video files
+        grouping_started = time.perf_counter()
+        self.process_videos()
+        self.metrics.observe('grouping_seconds', time.perf_counter() - grouping_started)
+
+    def update_settings(self, time_threshold, timestamp_format, video_extension, output_extension=''):
+        """
+        Applies new settings while keeping the pending segments and processed ranges.
+
+        A changed threshold regroups only the pending segments; a changed timestamp
+        format re-parses only the files whose names did not match the old one.
+
+        Args:
+            time_threshold (int): Maximum gap in seconds between segments of a trip.
+            timestamp_format (str): strftime format of the segment file names.
+            video_extension (str): Extension(s) of the segment files, comma separated.
+            output_extension (str): Container of the joined files ('' keeps the source extension).
+        """
+        if self.engine and not self.engine.in_loop():
+            self.engine.call(self.update_settings, time_threshold, timestamp_format, video_extension,
+                             output_extension)
+            return
+        threshold_changed = time_threshold != self.time_threshold
+        format_changed = timestamp_format != self.timestamp_format
+        self.time_threshold = time_threshold
+        self.timestamp_format = timestamp_format
+        self.video_extension = video_extension.lower()
+        self.video_extensions = parse_extensions(video_extension)
+        self.output_extension = output_extension.lower()
+
+        if format_changed:
+            retry = [path for path in self.unmatched_files if path.lower().endswith(self.video_extensions)]
+            self.unmatched_files.clear()
+            logging.info(f"Re-parsing {len(retry)} unmatched file(s) with format '{timestamp_format}'.")
+            for path in retry:
+                if os.path.exists(path):
+                    self.on_created(FileCreatedEvent(path))
+        if threshold_changed:
+            logging.info(f"Regrouping {len(self.video_files)} pending segment(s) with a {time_threshold}s threshold.")
+            self.process_videos()
+
+    def process_existing_files(self, directory):
+        """
+        Feeds the video files already in a directory through the event handler.
+
+        Args:
+            directory (str): The directory to scan.
+        """
+        # Iterate over all files in the directory
+        for filename in os.listdir(directory):
+            if filename.lower().endswith(self.video_extensions):
+                file_path = os.path.join(directory, filename)
+                logging.info(f"Found existing video file: {file_path}")
+                # Create a mock event object to simulate a file creation event
+                event = type('Event', (object,), {})()
+                event.src_path = file_path
+                event.is_directory = False
+                # Manually trigger the on_created event handler for each file
+                self.on_created(event)
+
+    def extract_timestamp(self, file_path, quiet=False):
+        """
+        Extracts the timestamp from the video filename using the specified format.
+
+        Args:
+            file_path (str): The full path to the video file.
+            quiet (bool): Do not log a filename that does not match, e.g. when only counting them.
+
+        Returns:
+            datetime.datetime or None: The extracted timestamp, or None if parsing fails.
+        """
+        filename = os.path.basename(file_path)
+        # Remove the file extension to get the base name
+        base_name = os.path.splitext(filename)[0]
+        logging.debug(f"Attempting to extract timestamp from filename: {base_name}")
+
+        try:
+            # Parse the timestamp using the user-specified format
+            timestamp = datetime.datetime.strptime(base_name, self.timestamp_format)
+            logging.debug(f"Extracted timestamp from '{filename}': {timestamp}")
+            return timestamp
+        except ValueError as e:
+            # Handle the case where the filename does not match the expected format
+            if not quiet:
+                logging.error(f"Error parsing timestamp from filename '{filename}': {e}")
+            return None
+
+    def process_videos(self):
         """
         Processes the collected video files, groups them based on the time threshold,
         and joins the videos in each group.
@@ -638,26 +1669,7 @@ class VideoFileHandler(FileSystemEventHandler):
         if len(self.video_files) < 2:
             return
 
-        # Create a list to hold groups of videos to be joined
-        video_groups = []
-        current_group = [self.video_files[0]]
-
-        # Iterate over the video files to group them
-        for i in range(1, len(self.video_files)):
-            previous_timestamp = self.video_files[i - 1][1]
-            current_timestamp = self.video_files[i][1]
-            time_difference = (current_timestamp - previous_timestamp).total_seconds()
-
-            if time_difference <= self.time_threshold:
-                # If the time difference is within the threshold, add to current group
-                current_group.append(self.video_files[i])
-            else:
-                # Time difference exceeds threshold; start a new group
-                video_groups.append(current_group)
-                current_group = [self.video_files[i]]
-
-        # Add the last group
-        video_groups.append(current_group)
+        video_groups = self.group_videos(self.video_files)
 
         # Process each group to join videos
         for group in video_groups:
@@ -675,105 +1687,4815 @@ class VideoFileHandler(FileSystemEventHandler):
                         logging.info(f"Skipping group starting at {group_start_time} due to overlap with processed range {processed_start} to {processed_end}.")
                         break
 
-                if not overlap:
+                if not overlap and self.cluster and not self.claim_group(group):
+                    # Another node holds or has joined some of these segments; forget only those,
+                    # the rest may still form a trip of their own
+                    self._drop_videos(self.contested_segments(group))
+                elif not overlap:
                     # No overlap; proceed to join videos
+                    self.metrics.inc('groups_formed_total')
                     self.join_videos(group)
                     # Add this group's time range to the list of processed ranges
                     self.processed_time_ranges.append((group_start_time, group_end_time))
                 else:
                     # Remove the videos in this group from the list to prevent reprocessing
-                    self.video_files = [video for video in self.video_files if video not in group]
+                    self._drop_videos(group)
+
+    def _drop_videos(self, videos):
+        """
+        Stop tracking pending segments.
+
+        Each one is found by bisecting the sorted list on its timestamp rather than
+        rebuilding the whole list.
+
+        Args:
+            videos (list): (file path, timestamp) tuples.
+        """
+        for path, timestamp in videos:
+            if path not in self.video_paths:
+                continue
+            index = bisect.bisect_left(self.video_files, timestamp, key=lambda video: video[1])
+            # Several segments can share a timestamp
+            while self.video_files[index][0] != path:
+                index += 1
+            del self.video_files[index]
+            self.video_paths.discard(path)
+
+    def group_videos(self, video_files):
+        """
+        Splits a chronologically sorted list of videos wherever the gap exceeds the time threshold.
+
+        Args:
+            video_files (list): Tuples of file paths and timestamps, sorted by timestamp.
+
+        Returns:
+            list: The groups, each a list of (file path, timestamp) tuples.
+        """
+        if not video_files:
+            return []
+
+        # Create a list to hold groups of videos to be joined
+        video_groups = []
+        current_group = [video_files[0]]
+
+        # Iterate over the video files to group them
+        for i in range(1, len(video_files)):
+            previous_timestamp = video_files[i - 1][1]
+            current_timestamp = video_files[i][1]
+            time_difference = (current_timestamp - previous_timestamp).total_seconds()
+
+            if time_difference <= self.time_threshold:
+                # If the time difference is within the threshold, add to current group
+                current_group.append(video_files[i])
+            else:
+                # Time difference exceeds threshold; start a new group
+                video_groups.append(current_group)
+                current_group = [video_files[i]]
+
+        # Add the last group
+        video_groups.append(current_group)
+        return video_groups
+
+    def lease_keys(self, video_group):
+        """Return the shared lease keys of the segments in a group."""
+        return [f"{self.lease_scope}/{os.path.basename(path)}" for path, _ in video_group]
+
+    def claim_group(self, video_group):
+        """
+        Claims the segments of a group on the shared lease queue.
+
+        Args:
+            video_group (list): A list of tuples containing file paths and their corresponding timestamps.
+
+        Returns:
+            bool: True if this node holds the group and should join it.
+        """
+        keys = self.lease_keys(video_group)
+        if not self.cluster.claim(keys):
+            logging.info(f"Group starting at {video_group[0][1]} is claimed by another node.")
+            return False
+        if not all(os.path.exists(path) for path, _ in video_group):
+            # Another node joined it between our scan and the claim
+            self.cluster.release(keys)
+            logging.info(f"Group starting at {video_group[0][1]} was already joined by another node.")
+            return False
+        return True
+
+    def contested_segments(self, video_group):
+        """
+        Return the segments of a group that another node holds a lease on or has already joined.
+
+        Args:
+            video_group (list): A list of tuples containing file paths and their corresponding timestamps.
+
+        Returns:
+            list: The contested (file path, timestamp) tuples.
+        """
+        keys = self.lease_keys(video_group)
+        held = self.cluster.held_elsewhere(keys)
+        return [video for video, key in zip(video_group, keys) if key in held or not os.path.exists(video[0])]
+
+    def forget_group(self, video_group):
+        """
+        Removes a joined group from the pending segments and records its time range.
+
+        Args:
+            video_group (list): A list of tuples containing file paths and their corresponding timestamps.
+        """
+        # Remove the processed videos from the list
+        self._drop_videos(video_group)
+        logging.info("Updated video files list after processing.")
+
+        # Add group's time range to the list of processed ranges
+        self.processed_time_ranges.append((video_group[0][1], video_group[-1][1]))
 
     def join_videos(self, video_group):
         """
-        Initiates the video joining process in a separate thread to prevent GUI freezing.
+        Queues the video joining process on the job scheduler to prevent GUI freezing.
 
         Args:
             video_group (list): A list of tuples containing file paths and their corresponding timestamps.
         """
-        # Start a new thread and pass the video_group to the _join_videos_thread method
-        threading.Thread(target=self._join_videos_thread, args=(video_group,)).start()
+        # Total size of the sources, used by the scheduler for bandwidth pacing
+        source_bytes = sum(os.path.getsize(path) for path, _ in video_group if os.path.exists(path))
+        # Reserve room for the output (and temp audio) wherever it will be written
+        output_bytes = estimate_output_bytes(source_bytes, self.join_mode)
+        output_dir = os.path.dirname(self.output_path_for(video_group))
+        staging_dir = self.scheduler.storage.staging_directory
+        space_needs = [(output_dir, output_bytes)]
+        if staging_dir:
+            space_needs.append((staging_dir, output_bytes))
+        # Retention must not delete the segments before the job has read them
+        self.joining_paths.update(path for path, _ in video_group)
+        self.scheduler.submit(
+            f"join {len(video_group)} clips starting {video_group[0][1]}",
+            self._join_videos_thread,
+            args=(video_group,),
+            source_bytes=source_bytes,
+            space_needs=space_needs,
+            kind='join'
+        )
 
-    def _join_videos_thread(self, video_group):
+    def pending_paths(self):
+        """Return the paths of the segments this handler still has to group or join. Runs on the engine loop."""
+        return self.video_paths | self.dedup_pending | self.joining_paths
+
+    def output_path_for(self, video_group):
         """
-        Performs the video joining operation. This method runs in a separate thread.
+        Builds the path of the joined file for a group of videos.
 
         Args:
             video_group (list): A list of tuples containing file paths and their corresponding timestamps.
+
+        Returns:
+            str: The full path of the output file.
         """
+        directory = self.output_policy.directory_for(self.output_directory or os.path.dirname(video_group[0][0]),
+                                                     video_group[0][1])
+        return os.path.join(directory, self.output_filename(video_group[0][1], video_group[-1][1]))
+
+    def output_filename(self, start, end, prefix='joined_'):
+        """Return the name of a joined file (or, with prefix 'composite_', a composite) covering `start` to `end`."""
         # Generate output file name based on start and end timestamps
-        start_time = video_group[0][1].strftime(self.timestamp_format)
-        end_time = video_group[-1][1].strftime(self.timestamp_format)
-        output_filename = f"joined_{start_time}_to_{end_time}{self.video_extension}"
-        output_path = os.path.join(os.path.dirname(video_group[0][0]), output_filename)
-        logging.info(f"Output file will be: {output_filename}")
+        start_time = start.strftime(self.timestamp_format)
+        end_time = end.strftime(self.timestamp_format)
+        return f"{prefix}{start_time}_to_{end_time}{self.output_extension or self.video_extensions[0]}"
 
-        # Extract file paths from the group
-        video_paths = [video[0] for video in video_group]
+    def _shard_output(self, output_path, start, end, prefix='joined_'):
+        """
+        Split a joined file over the output limits into shards at keyframes, without re-encoding.
+
+        Each shard is named after the part of the trip it covers and the unsplit
+        file is removed.
+
+        Args:
+            output_path (str): The joined file.
+            start (datetime.datetime): Start of the trip.
+            end (datetime.datetime): Timestamp of the trip's last segment.
+            prefix (str): Name prefix of the shards, one of OUTPUT_PREFIXES.
 
+        Returns:
+            list: (path, start, end) of each output file; just the joined file when it is within the limits.
+        """
+        duration = probe_duration(output_path)
+        shard_seconds = duration and self.output_policy.shard_seconds(duration, os.path.getsize(output_path))
+        if not shard_seconds:
+            # Catalog the footage's real end rather than the start of its last segment
+            return [(output_path, start, start + datetime.timedelta(seconds=duration) if duration else end)]
+
+        base, extension = os.path.splitext(output_path)
+        container = CONTAINER_FORMATS.get(extension.lower(), 'mp4')
+        list_path = base + '.shards.csv'
+        command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-i', output_path, '-map', '0:v', '-map', '0:a?',
+                   '-c', 'copy', '-f', 'segment', '-segment_time', f"{shard_seconds:.3f}", '-reset_timestamps', '1',
+                   '-segment_format', container, '-segment_list', list_path, '-segment_list_type', 'csv']
+
+        def split(options):
+            # Container options go to each shard's muxer, e.g. movflags=+faststart
+            format_options = ':'.join(f"{options[index].lstrip('-')}={options[index + 1]}"
+                                      for index in range(0, len(options), 2))
+            run_ffmpeg(command + (['-segment_format_options', format_options] if format_options else []) +
+                       [f"{base}.shard%03d{extension}"], self._limiter())
+            with open(list_path) as list_file:
+                return [row for row in csv.reader(list_file) if row]
+
+        logging.info(f"Splitting {output_path} into shards of about {shard_seconds:.0f}s.")
+        directory = os.path.dirname(output_path)
         try:
-            # Load video clips from the file paths
-            clips = []
+            rows = self._write_output(
+                split, output_path, shard_seconds * 2,
+                intact=lambda rows: all(mp4_is_intact(os.path.join(directory, row[0])) for row in rows))
+        except Exception:
+            # Leave only the unsplit file behind, not a partial set of shards
+            prefix = os.path.basename(base) + '.shard'
+            for name in os.listdir(directory):
+                if name.startswith(prefix) and name.endswith(extension):
+                    os.remove(os.path.join(directory, name))
+            raise
+        finally:
+            if os.path.exists(list_path):
+                os.remove(list_path)
+
+        shards = []
+        taken = set()
+        for index, (shard_name, shard_start, shard_end) in enumerate(rows):
+            shard_start_time = start + datetime.timedelta(seconds=float(shard_start))
+            shard_end_time = start + datetime.timedelta(seconds=float(shard_end))
+            shard_path = os.path.join(directory, self.output_filename(shard_start_time, shard_end_time, prefix))
+            # A coarse timestamp format (e.g. minutes) can give several shards, the unsplit
+            # file or an earlier trip the same name; number the shard rather than overwrite
+            if shard_path in taken or os.path.exists(shard_path):
+                root, shard_extension = os.path.splitext(shard_path)
+                shard_path = f"{root}_{index + 1:03d}{shard_extension}"
+            taken.add(shard_path)
+            os.replace(os.path.join(directory, shard_name), shard_path)
+            shards.append((shard_path, shard_start_time, shard_end_time))
+        os.remove(output_path)
+        logging.info(f"Split {os.path.basename(output_path)} into {len(shards)} shards.")
+        return shards
+
+    def _compose_join(self, video_paths, write_path, temp_audio_path):
+        """
+        Joins the clips with MoviePy, re-encoding the result.
+
+        Args:
+            video_paths (list): Paths of the clips in chronological order.
+            write_path (str): Where to write the joined video.
+            temp_audio_path (str): Where MoviePy may write its temporary audio track.
+        """
+        # MoviePy pulls in numpy, imageio and friends, so it is imported on the first join
+        from moviepy.editor import VideoFileClip, concatenate_videoclips
+
+        # Load video clips from the file paths
+        clips = []
+        with profile_stage('open clips'):
             for path in video_paths:
                 # Load each video file into a VideoFileClip object
                 clip = VideoFileClip(path)
                 clips.append(clip)
                 logging.info(f"Loaded video clip: {path}")
 
-            # Concatenate video clips into one final clip
+        # Concatenate video clips into one final clip
+        with profile_stage('concatenate'):
             final_clip = concatenate_videoclips(clips, method="compose")
-            logging.info("Video clips concatenated successfully.")
+        logging.info("Video clips concatenated successfully.")
 
-            # Write the final video to the output file
-            final_clip.write_videofile(output_path)
-            logging.info(f"Final video written to file: {output_path}")
+        # Write the audio track first so its cost shows up separately from the video encode
+        audio = None
+        if final_clip.audio is not None:
+            with profile_stage('write audio'):
+                final_clip.audio.write_audiofile(temp_audio_path, logger=None)
+            audio = temp_audio_path
 
-            # Close all the clips to release resources
-            for clip in clips:
-                clip.close()
-            final_clip.close()
+        # Write the final video to the output file, honouring the encoder thread limit
+        encoder_threads = self.scheduler.policy.encoder_threads or None
+        try:
+            with profile_stage('write video'):
+                self._write_output(
+                    lambda options: final_clip.write_videofile(write_path, threads=encoder_threads,
+                                                               audio=audio or False, ffmpeg_params=options),
+                    write_path, final_clip.duration)
+        finally:
+            if audio and os.path.exists(temp_audio_path):
+                os.remove(temp_audio_path)
+
+        # Close all the clips to release resources
+        for clip in clips:
+            clip.close()
+        final_clip.close()
+
+    def _limiter(self):
+        """Return the scheduler's BandwidthLimiter, or None when running without a scheduler."""
+        return self.scheduler.limiter if self.scheduler else None
+
+    def container_options(self, write_path, duration=None):
+        """
+        Return the ffmpeg output options for the container of `write_path`.
 
-            # Delete original files after joining
-            for path in video_paths:
-                if os.path.exists(path):
-                    os.remove(path)
-                    logging.info(f"Deleted original file: {path}")
+        With fast start on, MP4/MOV outputs get room reserved for the index ahead
+        of the media, so the muxer writes it in place instead of rewriting the
+        whole file afterwards. Without a duration to size the room, ffmpeg's
+        +faststart (a second pass) is used instead.
 
-            # Remove the processed videos from the list
-            self.video_files = [video for video in self.video_files if video[0] not in video_paths]
-            logging.info("Updated video files list after processing.")
+        Args:
+            write_path (str): The output file.
+            duration (float): Upper bound of the output's length in seconds, if known.
 
-            # Add group's time range to the list of processed ranges
-            self.processed_time_ranges.append((video_group[0][1], video_group[-1][1]))
+        Returns:
+            list: ffmpeg output options.
+        """
+        container = CONTAINER_FORMATS.get(os.path.splitext(write_path)[1].lower())
+        if not self.faststart or container not in ('mp4', 'mov'):
+            return []
+        if duration:
+            return ['-moov_size', str(moov_reserve_bytes(duration))]
+        return ['-movflags', '+faststart']
+
+    def _write_output(self, write, write_path, duration=None, intact=None):
+        """
+        Write an output with the container options, falling back to a +faststart pass
+        if the reserved index space turned out too small.
 
-        except Exception as e:
-            logging.error(f"Error joining videos: {e}", exc_info=True)
+        Args:
+            write (callable): Writes the output given a list of extra ffmpeg output options.
+            write_path (str): The output file.
+            duration (float): Upper bound of the output's length in seconds, if known.
+            intact (callable): Given write's return value, tells whether the output is complete
+                (default: the MP4 boxes of write_path add up).
 
-            # Display an error message in the GUI using root.after to ensure thread safety
-            self.root.after(0, lambda: messagebox.showerror(
-                "Video Joining Error",
-                f"An error occurred during video processing:\n{e}"
-            ))
+        Returns:
+            The return value of the successful write.
+        """
+        options = self.container_options(write_path, duration)
+        intact = intact or (lambda result: mp4_is_intact(write_path))
+        try:
+            result = write(options)
+        except subprocess.CalledProcessError as e:
+            if '-moov_size' not in options:
+                logging.error(f"ffmpeg failed writing {write_path}: {ffmpeg_stderr(e)}")
+                raise
+            # Some ffmpeg builds report an overflowing reservation through the exit status
+            logging.warning(f"ffmpeg failed writing {write_path} with a reserved index: {ffmpeg_stderr(e)}")
+        else:
+            # Others exit cleanly, leaving the index missing or written over the media,
+            # so check the box layout still adds up
+            if '-moov_size' not in options or intact(result):
+                return result
+            logging.warning(f"Reserved index space was too small for {write_path}.")
+        logging.info(f"Rewriting {write_path} with +faststart.")
+        try:
+            return write(['-movflags', '+faststart'])
+        except subprocess.CalledProcessError as e:
+            logging.error(f"ffmpeg failed writing {write_path}: {ffmpeg_stderr(e)}")
+            raise
 
-# Handle logging in Tkinter
-class TextHandler(logging.Handler):
-    """This class allows logging to a queue, which is polled from the main thread."""
-    def __init__(self, log_queue):
-        super().__init__()
-        self.log_queue = log_queue
+    def _copy_join(self, video_paths, write_path, duration=None):
+        """
+        Joins the clips by packet copy with the concat demuxer, rewrapping them into the output container.
 
-    def emit(self, record):
-        msg = self.format(record)
-        # Put the message into the queue
-        self.log_queue.put(msg)
+        Only possible when every clip has the same source container, codecs, frame size,
+        pixel format and audio format, and the output container accepts those codecs.
+
+        Args:
+            video_paths (list): Paths of the clips in chronological order.
+            write_path (str): Where to write the joined video.
+            duration (float): Upper bound of the joined length in seconds, if known.
+
+        Returns:
+            bool: True if the clips were joined, False if they need re-encoding.
+        """
+        container = CONTAINER_FORMATS.get(os.path.splitext(write_path)[1].lower(), 'mp4')
+        with profile_stage('probe'):
+            streams = [probe_streams(path) for path in video_paths]
+        blocker = copy_blocker(streams, container)
+        if blocker:
+            logging.info(f"{blocker}; transcoding instead.")
+            return False
+
+        list_path = write_concat_list(video_paths)
+        try:
+            command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                       '-map', '0:v', '-map', '0:a?', '-c', 'copy']
+            if streams[0]['audio'] == 'aac' and container in ('mp4', 'mov'):
+                # ADTS framed AAC from MPEG-TS must be converted for MP4
+                command += ['-bsf:a', 'aac_adtstoasc']
+            logging.info(f"Remuxing {len(video_paths)} clips into {container} without re-encoding.")
+            with profile_stage('remux'):
+                self._write_output(
+                    lambda options: run_ffmpeg(command + options + ['-f', container, write_path], self._limiter()),
+                    write_path, duration)
+            return True
+        finally:
+            os.remove(list_path)
+
+    def _transcode_join(self, video_paths, write_path, duration=None):
+        """
+        Joins the clips with a single ffmpeg process that also writes every rendition.
+
+        The sources are decoded once; the decoded frames are split between the
+        full quality encoder and the rendition encoders.
+
+        Args:
+            video_paths (list): Paths of the clips in chronological order.
+            write_path (str): Where to write the joined video.
+            duration (float): Upper bound of the joined length in seconds, if known.
+
+        Returns:
+            list: Paths of the rendition files that were written.
+        """
+        with profile_stage('concatenate'):
+            list_path = write_concat_list(video_paths)
+        try:
+            command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+            threads = ['-threads', str(self.scheduler.policy.encoder_threads)] if self.scheduler.policy.encoder_threads else []
+
+            # Split the decoded video once per output
+            labels = ['main'] + [f"r{index}" for index in range(len(self.renditions))]
+            filters = [f"[0:v]split={len(labels)}" + ''.join(f"[{label}]" for label in labels)]
+            for index, rendition in enumerate(self.renditions):
+                filters.append(f"[r{index}]{rendition.filter_chain()}[r{index}out]")
+            command += ['-filter_complex', ';'.join(filters)]
+
+            # Full quality output; its container options go in front of its path
+            command += ['-map', '[main]', '-map', '0:a?', '-c:v', 'libx264', '-preset', 'medium',
+                        '-c:a', 'aac'] + threads
+
+            # Renditions, written next to the main output
+            renditions = [write_path]
+            rendition_paths = []
+            for index, rendition in enumerate(self.renditions):
+                rendition_path = rendition.output_path(write_path)
+                renditions += ['-map', f"[r{index}out]"] + rendition.output_options() + threads + [rendition_path]
+                rendition_paths.append(rendition_path)
+
+            logging.info(f"Joining {len(video_paths)} clips with {len(self.renditions)} rendition(s) in one pass.")
+            # Video, audio and renditions are encoded together, so they form a single stage
+            with profile_stage('encode'):
+                self._write_output(
+                    lambda options: run_ffmpeg(command + options + renditions, self._limiter()),
+                    write_path, duration)
+            return rendition_paths
+        finally:
+            os.remove(list_path)
+
+    def _join_videos_thread(self, video_group):
+        """
+        Performs the video joining operation. This method runs in a separate thread.
+
+        Args:
+            video_group (list): A list of tuples containing file paths and their corresponding timestamps.
+        """
+        output_path = self.output_path_for(video_group)
+        output_filename = os.path.basename(output_path)
+        logging.info(f"Output file will be: {output_filename}")
+        # The dated YYYY/MM/DD folder may not exist yet
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        # Write to the staging volume first when one is configured
+        staging_dir = self.scheduler.storage.staging_directory
+        write_path = os.path.join(staging_dir, output_filename) if staging_dir else output_path
+        # Keep MoviePy's temporary audio next to the output instead of the working directory
+        temp_audio_path = os.path.splitext(write_path)[0] + "TEMP_MPY_wvf_snd.mp3"
+
+        # Extract file paths from the group
+        video_paths = [video[0] for video in video_group]
+        join_started = time.perf_counter()
+        succeeded = False
+        # Upper bound of the trip's length (the last segment is at most a gap long), sizing the MP4 index
+        duration = (video_group[-1][1] - video_group[0][1]).total_seconds() + self.time_threshold
+
+        try:
+            if self.join_mode == 'copy' and self._copy_join(video_paths, write_path, duration):
+                # Rewrapped by packet copy; nothing was decoded
+                rendition_paths = []
+            elif self.join_mode in ('transcode', 'copy'):
+                # One ffmpeg decode feeding the main output and every rendition
+                rendition_paths = self._transcode_join(video_paths, write_path, duration)
+            else:
+                self._compose_join(video_paths, write_path, temp_audio_path)
+                rendition_paths = []
+
+            # Move the staged outputs into the monitored directory
+            if write_path != output_path:
+                with profile_stage('move staged'):
+                    move_file(write_path, output_path, self.scheduler.limiter)
+                    staged_paths, rendition_paths = rendition_paths, []
+                    for staged_path in staged_paths:
+                        rendition_path = os.path.join(os.path.dirname(output_path), os.path.basename(staged_path))
+                        move_file(staged_path, rendition_path, self.scheduler.limiter)
+                        rendition_paths.append(rendition_path)
+                logging.info(f"Moved staged output from {write_path}")
+            logging.info(f"Final video written to file: {output_path}")
+            # Split trips over the length or size limit at keyframes
+            with profile_stage('shard'):
+                outputs = self._shard_output(output_path, video_group[0][1], video_group[-1][1])
+            # Seek index sidecar for viewers (time to byte offset of each keyframe)
+            if self.keyframe_index:
+                with profile_stage('keyframe index'):
+                    for path, _, _ in outputs:
+                        write_keyframe_index(path)
+            self.metrics.observe('join_duration_seconds', time.perf_counter() - join_started, mode=self.join_mode)
+            self.metrics.inc('joins_total', status='done')
+            source_bytes = sum(os.path.getsize(path) for path in video_paths)
+            output_bytes = sum(os.path.getsize(path) for path, _, _ in outputs)
+            self.metrics.inc('bytes_in_total', source_bytes)
+            self.metrics.inc('bytes_out_total', output_bytes)
+            # Calibrates the planner's size and time estimates
+            self.catalog.record_job('join', self.join_mode, source_bytes, output_bytes,
+                                    time.perf_counter() - join_started)
+
+            # Render the synchronized multi-channel composite from the sources before they go,
+            # split under the same output limits as the trip
+            composites = []
+            if self.composite and self.channel == self.composite.policy.primary_channel:
+                composite_path = self.composite.render(video_group, output_path)
+                with profile_stage('shard'):
+                    composites = self._shard_output(composite_path, video_group[0][1], video_group[-1][1],
+                                                    prefix='composite_')
+                if self.keyframe_index:
+                    with profile_stage('keyframe index'):
+                        for path, _, _ in composites:
+                            write_keyframe_index(path)
+            elif self.composite and self.channel == self.composite.policy.secondary_channel:
+                # A composite render may still be reading these segments
+                self.composite.wait_until_unpinned(video_paths)
+
+            # Delete original files after joining
+            with profile_stage('delete'):
+                for path in video_paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                        logging.info(f"Deleted original file: {path}")
+
+            # Replace the segments with the joined trip in the catalog
+            if self.dedup:
+                self.dedup.mark_joined(video_paths, outputs[0][0])
+            self.catalog.remove(video_paths)
+            for path, start, end in outputs:
+                self.catalog.add(path, 'trip', start, end, os.path.getsize(path), channel=self.lease_scope)
+                if self.keyframe_index:
+                    self.catalog.add_derived(path, [keyframe_index_path(path)])
+            # Renditions are made from the whole trip and go with its first file
+            self.catalog.add_derived(outputs[0][0], rendition_paths)
+            # Composites are searchable as the watch root's 'composite' camera
+            for path, start, end in composites:
+                self.catalog.add(path, 'trip', start, end, os.path.getsize(path),
+                                 channel=f"{self.composite.watch_root.name}/composite")
+                if self.keyframe_index:
+                    self.catalog.add_derived(path, [keyframe_index_path(path)])
+
+            # Forget the joined segments (on the engine loop, which owns the lists)
+            if self.engine:
+                self.engine.call(self.forget_group, video_group)
+            else:
+                self.forget_group(video_group)
+
+            # Queue the keyframe summary for the new trip
+            if self.summarizer:
+                for path, _, _ in outputs:
+                    self.summarizer.submit(path)
+            succeeded = True
+
+        except Exception as e:
+            logging.error(f"Error joining videos: {e}", exc_info=True)
+            self.metrics.inc('joins_total', status='failed')
+
+            # Display an error message in the GUI using root.after to ensure thread safety
+            if self.root:
+                self.root.after(0, lambda: messagebox.showerror(
+                    "Video Joining Error",
+                    f"An error occurred during video processing:\n{e}"
+                ))
+
+        finally:
+            # The engine loop owns the tracking sets; this runs on a worker thread
+            if self.engine:
+                self.engine.call(self.joining_paths.difference_update, video_paths)
+            else:
+                self.joining_paths.difference_update(video_paths)
+            # Hand the segments back to the cluster (they are gone if the join succeeded)
+            if self.cluster:
+                self.cluster.finished(self.lease_keys(video_group), succeeded)
+
+class WatchRoot:
+    """A monitored directory and the profile applied to the files under it."""
+
+    # Prefix of the config sections describing additional watch roots
+    SECTION_PREFIX = 'Watch:'
+    # Settings that shape grouping and can be reloaded while monitoring
+    GROUPING_FIELDS = ('time_threshold', 'timestamp_format', 'video_extension', 'output_extension')
+
+    def __init__(self, name, directory, time_threshold=90, timestamp_format='%Y-%m-%d %Hh %Mm %Ss',
+                 video_extension='.mp4', output_directory=None, recursive=False, observer='native',
+                 output_extension=''):
+        # Short name used in logs, e.g. 'truck7-front'
+        self.name = name
+        self.directory = directory
+        self.time_threshold = time_threshold
+        self.timestamp_format = timestamp_format
+        self.video_extension = video_extension.lower()
+        # Joined files go here (per channel subfolder) instead of next to the sources
+        self.output_directory = output_directory or None
+        # Watch subfolders too, treating each one as a separate camera channel
+        self.recursive = recursive
+        # 'native' file system notifications, or 'polling' for network shares and removable media
+        self.observer = observer
+        # Container of the joined files, e.g. '.mp4' for .ts sources ('' keeps the first source extension)
+        self.output_extension = output_extension
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build every watch root a configuration describes.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            tuple: (the 'default' root from [Settings], list of the [Watch:<name>] roots).
+            The default root's directory is None when none is selected.
+        """
+        defaults = cls(
+            'default',
+            config.get('Settings', 'selected_directory', fallback='') or None,
+            config.getint('Settings', 'time_threshold', fallback=90),
+            config.get('Settings', 'timestamp_format', fallback='%Y-%m-%d %Hh %Mm %Ss'),
+            config.get('Settings', 'video_extension', fallback='.mp4'),
+            observer=config.get('Settings', 'observer', fallback='native'),
+            output_extension=config.get('Settings', 'output_extension', fallback=''),
+        )
+        watch_roots = [
+            cls.from_section(name[len(cls.SECTION_PREFIX):], config[name], defaults)
+            for name in config.sections()
+            if name.startswith(cls.SECTION_PREFIX) and config[name].get('directory')
+        ]
+        return defaults, watch_roots
+
+    @classmethod
+    def from_section(cls, name, section, defaults):
+        """
+        Build a watch root from a [Watch:<name>] config section.
+
+        Args:
+            name (str): The part of the section name after 'Watch:'.
+            section (configparser.SectionProxy): The section.
+            defaults (WatchRoot): Supplies the profile values the section leaves out.
+
+        Returns:
+            WatchRoot: The watch root.
+        """
+        return cls(
+            name=name,
+            directory=section.get('directory'),
+            time_threshold=section.getint('time_threshold', fallback=defaults.time_threshold),
+            timestamp_format=section.get('timestamp_format', fallback=defaults.timestamp_format),
+            video_extension=section.get('video_extension', fallback=defaults.video_extension),
+            output_directory=section.get('output_directory', fallback='').strip(),
+            recursive=section.getboolean('recursive', fallback=False),
+            observer=section.get('observer', fallback=defaults.observer),
+            output_extension=section.get('output_extension', fallback=defaults.output_extension),
+        )
+
+    def to_config(self):
+        """Return the watch root as a dictionary suitable for a ConfigParser section."""
+        return {
+            'directory': self.directory,
+            'time_threshold': str(self.time_threshold),
+            'timestamp_format': self.timestamp_format,
+            'video_extension': self.video_extension,
+            'output_directory': self.output_directory or '',
+            'recursive': str(self.recursive).lower(),
+            'observer': self.observer,
+            'output_extension': self.output_extension,
+        }
+
+
+class ChannelRouter(FileSystemEventHandler):
+    """
+    Routes the events of one watch root to a VideoFileHandler per camera channel.
+
+    A channel is the subfolder a file lives in, relative to the watch root, so
+    front, rear and cabin footage never end up in the same group.
+    """
+
+    def __init__(self, watch_root, handler_factory):
+        super().__init__()
+        self.watch_root = watch_root
+        # Called as handler_factory(watch_root, channel) to create a channel's handler
+        self.handler_factory = handler_factory
+        # Channel name -> VideoFileHandler
+        self.handlers = {}
+        self.lock = threading.Lock()
+
+    def channel_for(self, path):
+        """Return the channel name of a file ('' for files directly in the root)."""
+        relative = os.path.relpath(os.path.dirname(path), self.watch_root.directory)
+        return '' if relative == os.curdir else relative
+
+    def handler_for(self, channel):
+        """Return the handler of a channel, creating it on first use."""
+        with self.lock:
+            handler = self.handlers.get(channel)
+            if handler is None:
+                handler = self.handlers[channel] = self.handler_factory(self.watch_root, channel)
+                if channel:
+                    logging.info(f"Tracking camera channel '{channel}' under {self.watch_root.name}")
+            return handler
+
+    def on_created(self, event):
+        """Forward a file creation to its channel's handler."""
+        if not event.is_directory:
+            self.handler_for(self.channel_for(event.src_path)).on_created(event)
+
+    def update_settings(self, time_threshold, timestamp_format, video_extension, output_extension=''):
+        """
+        Apply new grouping settings to the watch root and every channel handler.
+
+        Args:
+            time_threshold (int): Maximum gap in seconds between segments of a trip.
+            timestamp_format (str): strftime format of the segment file names.
+            video_extension (str): Extension(s) of the segment files, comma separated.
+            output_extension (str): Container of the joined files ('' keeps the source extension).
+        """
+        extension_changed = (set(parse_extensions(video_extension)) -
+                             set(parse_extensions(self.watch_root.video_extension)))
+        self.watch_root.time_threshold = time_threshold
+        self.watch_root.timestamp_format = timestamp_format
+        self.watch_root.video_extension = video_extension
+        self.watch_root.output_extension = output_extension
+        with self.lock:
+            handlers = list(self.handlers.values())
+        for handler in handlers:
+            handler.update_settings(time_threshold, timestamp_format, video_extension, output_extension)
+        if extension_changed:
+            # Files with the new extension were ignored so far; tracked files are skipped by on_created
+            logging.info(f"Scanning {self.watch_root.directory} for {video_extension} files.")
+            self.process_existing_files()
+
+    def process_existing_files(self):
+        """Feed the files already under the watch root to their channel handlers."""
+        if not self.watch_root.recursive:
+            self.handler_for('').process_existing_files(self.watch_root.directory)
+            return
+        for directory, _, _ in os.walk(self.watch_root.directory):
+            channel = self.channel_for(os.path.join(directory, 'placeholder'))
+            self.handler_for(channel).process_existing_files(directory)
+
+class CompositePolicy:
+    """Settings for the synchronized front/rear composite of each trip."""
+
+    LAYOUTS = ('pip', 'side-by-side')
+
+    def __init__(self, enabled=False, primary_channel='front', secondary_channel='rear', layout='pip',
+                 width=1280, height=720, pip_scale=0.3, fps=30):
+        self.enabled = enabled
+        # Channel (subfolder) whose trips drive the composite, and the channel shown alongside it
+        self.primary_channel = primary_channel
+        self.secondary_channel = secondary_channel
+        # 'pip' insets the secondary channel in a corner; 'side-by-side' places them next to each other
+        self.layout = layout
+        # Size of the primary picture in the composite
+        self.width = width
+        self.height = height
+        # Size of the inset relative to the primary picture in 'pip' layout
+        self.pip_scale = pip_scale
+        self.fps = fps
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Composite] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            CompositePolicy: The policy, with defaults for any missing option.
+        """
+        if 'Composite' not in config:
+            return cls()
+        section = config['Composite']
+        layout = section.get('layout', fallback='pip')
+        if layout not in cls.LAYOUTS:
+            logging.warning(f"Unknown composite layout '{layout}', using 'pip'.")
+            layout = 'pip'
+        return cls(
+            enabled=section.getboolean('enabled', fallback=False),
+            primary_channel=section.get('primary_channel', fallback='front'),
+            secondary_channel=section.get('secondary_channel', fallback='rear'),
+            layout=layout,
+            width=section.getint('width', fallback=1280),
+            height=section.getint('height', fallback=720),
+            pip_scale=section.getfloat('pip_scale', fallback=0.3),
+            fps=section.getint('fps', fallback=30),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'enabled': str(self.enabled).lower(),
+            'primary_channel': self.primary_channel,
+            'secondary_channel': self.secondary_channel,
+            'layout': self.layout,
+            'width': str(self.width),
+            'height': str(self.height),
+            'pip_scale': str(self.pip_scale),
+            'fps': str(self.fps),
+        }
+
+
+class CompositeRenderer:
+    """
+    Renders a primary channel trip together with the matching secondary footage.
+
+    The composite is built straight from the source files in one ffmpeg
+    decode/encode pass. Secondary footage (loose segments or an already joined
+    trip) is placed on the primary trip's timeline by timestamp, and any gaps
+    are filled with a placeholder instead of aborting.
+    """
+
+    # Colour shown where the secondary channel has no footage
+    PLACEHOLDER_COLOR = '0x202020'
+
+    def __init__(self, policy, watch_root, catalog, engine=None, scheduler=None):
+        self.policy = policy
+        self.watch_root = watch_root
+        self.catalog = catalog
+        # Engine loop used to probe the sources concurrently (None probes them one by one)
+        self.engine = engine
+        # Scheduler whose bandwidth limiter paces the render's disk I/O (None: unpaced)
+        self.scheduler = scheduler
+        # Secondary files being read by a render; their handler waits before deleting them
+        self.pinned = collections.Counter()
+        self.condition = threading.Condition()
+
+    def secondary_directories(self):
+        """Return the directories that hold secondary channel segments and trips."""
+        directories = [os.path.join(self.watch_root.directory, self.policy.secondary_channel)]
+        if self.watch_root.output_directory:
+            directories.append(os.path.join(self.watch_root.output_directory, self.policy.secondary_channel))
+        return [os.path.abspath(directory) for directory in directories]
+
+    def wait_until_unpinned(self, paths):
+        """
+        Block until no render is reading any of the given files.
+
+        Args:
+            paths (list): Files about to be deleted.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not any(self.pinned[path] for path in paths))
+
+    def _pin(self, paths, sign):
+        with self.condition:
+            for path in paths:
+                self.pinned[path] += sign
+                if self.pinned[path] <= 0:
+                    del self.pinned[path]
+            self.condition.notify_all()
+
+    def render(self, video_group, output_path):
+        """
+        Write the composite for a primary channel group.
+
+        Args:
+            video_group (list): The primary channel's (file path, timestamp) tuples.
+            output_path (str): The primary trip's joined output; the composite goes next to it.
+
+        Returns:
+            str: Path of the composite file.
+        """
+        primary_paths = [path for path, _ in video_group]
+        durations = [duration or 0.0 for duration in self._probe(primary_paths)]
+        total = sum(durations)
+        start = video_group[0][1]
+        end = start + datetime.timedelta(seconds=total)
+
+        # Secondary footage overlapping the trip, from the catalog (no directory scan)
+        directories = self.secondary_directories()
+        candidates = [
+            (path, entry_start) for path, _, entry_start, _ in self.catalog.overlapping(
+                start - datetime.timedelta(hours=1), end)
+            if os.path.dirname(os.path.abspath(path)) in directories
+        ]
+        self._pin([path for path, _ in candidates], 1)
+        try:
+            secondary = []
+            present = [(path, entry_start) for path, entry_start in sorted(candidates, key=lambda c: c[1])
+                       if os.path.exists(path)]
+            for (path, entry_start), duration in zip(present, self._probe([path for path, _ in present])):
+                offset = (entry_start - start).total_seconds()
+                # Keep footage that overlaps the primary timeline
+                if duration and offset < total and offset + duration > 0:
+                    secondary.append((path, offset, duration))
+            if not secondary:
+                logging.info(f"No {self.policy.secondary_channel} footage for trip starting {start}; "
+                             f"using a placeholder.")
+
+            composite_path = os.path.join(os.path.dirname(output_path),
+                                          'composite_' + os.path.basename(output_path)[len('joined_'):])
+            self._run_ffmpeg(primary_paths, total, secondary, composite_path)
+            logging.info(f"Composite written to file: {composite_path}")
+            return composite_path
+        finally:
+            self._pin([path for path, _ in candidates], -1)
+
+    def _probe(self, paths):
+        """Return the durations of the given files, probed concurrently when an engine loop is available."""
+        if self.engine:
+            return self.engine.probe_durations(paths)
+        return [probe_duration(path) for path in paths]
+
+    def _secondary_size(self):
+        """Return the (width, height) of the secondary picture for the layout."""
+        if self.policy.layout == 'pip':
+            width = int(self.policy.width * self.policy.pip_scale) // 2 * 2
+            height = int(self.policy.height * self.policy.pip_scale) // 2 * 2
+            return width, height
+        return self.policy.width, self.policy.height
+
+    def _run_ffmpeg(self, primary_paths, total, secondary, composite_path):
+        """Build and run the single-pass composite command."""
+        width, height = self._secondary_size()
+        fps = self.policy.fps
+        normalize = f"scale={{w}}:{{h}}:force_original_aspect_ratio=decrease,pad={{w}}:{{h}}:(ow-iw)/2:(oh-ih)/2," \
+                    f"setsar=1,fps={fps},format=yuv420p"
+
+        list_path = write_concat_list(primary_paths)
+        try:
+            command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+            filters = [f"[0:v]{normalize.format(w=self.policy.width, h=self.policy.height)}[primary]"]
+
+            # Lay the secondary footage on the primary timeline, padding gaps with the placeholder
+            pieces = []
+            cursor = 0.0
+            for index, (path, offset, duration) in enumerate(secondary, start=1):
+                command += ['-i', path]
+                if offset > cursor + 0.05:
+                    pieces.append(self._placeholder(filters, len(pieces), offset - cursor, width, height))
+                    cursor = offset
+                skip = max(0.0, cursor - offset)
+                length = min(offset + duration, total) - max(offset, cursor)
+                if length <= 0.05:
+                    continue
+                label = f"s{len(pieces)}"
+                filters.append(f"[{index}:v]trim=start={skip:.3f}:duration={length:.3f},setpts=PTS-STARTPTS,"
+                               f"{normalize.format(w=width, h=height)}[{label}]")
+                pieces.append(label)
+                cursor += length
+            if total > cursor + 0.05 or not pieces:
+                pieces.append(self._placeholder(filters, len(pieces), max(total - cursor, 0.1), width, height))
+            filters.append(''.join(f"[{label}]" for label in pieces) + f"concat=n={len(pieces)}:v=1:a=0[secondary]")
+
+            if self.policy.layout == 'pip':
+                filters.append("[primary][secondary]overlay=W-w-20:H-h-20:eof_action=pass[out]")
+            else:
+                filters.append("[primary][secondary]hstack=inputs=2:shortest=1[out]")
+
+            command += ['-filter_complex', ';'.join(filters), '-map', '[out]', '-map', '0:a?',
+                        '-c:v', 'libx264', '-preset', 'medium', '-c:a', 'aac', '-t', f"{total:.3f}", composite_path]
+            with profile_stage('composite'):
+                run_ffmpeg(command, self.scheduler.limiter if self.scheduler else None)
+        finally:
+            os.remove(list_path)
+
+    def _placeholder(self, filters, index, duration, width, height):
+        """Add a placeholder source of the given length and return its label."""
+        label = f"s{index}"
+        filters.append(f"color=c={self.PLACEHOLDER_COLOR}:s={width}x{height}:r={self.policy.fps}:d={duration:.3f},"
+                       f"format=yuv420p[{label}]")
+        return label
+
+class EngineLoop:
+    """
+    A single asyncio event loop, on its own thread, that owns the grouping state.
+
+    Watchdog and polling observer threads, the control API, settings reloads and
+    the join workers do not touch a handler's pending segments or processed
+    ranges themselves: they post the work onto this loop, which runs it one call
+    at a time, so that state is only ever mutated from one thread and needs no
+    locks. Media probes run on the loop as asyncio subprocesses with timeouts, so
+    thousands of them can be pending without a thread each.
+
+    Encoding stays on the JoinScheduler's worker threads, which carry the resource
+    policy, disk admission and bandwidth pacing.
+    """
+
+    def __init__(self, max_concurrent_probes=None):
+        self.loop = asyncio.new_event_loop()
+        self.max_concurrent_probes = max_concurrent_probes or PROBE_CONCURRENCY
+        self.thread = None
+
+    def start(self):
+        """Run the loop on a background thread."""
+        self.thread = threading.Thread(target=self.loop.run_forever, name="engine-loop", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Finish the calls already posted, then stop the loop."""
+        if self.thread:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+        self.loop.close()
+
+    def in_loop(self):
+        """Return True on the loop's own thread, or when the loop is not running (state is then unshared)."""
+        return self.thread is None or threading.current_thread() is self.thread
+
+    def call(self, func, *args):
+        """Run func(*args) on the loop without waiting for it."""
+        if self.in_loop():
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def spawn(self, coroutine):
+        """Schedule a coroutine on the running loop without waiting for it."""
+        if threading.current_thread() is self.thread:
+            self.loop.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, func, *args, timeout=None):
+        """
+        Run func(*args) on the loop and wait for its result.
+
+        Args:
+            func (callable): The function to run.
+            timeout (float): Maximum seconds to wait, or None to wait forever.
+
+        Returns:
+            The function's return value.
+        """
+        if self.in_loop():
+            return func(*args)
+
+        async def invoke():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(invoke(), self.loop).result(timeout)
+
+    def probe_durations(self, paths, timeout=None):
+        """
+        Probe the durations of several files concurrently on the loop. Called from worker threads.
+
+        Args:
+            paths (list): The media files.
+            timeout (float): Seconds after which a single probe is abandoned (default PROBE_TIMEOUT).
+
+        Returns:
+            list: The durations in seconds (None where unknown), in the order of `paths`.
+        """
+        timeout = timeout or PROBE_TIMEOUT
+
+        async def probe_all():
+            semaphore = asyncio.Semaphore(self.max_concurrent_probes)
+
+            async def probe(path):
+                async with semaphore:
+                    return await probe_duration_async(path, timeout)
+            return await asyncio.gather(*(probe(path) for path in paths))
+        if self.thread is None:
+            return [probe_duration(path, timeout) for path in paths]
+        return asyncio.run_coroutine_threadsafe(probe_all(), self.loop).result()
+
+
+class ScandirPollingObserver:
+    """
+    A polling observer for network shares and removable media.
+
+    Native file system notifications are unreliable on SMB/NFS mounts, so this
+    observer diffs os.scandir listings instead. Each file is known by its inode,
+    size and mtime, so new files, replaced files and files rewritten in place are
+    all noticed; they are reported through on_created once their signature stops
+    changing between polls (i.e. the copy finished). On Windows scandir returns
+    the stat result with the listing; elsewhere it costs one stat per file.
+    The poll interval shrinks while files are arriving and backs off when idle.
+
+    Offers the subset of the watchdog Observer API used by the application.
+    """
+
+    def __init__(self, min_interval=2.0, max_interval=60.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        # One entry per scheduled directory: handler, path, recursive flag and its snapshot
+        self.watches = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def schedule(self, event_handler, path, recursive=False):
+        """
+        Watch a directory. Files already present are taken as the baseline and not reported.
+
+        The baseline is listed on the polling thread, since a large share can take a
+        while to list and schedule() is called from the thread starting monitoring.
+
+        Args:
+            event_handler (FileSystemEventHandler): Receives on_created for new files.
+            path (str): The directory to watch.
+            recursive (bool): Whether to watch subdirectories too.
+        """
+        watch = {
+            'handler': event_handler,
+            'path': path,
+            'recursive': recursive,
+            # Settled files: path -> (inode, size, mtime_ns)
+            'snapshot': {},
+            # Files still being written: path -> (inode, size, mtime_ns) from the last poll
+            'pending': {},
+            # Whether the baseline listing has been taken
+            'ready': False,
+        }
+        self.watches.append(watch)
+
+    def start(self):
+        """Start polling on a background thread, unless nothing was scheduled."""
+        if not self.watches:
+            return
+        self.thread = threading.Thread(target=self._run, name="polling-observer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Ask the polling thread to finish."""
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        """Wait for the polling thread to finish."""
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            active = False
+            for watch in self.watches:
+                try:
+                    if not watch['ready']:
+                        self._scan(watch, report=False)
+                        watch['ready'] = True
+                        continue
+                    active = self._scan(watch, report=True) or active
+                except OSError as e:
+                    # The share may be temporarily unavailable; try again later
+                    logging.warning(f"Polling {watch['path']} failed: {e}")
+            # Poll quickly while files are arriving, back off while nothing changes
+            self.interval = self.min_interval if active else min(self.interval * 2, self.max_interval)
+            self.stop_event.wait(self.interval)
+
+    def _scan(self, watch, report):
+        """
+        Diff one watched directory against its snapshot.
+
+        Args:
+            watch (dict): The watch to scan.
+            report (bool): Send on_created for settled new or rewritten files (False for the baseline scan).
+
+        Returns:
+            bool: True if anything new was seen or is still being written.
+        """
+        snapshot = watch['snapshot']
+        pending = watch['pending']
+        seen = set()
+        created = []
+        directories = [watch['path']]
+        while directories:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if watch['recursive']:
+                            directories.append(entry.path)
+                        continue
+                    path = entry.path
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        # Deleted between the listing and the stat
+                        continue
+                    seen.add(path)
+                    signature = (entry.inode(), stat.st_size, stat.st_mtime_ns)
+                    if snapshot.get(path) == signature:
+                        # Unchanged file
+                        continue
+                    if not report:
+                        snapshot[path] = signature
+                        continue
+                    if pending.get(path) == signature:
+                        # Held still for a whole interval; the file is complete
+                        del pending[path]
+                        snapshot[path] = signature
+                        created.append(path)
+                    else:
+                        pending[path] = signature
+
+        # Forget files that disappeared
+        for path in snapshot.keys() - seen:
+            del snapshot[path]
+        for path in pending.keys() - seen:
+            del pending[path]
+
+        for path in sorted(created):
+            watch['handler'].on_created(FileCreatedEvent(path))
+        return bool(created or pending)
+
+class ClusterPolicy:
+    """Settings for sharing one archive between several joiner instances."""
+
+    def __init__(self, enabled=False, directory='', node_name='', lease_seconds=120):
+        # Whether segments are claimed through the shared lease queue before joining
+        self.enabled = enabled
+        # Directory on the shared filesystem holding the lease and node status files
+        self.directory = directory
+        # Name of this node in leases and status files (defaults to host name and process id)
+        self.node_name = node_name
+        # A lease not renewed for this long belongs to a dead node and is re-queued
+        self.lease_seconds = lease_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Cluster] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The loaded configuration.
+
+        Returns:
+            ClusterPolicy: The policy, using defaults for missing values.
+        """
+        if 'Cluster' not in config:
+            return cls()
+        section = config['Cluster']
+        policy = cls(
+            enabled=section.getboolean('enabled', fallback=False),
+            directory=section.get('directory', fallback=''),
+            node_name=section.get('node_name', fallback=''),
+            lease_seconds=section.getint('lease_seconds', fallback=120),
+        )
+        if policy.enabled and not policy.directory:
+            logging.warning("Cluster mode needs a shared directory; running standalone.")
+            policy.enabled = False
+        return policy
+
+    def to_config(self):
+        """Return the policy as a dict suitable for a ConfigParser section."""
+        return {
+            'enabled': str(self.enabled).lower(),
+            'directory': self.directory,
+            'node_name': self.node_name,
+            'lease_seconds': str(self.lease_seconds),
+        }
+
+
+class LeaseQueue:
+    """
+    Claims on the segments of a shared archive, kept as lockfiles on a shared filesystem.
+
+    A segment is claimed by creating `<directory>/leases/<key>.lease` with O_EXCL,
+    which is atomic on local disks, NFSv3+ and SMB, so every trip is joined by
+    exactly one node. The holder renews its leases by touching them; a lease whose
+    mtime is older than lease_seconds belongs to a dead node. The first node to
+    notice breaks it and rescans its watch roots, so the segments are grouped and
+    claimed again. Lease ages are measured against a file this node has just
+    touched, so only the file server's clock matters. While a node checks an
+    expired lease it holds `<key>.lease.reaping`; claims made meanwhile back off.
+
+    Every node also writes `<directory>/nodes/<node>.json` with its queued and
+    running jobs; read_status() collects them.
+    """
+
+    def __init__(self, policy, scheduler, on_requeue=None):
+        self.policy = policy
+        self.scheduler = scheduler
+        # Called (without arguments) after expired leases were broken
+        self.on_requeue = on_requeue
+        self.node = policy.node_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_dir = os.path.join(policy.directory, 'leases')
+        self.status_path = os.path.join(policy.directory, 'nodes', f"{self.node}.json")
+        # Keys of the leases this node holds
+        self.held = set()
+        self.completed = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Publish this node and start renewing leases and reaping expired ones."""
+        os.makedirs(self.lease_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(self.status_path), exist_ok=True)
+        self._write_status('running')
+        self.thread = threading.Thread(target=self._run, name="lease-queue", daemon=True)
+        self.thread.start()
+        logging.info(f"Joined cluster at {self.policy.directory} as node '{self.node}'.")
+
+    def stop(self):
+        """Stop renewing, hand back every lease still held and mark the node as stopped."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        with self.lock:
+            held = list(self.held)
+        self.release(held)
+        self._write_status('stopped')
+
+    def _lease_path(self, key):
+        # Keys contain paths and spaces; hash them into safe, fixed length file names
+        return os.path.join(self.lease_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lease')
+
+    def claim(self, keys):
+        """
+        Claim every key, or none of them.
+
+        Args:
+            keys (list): Lease keys, one per segment of the trip.
+
+        Returns:
+            bool: True if this node now holds all the leases.
+        """
+        acquired = []
+        # A fixed order keeps two nodes claiming overlapping groups from both getting half
+        for key in sorted(keys):
+            lease_path = self._lease_path(key)
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                self.release(acquired)
+                return False
+            with os.fdopen(fd, 'w') as lease:
+                json.dump({'node': self.node, 'key': key, 'claimed': datetime.datetime.now().isoformat()}, lease)
+            acquired.append(key)
+            # A reaper has moved the lease aside to check it and may be about to put it back
+            if os.path.exists(lease_path + '.reaping'):
+                self.release(acquired)
+                return False
+        with self.lock:
+            self.held.update(acquired)
+        return True
+
+    def held_elsewhere(self, keys):
+        """
+        Return the keys whose lease is held by another node.
+
+        Args:
+            keys (list): Lease keys to check.
+
+        Returns:
+            set: The keys with a lease file this node does not hold.
+        """
+        with self.lock:
+            mine = set(self.held)
+        return {key for key in keys if key not in mine and os.path.exists(self._lease_path(key))}
+
+    def release(self, keys):
+        """Give up leases, letting other nodes claim the keys."""
+        for key in keys:
+            with self.lock:
+                self.held.discard(key)
+            try:
+                os.remove(self._lease_path(key))
+            except FileNotFoundError:
+                pass
+
+    def finished(self, keys, succeeded):
+        """Record the outcome of a job and release its leases."""
+        with self.lock:
+            if succeeded:
+                self.completed += 1
+            else:
+                self.failed += 1
+        self.release(keys)
+
+    def _run(self):
+        # Renew well within the lease time so a busy file server does not expire live leases
+        while not self.stop_event.wait(self.policy.lease_seconds / 4):
+            try:
+                self._renew()
+                now = self._write_status('running')
+                self._reap(now)
+            except OSError as e:
+                # The share may be temporarily unavailable; try again on the next beat
+                logging.warning(f"Cluster heartbeat failed: {e}")
+
+    def _renew(self):
+        """Touch every lease this node holds."""
+        with self.lock:
+            held = list(self.held)
+        for key in held:
+            try:
+                os.utime(self._lease_path(key))
+            except FileNotFoundError:
+                # Broken by another node after we were unreachable for too long
+                logging.warning(f"Lost the lease on {key}.")
+
+    def _write_status(self, state):
+        """
+        Write this node's status file.
+
+        Returns:
+            float: The file's mtime, i.e. the current time on the file server.
+        """
+        with self.lock:
+            status = {
+                'node': self.node,
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'state': state,
+                'updated': datetime.datetime.now().isoformat(),
+                'leases': len(self.held),
+                'completed': self.completed,
+                'failed': self.failed,
+            }
+        status['jobs'] = self.scheduler.snapshot()
+        temp_path = self.status_path + '.tmp'
+        with open(temp_path, 'w') as status_file:
+            json.dump(status, status_file, indent=2)
+        os.replace(temp_path, self.status_path)
+        return os.stat(self.status_path).st_mtime
+
+    def _reap(self, now):
+        """Break leases that have not been renewed for lease_seconds and trigger a rescan."""
+        broken = 0
+        with os.scandir(self.lease_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.reaping'):
+                    # Left behind by a node that stopped while checking a lease
+                    with contextlib.suppress(OSError):
+                        if entry.stat().st_mtime + self.policy.lease_seconds < now:
+                            os.remove(entry.path)
+                    continue
+                if not entry.name.endswith('.lease'):
+                    continue
+                try:
+                    if entry.stat().st_mtime + self.policy.lease_seconds >= now:
+                        continue
+                except FileNotFoundError:
+                    continue
+                # One node at a time checks a lease; claims back off while the marker exists
+                marker_path = entry.path + '.reaping'
+                try:
+                    os.close(os.open(marker_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                except FileExistsError:
+                    continue
+                try:
+                    broken += self._break_lease(entry.path, now)
+                finally:
+                    os.remove(marker_path)
+        if broken:
+            logging.warning(f"Re-queued {broken} segment(s) whose node stopped renewing its leases.")
+            if self.on_requeue:
+                self.on_requeue()
+
+    def _break_lease(self, lease_path, now):
+        """
+        Remove a lease that has expired. The reaping marker must be held.
+
+        Returns:
+            int: 1 if the lease was broken, 0 if it was renewed or is gone.
+        """
+        # Only one node can rename the file, so only one node breaks the lease
+        stale_path = f"{lease_path}.{self.node}.stale"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            return 0
+        try:
+            if os.stat(stale_path).st_mtime + self.policy.lease_seconds < now:
+                return 1
+            # Renewed or re-claimed between the check and the rename; put it back. A claim
+            # made while it was moved aside sees the marker and removes its file again.
+            while True:
+                try:
+                    os.link(stale_path, lease_path)
+                    return 0
+                except FileExistsError:
+                    time.sleep(0.01)
+                except OSError:
+                    # No hard links on this share; the holder loses the lease
+                    return 0
+        finally:
+            os.remove(stale_path)
+
+    @staticmethod
+    def read_status(directory):
+        """
+        Collect the status files of every node sharing `directory`.
+
+        Args:
+            directory (str): The shared cluster directory.
+
+        Returns:
+            list: The status dicts, each with the age of the file in seconds added.
+        """
+        nodes = []
+        node_dir = os.path.join(directory, 'nodes')
+        if not os.path.isdir(node_dir):
+            return nodes
+        for name in sorted(os.listdir(node_dir)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(node_dir, name)
+            try:
+                with open(path) as status_file:
+                    status = json.load(status_file)
+                status['age_seconds'] = round(time.time() - os.path.getmtime(path), 1)
+            except (OSError, ValueError):
+                continue
+            nodes.append(status)
+        return nodes
+
+
+class ResourcePolicy:
+    """Resource limits the JoinScheduler enforces on every job it runs."""
+
+    # Mapping of the configurable I/O priority classes to `ionice -c` values
+    IO_PRIORITY_CLASSES = {'none': 0, 'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+    def __init__(self, encoder_threads=0, niceness=10, io_priority_class='best-effort',
+                 max_bandwidth_mbps=0.0, pause_load_threshold=0.0, min_workers=1, max_workers=2):
+        # Number of encoder threads passed to ffmpeg (0 lets ffmpeg decide)
+        self.encoder_threads = encoder_threads
+        # Niceness applied to each worker thread and inherited by its ffmpeg subprocesses
+        self.niceness = niceness
+        # I/O scheduling class for the worker threads ('none' leaves it unchanged)
+        self.io_priority_class = io_priority_class
+        # Combined read/write bandwidth cap in MB/s for ffmpeg outputs and staged moves
+        # (0 disables the cap); MoviePy compose joins are not paced
+        self.max_bandwidth_mbps = max_bandwidth_mbps
+        # New jobs wait while the 1-minute load average is above this value (0 disables)
+        self.pause_load_threshold = pause_load_threshold
+        # Bounds for the adaptive number of concurrently running jobs
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Resources] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            ResourcePolicy: The policy, with defaults for any missing option.
+        """
+        if 'Resources' not in config:
+            return cls()
+        section = config['Resources']
+        io_class = section.get('io_priority_class', fallback='best-effort').strip().lower()
+        if io_class not in cls.IO_PRIORITY_CLASSES:
+            logging.warning(f"Unknown I/O priority class '{io_class}', using 'best-effort'.")
+            io_class = 'best-effort'
+        return cls(
+            encoder_threads=section.getint('encoder_threads', fallback=0),
+            niceness=section.getint('niceness', fallback=10),
+            io_priority_class=io_class,
+            max_bandwidth_mbps=section.getfloat('max_bandwidth_mbps', fallback=0.0),
+            pause_load_threshold=section.getfloat('pause_load_threshold', fallback=0.0),
+            min_workers=section.getint('min_workers', fallback=1),
+            max_workers=section.getint('max_workers', fallback=2),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'encoder_threads': str(self.encoder_threads),
+            'niceness': str(self.niceness),
+            'io_priority_class': self.io_priority_class,
+            'max_bandwidth_mbps': str(self.max_bandwidth_mbps),
+            'pause_load_threshold': str(self.pause_load_threshold),
+            'min_workers': str(self.min_workers),
+            'max_workers': str(self.max_workers),
+        }
+
+    def apply_to_current_thread(self):
+        """
+        Lower the CPU and I/O priority of the calling worker thread.
+
+        On Linux both priorities are per-thread and are inherited by any ffmpeg
+        subprocess the thread starts, so MoviePy's encoder runs with the same limits.
+        Platforms without these facilities are left untouched.
+        """
+        thread_id = threading.get_native_id()
+        if self.niceness and hasattr(os, 'setpriority'):
+            try:
+                current = os.getpriority(os.PRIO_PROCESS, thread_id)
+                # Unprivileged users can only lower their priority, never raise it
+                if self.niceness > current:
+                    os.setpriority(os.PRIO_PROCESS, thread_id, self.niceness)
+            except OSError as e:
+                logging.warning(f"Could not set worker niceness: {e}")
+
+        io_class = self.IO_PRIORITY_CLASSES.get(self.io_priority_class, 0)
+        if io_class and shutil.which('ionice'):
+            try:
+                subprocess.run(['ionice', '-c', str(io_class), '-p', str(thread_id)],
+                               check=True, capture_output=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                logging.warning(f"Could not set worker I/O priority: {e}")
+
+
+class BandwidthLimiter:
+    """A token bucket that paces reads and writes to a maximum number of bytes per second."""
+
+    def __init__(self, max_bytes_per_second):
+        # Maximum sustained rate; 0 or less disables limiting
+        self.rate = max_bytes_per_second
+        # Tokens may accumulate up to one second worth of transfer
+        self.tokens = max_bytes_per_second
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, nbytes):
+        """
+        Charge `nbytes` against the rate without blocking.
+
+        Args:
+            nbytes (int): The number of bytes read or written (or about to be).
+
+        Returns:
+            float: Seconds the caller should pause to stay under the rate.
+        """
+        if self.rate <= 0 or nbytes <= 0:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            # Go into debt for the whole request; the caller sleeps off the deficit
+            self.tokens -= nbytes
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def consume(self, nbytes):
+        """
+        Block until `nbytes` may be transferred without exceeding the rate.
+
+        Args:
+            nbytes (int): The number of bytes about to be read or written.
+        """
+        delay = self.reserve(nbytes)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StoragePolicy:
+    """Disk space rules the JoinScheduler applies before admitting a job."""
+
+    def __init__(self, min_free_mb=512, staging_directory=None):
+        # Free space that must remain on a volume after a job's outputs are written
+        self.min_free_mb = min_free_mb
+        # Optional faster volume where outputs are written before moving into place
+        self.staging_directory = staging_directory or None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Storage] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            StoragePolicy: The policy, with defaults for any missing option.
+        """
+        if 'Storage' not in config:
+            return cls()
+        section = config['Storage']
+        return cls(
+            min_free_mb=section.getint('min_free_mb', fallback=512),
+            staging_directory=section.get('staging_directory', fallback='').strip(),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'min_free_mb': str(self.min_free_mb),
+            'staging_directory': self.staging_directory or '',
+        }
+
+
+# Estimated output size as a fraction of the total source size, per join mode.
+# A MoviePy re-encode lands close to the source bitrate, plus the temporary audio track.
+OUTPUT_SIZE_FACTORS = {
+    # Packet copy; the output is the sources rewrapped
+    'copy': 1.0,
+    'compose': 1.1,
+    # Single ffmpeg pass; previews and posters add a little on top of the main output
+    'transcode': 1.2,
+}
+
+# Join modes that can be selected in the configuration
+JOIN_MODES = ['compose', 'transcode', 'copy']
+
+# Rough source bytes joined per second, used by the planner until the catalog has a job history
+JOIN_THROUGHPUT_DEFAULTS = {
+    'copy': 100 * 1024 * 1024,
+    'compose': 4 * 1024 * 1024,
+    'transcode': 12 * 1024 * 1024,
+}
+
+
+def estimate_output_bytes(source_bytes, mode='compose'):
+    """
+    Estimate how many bytes a join will write.
+
+    Args:
+        source_bytes (int): Total size of the source clips.
+        mode (str): The join mode that will be used.
+
+    Returns:
+        int: The estimated size of the output plus any temporary files.
+    """
+    return int(source_bytes * OUTPUT_SIZE_FACTORS.get(mode, 1.0))
+
+
+def move_file(source, destination, limiter=None, chunk_size=4 * 1024 * 1024):
+    """
+    Move a file, pacing the copy through a BandwidthLimiter when it crosses volumes.
+
+    Args:
+        source (str): Path of the file to move.
+        destination (str): Target path.
+        limiter (BandwidthLimiter): Optional limiter charged for every chunk copied.
+        chunk_size (int): Copy buffer size in bytes.
+    """
+    try:
+        # Same volume: a rename is instant and needs no extra space
+        os.replace(source, destination)
+        return
+    except OSError:
+        pass
+    partial = destination + '.partial'
+    with open(source, 'rb') as src, open(partial, 'wb') as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            if limiter:
+                # Each chunk is read once and written once
+                limiter.consume(2 * len(chunk))
+            dst.write(chunk)
+    os.replace(partial, destination)
+    os.remove(source)
+
+
+def process_io_bytes(pid):
+    """
+    Return the bytes a process has read and written so far, or None where unknown.
+
+    Linux exposes the counters in /proc/<pid>/io; other platforms return None.
+    """
+    try:
+        with open(f"/proc/{pid}/io") as io_file:
+            counters = dict(line.split(':', 1) for line in io_file if ':' in line)
+        return int(counters['rchar']) + int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# Seconds between I/O samples of a paced ffmpeg process
+PACE_INTERVAL = 0.25
+
+
+def run_ffmpeg(command, limiter=None):
+    """
+    Run an ffmpeg command like subprocess.run(check=True, capture_output=True), pacing
+    its reads and writes through a BandwidthLimiter.
+
+    The process's I/O counters are sampled and charged to the limiter; whenever the
+    limiter is in debt the process is stopped until the deficit has passed, so the
+    actual streams are throttled. Without a limiter, or on platforms without the
+    counters or job control signals, the command runs unpaced.
+
+    Args:
+        command (list): The ffmpeg command line.
+        limiter (BandwidthLimiter): Optional limiter shared by every paced process.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process with its captured output.
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg exits with a nonzero status.
+    """
+    if limiter is None or limiter.rate <= 0 or not hasattr(signal, 'SIGSTOP'):
+        return subprocess.run(command, check=True, capture_output=True)
+    # Temporary files rather than pipes, so a stopped or chatty ffmpeg never blocks on them
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=stdout, stderr=stderr)
+        charged = 0
+        try:
+            while True:
+                try:
+                    process.wait(PACE_INTERVAL)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+                transferred = process_io_bytes(process.pid)
+                if transferred is None:
+                    # No counters to pace by; let it run to completion
+                    process.wait()
+                    break
+                delay = limiter.reserve(transferred - charged)
+                charged = transferred
+                if delay > 0:
+                    process.send_signal(signal.SIGSTOP)
+                    try:
+                        time.sleep(delay)
+                    finally:
+                        process.send_signal(signal.SIGCONT)
+        finally:
+            if process.poll() is None:
+                # Interrupted while pacing: do not leave a stopped ffmpeg behind
+                process.kill()
+                process.wait()
+        stdout.seek(0)
+        stderr.seek(0)
+        output, errors = stdout.read(), stderr.read()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, output, errors)
+    return subprocess.CompletedProcess(command, process.returncode, output, errors)
+
+
+# Directory for log output and saved profiles, next to the application
+LOG_DIR = os.path.join(APP_DIR, 'logs')
+
+# Per-thread stage timer of the job currently being profiled (if any)
+_profiling_state = threading.local()
+
+
+@contextlib.contextmanager
+def profile_stage(name):
+    """
+    Time a named stage of the current job when it is being profiled.
+
+    Outside a profiled job this costs one attribute lookup.
+
+    Args:
+        name (str): The stage name, e.g. 'write video'.
+    """
+    stages = getattr(_profiling_state, 'stages', None)
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - started
+
+
+class ProfilingPolicy:
+    """Which jobs are profiled."""
+
+    def __init__(self, enabled=False, job_kinds=('join',), top_allocations=15):
+        self.enabled = enabled
+        # Job kinds to profile: 'join', 'summary', 'archive', 'delete'
+        self.job_kinds = tuple(job_kinds)
+        # Number of allocation sites saved from the tracemalloc snapshot
+        self.top_allocations = top_allocations
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Profiling] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            ProfilingPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Profiling' not in config:
+            return cls()
+        section = config['Profiling']
+        kinds = section.get('job_kinds', fallback='join')
+        return cls(
+            enabled=section.getboolean('enabled', fallback=False),
+            job_kinds=[kind.strip() for kind in kinds.split(',') if kind.strip()],
+            top_allocations=section.getint('top_allocations', fallback=15),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'enabled': str(self.enabled).lower(),
+            'job_kinds': ', '.join(self.job_kinds),
+            'top_allocations': str(self.top_allocations),
+        }
+
+
+class JobProfiler:
+    """
+    Runs selected jobs under cProfile and tracemalloc and saves the results.
+
+    For each profiled job a .prof file (for pstats or snakeviz) and a .json
+    summary with the per-stage timings and memory peaks are written to
+    logs/profiles.
+    """
+
+    def __init__(self, policy, directory=None, override=False):
+        self.policy = policy
+        # Profile the policy's job kinds even when the policy is disabled (--profile)
+        self.override = override
+        self.directory = directory or os.path.join(LOG_DIR, 'profiles')
+        # tracemalloc is process-wide; it runs while at least one profiled job does
+        self.tracing_jobs = 0
+        self.lock = threading.Lock()
+
+    def wants(self, job):
+        """Return True if the job should be profiled."""
+        return (self.policy.enabled or self.override) and job.kind in self.policy.job_kinds
+
+    def run(self, job):
+        """
+        Run a job under the profilers and save the results.
+
+        Args:
+            job (Job): The job to run. Exceptions propagate to the caller after saving.
+        """
+        with self.lock:
+            if self.tracing_jobs == 0:
+                tracemalloc.start()
+            self.tracing_jobs += 1
+            tracemalloc.reset_peak()
+
+        import cProfile  # Only loaded when profiling is actually used
+
+        _profiling_state.stages = {}
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        error = None
+        try:
+            profiler.runcall(job.func, *job.args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            total = time.perf_counter() - started
+            stages = _profiling_state.stages
+            _profiling_state.stages = None
+            with self.lock:
+                current, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+                self.tracing_jobs -= 1
+                if self.tracing_jobs == 0:
+                    tracemalloc.stop()
+            self._save(job, profiler, stages, total, peak, snapshot, error)
+
+    def _save(self, job, profiler, stages, total, peak, snapshot, error):
+        """Write the .prof and .json files for a finished job."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            base = os.path.join(self.directory, f"{datetime.datetime.now():%Y%m%d-%H%M%S}_job{job.job_id}_{job.kind}")
+            profiler.dump_stats(base + '.prof')
+
+            import pstats
+
+            stats = pstats.Stats(profiler)
+            # Probing happens inside MoviePy's clip constructor; pull it out of the profile
+            probe_seconds = sum(entry[3] for func, entry in stats.stats.items() if func[2] == 'ffmpeg_parse_infos')
+            if probe_seconds:
+                stages['probe'] = probe_seconds
+
+            summary = {
+                'job': job.name,
+                'kind': job.kind,
+                'status': 'failed' if error else 'done',
+                'error': str(error) if error else None,
+                'total_seconds': total,
+                'stages': stages,
+                'unaccounted_seconds': max(0.0, total - sum(v for k, v in stages.items() if k != 'probe')),
+                # tracemalloc is process-wide, so overlapping jobs share these figures
+                'python_peak_bytes': peak,
+                'top_allocations': [
+                    {'site': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.policy.top_allocations]
+                ],
+            }
+            with open(base + '.json', 'w') as summary_file:
+                json.dump(summary, summary_file, indent=2)
+            logging.info(f"Profile for job {job.job_id} saved to {base}.prof")
+        except Exception as e:
+            logging.error(f"Could not save profile for job {job.job_id}: {e}")
+
+
+class Job:
+    """A unit of work queued on the JoinScheduler."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, func, args=(), priority=0, source_bytes=0, space_needs=None, kind='job'):
+        # Unique, increasing job id (also used to keep FIFO order within a priority)
+        self.job_id = next(self._ids)
+        self.name = name
+        # Category of work, e.g. 'join' or 'summary', used to select jobs for profiling
+        self.kind = kind
+        self.func = func
+        self.args = args
+        # Lower numbers run first
+        self.priority = priority
+        # Total size of the files the job reads, used for pacing and throughput stats
+        self.source_bytes = source_bytes
+        # List of (directory, bytes) the job will write before it finishes
+        self.space_needs = space_needs or []
+        self.status = 'queued'
+        # Set once the job has been held back for lack of disk space
+        self.held_for_space = False
+        # Wall clock time the job started running
+        self.started_at = None
+
+    def total_space_needed(self):
+        """Return the total number of bytes the job will write."""
+        return sum(nbytes for _, nbytes in self.space_needs)
+
+    def __lt__(self, other):
+        return (self.priority, self.job_id) < (other.priority, other.job_id)
+
+
+class JoinScheduler:
+    """
+    Runs join jobs on a pool of worker threads under a ResourcePolicy.
+
+    The number of jobs allowed to run at once adapts between the policy's
+    min_workers and max_workers based on measured throughput and load average.
+    """
+
+    # Seconds between load average checks while the scheduler is paused for load
+    LOAD_POLL_INTERVAL = 5
+    # Seconds between free space checks while jobs are held back for disk space
+    SPACE_POLL_INTERVAL = 30
+
+    def __init__(self, policy, storage=None, profiler=None):
+        self.policy = policy
+        self.storage = storage or StoragePolicy()
+        # Optional JobProfiler wrapping selected jobs
+        self.profiler = profiler
+        # Bytes promised to running jobs, per volume (st_dev), but not yet written
+        self.reserved_bytes = collections.Counter()
+        self.limiter = BandwidthLimiter(policy.max_bandwidth_mbps * 1024 * 1024)
+        # Pending jobs ordered by (priority, job id)
+        self.pending = []
+        # Jobs currently executing
+        self.running = set()
+        # Number of jobs allowed to run concurrently right now
+        self.target_workers = policy.min_workers
+        # Recently finished jobs as (finish time, bytes, seconds) for throughput estimates
+        self.recent_results = collections.deque(maxlen=20)
+        self.last_throughput = None
+        self.condition = threading.Condition()
+        self.workers = []
+        self.stopping = False
+        # Set through the control API; queued jobs wait while paused, running jobs continue
+        self.paused = False
+
+    def start(self):
+        """Start the worker threads."""
+        for index in range(self.policy.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"join-worker-{index + 1}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting work. Queued jobs are dropped; running jobs are allowed to finish.
+
+        Args:
+            wait (bool): Whether to block until the running jobs complete.
+        """
+        with self.condition:
+            self.stopping = True
+            dropped = len(self.pending)
+            self.pending.clear()
+            self.condition.notify_all()
+        if dropped:
+            logging.info(f"Dropped {dropped} queued job(s) on shutdown.")
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def submit(self, name, func, args=(), priority=0, source_bytes=0, space_needs=None, kind='job'):
+        """
+        Queue a job for execution.
+
+        Args:
+            name (str): A human readable description used in log messages.
+            func (callable): The function to run on a worker thread.
+            args (tuple): Positional arguments for `func`.
+            priority (int): Lower values run first.
+            source_bytes (int): Bytes the job will read, used for throughput estimates.
+            space_needs (list): (directory, bytes) pairs the job will write, used for admission control.
+            kind (str): Category of work, used to select jobs for profiling.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = Job(name, func, args, priority, source_bytes, space_needs, kind)
+        with self.condition:
+            heapq.heappush(self.pending, job)
+            self.condition.notify()
+        logging.info(f"Queued job {job.job_id}: {name}")
+        return job
+
+    def set_paused(self, paused):
+        """
+        Hold back (True) or release (False) the queued jobs. Running jobs are not interrupted.
+
+        Args:
+            paused (bool): The new state.
+        """
+        with self.condition:
+            self.paused = paused
+            self.condition.notify_all()
+        logging.info("Scheduler paused." if paused else "Scheduler resumed.")
+
+    def wait_until_idle(self, timeout=None):
+        """
+        Block until no jobs are pending or running.
+
+        Args:
+            timeout (float): Maximum seconds to wait, or None to wait forever.
+
+        Returns:
+            bool: True if the scheduler became idle, False on timeout.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.running, timeout)
+
+    def queue_depth(self):
+        """Return the number of jobs waiting to run."""
+        with self.condition:
+            return len(self.pending)
+
+    def snapshot(self):
+        """
+        Describe the running and queued jobs.
+
+        Returns:
+            list: One dict per job, running jobs first.
+        """
+        with self.condition:
+            jobs = sorted(self.running, key=lambda job: job.job_id) + sorted(self.pending)
+        return [{
+            'id': job.job_id,
+            'name': job.name,
+            'kind': job.kind,
+            'status': job.status,
+            'elapsed_seconds': round(time.time() - job.started_at, 1) if job.started_at else 0,
+        } for job in jobs]
+
+    def _load_average(self):
+        """Return the 1-minute load average, or None where it is unavailable."""
+        if hasattr(os, 'getloadavg'):
+            try:
+                return os.getloadavg()[0]
+            except OSError:
+                return None
+        return None
+
+    def _wait_for_load(self):
+        """Block while the system load is above the policy's pause threshold."""
+        threshold = self.policy.pause_load_threshold
+        if threshold <= 0:
+            return
+        announced = False
+        while not self.stopping:
+            load = self._load_average()
+            if load is None or load <= threshold:
+                break
+            if not announced:
+                logging.info(f"Load average {load:.2f} above {threshold}; pausing new jobs.")
+                announced = True
+            time.sleep(self.LOAD_POLL_INTERVAL)
+
+    def _free_bytes(self, directory, volumes=None):
+        """
+        Return the usable free space for new writes on the volume holding `directory`.
+
+        Args:
+            directory (str): Any directory on the volume.
+            volumes (dict): Cache shared by the checks of one pick, so each directory is
+                stat'ed and each volume measured once: directory -> volume id, volume id -> free bytes.
+
+        Returns:
+            tuple: (volume id, bytes available after reservations and the safety margin).
+        """
+        if volumes is None:
+            volumes = {}
+        device = volumes.get(directory)
+        if device is None:
+            device = volumes[directory] = os.stat(directory).st_dev
+        free = volumes.get(device)
+        if free is None:
+            free = volumes[device] = shutil.disk_usage(directory).free
+        margin = self.storage.min_free_mb * 1024 * 1024
+        return device, free - self.reserved_bytes[device] - margin
+
+    def _fits(self, job, volumes=None):
+        """Return True if every volume the job writes to has room for it. Condition must be held."""
+        needed = collections.Counter()
+        available = {}
+        for directory, nbytes in job.space_needs:
+            try:
+                device, free = self._free_bytes(directory, volumes)
+            except OSError:
+                # Let the job run and report the real error if the directory is gone
+                continue
+            needed[device] += nbytes
+            available[device] = free
+        return all(needed[device] <= available[device] for device in needed)
+
+    def _space_is_low(self, volumes=None):
+        """Return True if the pending jobs together would not fit on disk. Condition must be held."""
+        needed = collections.Counter()
+        available = {}
+        for job in self.pending:
+            for directory, nbytes in job.space_needs:
+                try:
+                    device, free = self._free_bytes(directory, volumes)
+                except OSError:
+                    continue
+                needed[device] += nbytes
+                available[device] = free
+        return any(needed[device] > available[device] for device in needed)
+
+    def _pick_admissible(self):
+        """
+        Remove and return the next pending job that fits on disk. Condition must be held.
+
+        Jobs normally run in priority order. When space is tight the smallest jobs go
+        first so that as much work as possible completes before the disk fills up.
+        """
+        candidates = sorted(self.pending)
+        # Free space is measured once per volume for the whole pick
+        volumes = {}
+        if self._space_is_low(volumes):
+            candidates.sort(key=lambda job: (job.total_space_needed(), job))
+        for job in candidates:
+            if self._fits(job, volumes):
+                self.pending.remove(job)
+                heapq.heapify(self.pending)
+                return job
+            if not job.held_for_space:
+                job.held_for_space = True
+                logging.warning(f"Holding back job {job.job_id} ({job.name}): not enough free disk space.")
+        return None
+
+    def _reserve(self, job, sign):
+        """Add (sign=1) or release (sign=-1) a job's disk space reservation. Condition must be held."""
+        for directory, nbytes in job.space_needs:
+            try:
+                device = os.stat(directory).st_dev
+            except OSError:
+                continue
+            self.reserved_bytes[device] += sign * nbytes
+
+    def _next_job(self):
+        """Wait for a job that may start under the current concurrency target and fits on disk."""
+        with self.condition:
+            while True:
+                if self.stopping:
+                    return None
+                if self.pending and not self.paused and len(self.running) < self.target_workers:
+                    job = self._pick_admissible()
+                    if job is not None:
+                        self._reserve(job, 1)
+                        self.running.add(job)
+                        return job
+                    # Everything pending is held back; look again once space may have freed up
+                    self.condition.wait(self.SPACE_POLL_INTERVAL)
+                else:
+                    self.condition.wait()
+
+    def _worker_loop(self):
+        """Main loop of a worker thread."""
+        self.policy.apply_to_current_thread()
+        while True:
+            self._wait_for_load()
+            job = self._next_job()
+            if job is None:
+                return
+            self._run_job(job)
+
+    def _run_job(self, job):
+        """Execute a single job and feed its result into the concurrency controller."""
+        job.status = 'running'
+        job.started_at = time.time()
+        # Tag every log record of this job with its id
+        token = correlation_id.set(f"job-{job.job_id}")
+        logging.info(f"Starting job {job.job_id}: {job.name}")
+        started = time.monotonic()
+        try:
+            if self.profiler and self.profiler.wants(job):
+                self.profiler.run(job)
+            else:
+                job.func(*job.args)
+            job.status = 'done'
+        except Exception as e:
+            job.status = 'failed'
+            logging.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+        elapsed = time.monotonic() - started
+        with self.condition:
+            self.running.discard(job)
+            self._reserve(job, -1)
+            # Jobs that read no source (deletions, summaries) say nothing about join throughput
+            if job.source_bytes:
+                self.recent_results.append((time.monotonic(), job.source_bytes, elapsed))
+                self._adapt_concurrency()
+            self.condition.notify_all()
+        logging.info(f"Finished job {job.job_id} in {elapsed:.1f}s ({job.status}).")
+        correlation_id.reset(token)
+
+    def _recent_throughput(self):
+        """Return the aggregate throughput in bytes per second over the recent results."""
+        if not self.recent_results:
+            return 0.0
+        window_start = min(finished - elapsed for finished, _, elapsed in self.recent_results)
+        window = max(time.monotonic() - window_start, 1e-6)
+        return sum(nbytes for _, nbytes, _ in self.recent_results) / window
+
+    def _adapt_concurrency(self):
+        """
+        Hill-climb the concurrency target. Must be called with the condition held.
+
+        More workers are allowed while aggregate throughput keeps improving and the
+        machine has headroom; the target backs off when throughput drops or load rises.
+        """
+        load = self._load_average()
+        ceiling = self.policy.pause_load_threshold or (os.cpu_count() or 1)
+        throughput = self._recent_throughput()
+        previous = self.last_throughput
+        self.last_throughput = throughput
+
+        if load is not None and load > ceiling * 0.8:
+            new_target = self.target_workers - 1
+        elif previous is None or throughput >= previous * 1.05:
+            new_target = self.target_workers + 1
+        elif throughput < previous * 0.95:
+            new_target = self.target_workers - 1
+        else:
+            new_target = self.target_workers
+        new_target = max(self.policy.min_workers, min(self.policy.max_workers, new_target))
+        if new_target != self.target_workers:
+            logging.info(f"Adjusting concurrent jobs from {self.target_workers} to {new_target} "
+                         f"(throughput {throughput / 1048576:.1f} MB/s, load {load}).")
+            self.target_workers = new_target
+
+# Container format names ffmpeg expects for each supported extension
+CONTAINER_FORMATS = {
+    '.mp4': 'mp4',
+    '.mov': 'mov',
+    '.avi': 'avi',
+    '.mkv': 'matroska',
+    '.ts': 'mpegts',
+}
+
+
+def get_ffmpeg_exe():
+    """
+    Locate the ffmpeg binary, preferring the one bundled with MoviePy.
+
+    Returns:
+        str: Path to the ffmpeg executable.
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which('ffmpeg') or 'ffmpeg'
+
+
+def ffmpeg_stderr(error):
+    """Return the last lines ffmpeg wrote to stderr before a CalledProcessError, for the job log."""
+    stderr = error.stderr or b''
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode('utf-8', 'replace')
+    return ' | '.join(stderr.strip().splitlines()[-5:]) or f"exit status {error.returncode}"
+
+
+def write_concat_list(video_paths):
+    """
+    Write an ffmpeg concat demuxer list for the given clips.
+
+    Args:
+        video_paths (list): Paths of the clips in playback order.
+
+    Returns:
+        str: Path of the temporary list file. The caller deletes it.
+    """
+    fd, list_path = tempfile.mkstemp(suffix='.txt', prefix='concat_')
+    with os.fdopen(fd, 'w', encoding='utf-8') as list_file:
+        for path in video_paths:
+            # Single quotes inside a path are escaped as '\'' for the concat demuxer
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    return list_path
+
+
+# Seconds after which a media probe is abandoned, and how many probes may run at once
+PROBE_TIMEOUT = 30
+PROBE_CONCURRENCY = 8
+
+
+def parse_duration(ffmpeg_output):
+    """
+    Read a duration from the header ffmpeg prints for an input.
+
+    Args:
+        ffmpeg_output (str): ffmpeg's stderr.
+
+    Returns:
+        float or None: The duration in seconds, or None if it is unknown.
+    """
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", ffmpeg_output)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_duration(path, timeout=PROBE_TIMEOUT):
+    """
+    Read a media file's duration from the header ffmpeg prints.
+
+    Args:
+        path (str): The media file.
+        timeout (float): Seconds after which the probe is abandoned.
+
+    Returns:
+        float or None: The duration in seconds, or None if it is unknown.
+    """
+    try:
+        result = subprocess.run([get_ffmpeg_exe(), '-hide_banner', '-i', path], capture_output=True, text=True,
+                                timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Probing {path} timed out after {timeout}s.")
+        return None
+    return parse_duration(result.stderr)
+
+
+async def probe_duration_async(path, timeout=PROBE_TIMEOUT):
+    """
+    Asyncio version of probe_duration, run as a managed subprocess on the engine loop.
+
+    Args:
+        path (str): The media file.
+        timeout (float): Seconds after which the probe is killed.
+
+    Returns:
+        float or None: The duration in seconds, or None if it is unknown.
+    """
+    process = await asyncio.create_subprocess_exec(
+        get_ffmpeg_exe(), '-hide_banner', '-i', path,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        logging.warning(f"Probing {path} timed out after {timeout}s.")
+        return None
+    return parse_duration(stderr.decode('utf-8', errors='replace'))
+
+
+
+def parse_extensions(value):
+    """
+    Split a comma separated extension setting such as '.ts, .mp4' into a tuple.
+
+    Args:
+        value (str): The setting.
+
+    Returns:
+        tuple: Lower case extensions, each with a leading dot.
+    """
+    extensions = []
+    for extension in value.split(','):
+        extension = extension.strip().lower()
+        if extension:
+            extensions.append(extension if extension.startswith('.') else '.' + extension)
+    return tuple(extensions) or ('.mp4',)
+
+
+# Codecs each container accepts without re-encoding (None: anything ffmpeg can mux)
+COPY_CODECS = {
+    'mp4': {'video': {'h264', 'hevc', 'mpeg4', 'av1'}, 'audio': {'aac', 'mp3', 'alac', 'ac3'}},
+    'mov': {'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, 'audio': {'aac', 'mp3', 'alac', 'pcm_s16le'}},
+    'mpegts': {'video': {'h264', 'hevc', 'mpeg2video'}, 'audio': {'aac', 'mp3', 'ac3', 'mp2'}},
+    'matroska': None,
+    'avi': None,
+}
+
+
+def probe_streams(path, timeout=PROBE_TIMEOUT):
+    """
+    Describe the container and first video and audio stream of a media file from ffmpeg's header output.
+
+    Everything the concat demuxer needs to match for a packet copy is included: the
+    container decides how H.264 is framed (Annex-B in MPEG-TS, avcC in MP4), and a
+    change of pixel format, sample rate or channel layout mid-file breaks players.
+
+    Args:
+        path (str): The media file.
+        timeout (float): Seconds after which the probe is abandoned.
+
+    Returns:
+        dict or None: {'container', 'video' (codec), 'pix_fmt', 'size' ('WxH'), 'audio' (codec or None),
+        'audio_rate', 'audio_layout'}, or None if unreadable.
+    """
+    try:
+        result = subprocess.run([get_ffmpeg_exe(), '-hide_banner', '-i', path], capture_output=True, text=True,
+                                timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Probing {path} timed out after {timeout}s.")
+        return None
+    container = re.search(r"Input #0, ([\w,]+), from", result.stderr)
+    video = re.search(r"Stream #.*?: Video: (\w+).*?, (\w+)(?:\([^)]*\))?, (\d{2,5}x\d{2,5})", result.stderr)
+    if not video:
+        return None
+    audio = re.search(r"Stream #.*?: Audio: (\w+)(?:.*?, (\d+) Hz, ([^,\n]+))?", result.stderr)
+    return {
+        'container': container.group(1) if container else None,
+        'video': video.group(1),
+        'pix_fmt': video.group(2),
+        'size': video.group(3),
+        'audio': audio.group(1) if audio else None,
+        'audio_rate': audio.group(2) if audio else None,
+        'audio_layout': audio.group(3) if audio else None,
+    }
+
+
+def copy_blocker(streams, container):
+    """
+    Explain why clips cannot be joined by packet copy into a container.
+
+    Args:
+        streams (list): probe_streams() of each clip, in order.
+        container (str): ffmpeg format name of the output.
+
+    Returns:
+        str or None: The reason, or None if a packet copy is possible.
+    """
+    if any(stream is None for stream in streams):
+        return "Could not probe every clip"
+    differing = sorted({key for stream in streams for key in stream if stream[key] != streams[0][key]})
+    if differing:
+        return f"Clips differ in {', '.join(differing)}"
+    allowed = COPY_CODECS.get(container)
+    if allowed and (streams[0]['video'] not in allowed['video'] or
+                    (streams[0]['audio'] and streams[0]['audio'] not in allowed['audio'])):
+        return f"{container} cannot hold {streams[0]['video']}/{streams[0]['audio']} without re-encoding"
+    return None
+
+
+# Space reserved at the front of MP4/MOV outputs for the index: a fixed part plus
+# a per-second allowance large enough for 60 fps video with AAC audio
+MOOV_RESERVE_BASE = 64 * 1024
+MOOV_RESERVE_PER_SECOND = 3 * 1024
+
+
+def moov_reserve_bytes(duration):
+    """Return the bytes to reserve for the MP4 index of a video of `duration` seconds."""
+    return int(MOOV_RESERVE_BASE + MOOV_RESERVE_PER_SECOND * duration)
+
+
+def mp4_boxes(path):
+    """
+    List the top level boxes of an MP4/MOV file without reading the media data.
+
+    Args:
+        path (str): The video file.
+
+    Returns:
+        list: (type, offset, size) for each box, in file order.
+    """
+    boxes = []
+    with open(path, 'rb') as video_file:
+        file_size = os.fstat(video_file.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size:
+            video_file.seek(offset)
+            header = video_file.read(16)
+            size, kind = struct.unpack('>I4s', header[:8])
+            header_size = 8
+            if size == 1 and len(header) == 16:
+                size = struct.unpack('>Q', header[8:16])[0]
+                header_size = 16
+            elif size == 0:
+                # The last box runs to the end of the file
+                size = file_size - offset
+            if size < header_size:
+                break
+            boxes.append((kind.decode('latin-1'), offset, size))
+            offset += size
+    return boxes
+
+
+def mp4_is_intact(path):
+    """Return True if an MP4/MOV file has an index and media box and its boxes exactly fill the file."""
+    boxes = mp4_boxes(path)
+    kinds = {kind for kind, _, _ in boxes}
+    return {'moov', 'mdat'} <= kinds and boxes[-1][1] + boxes[-1][2] == os.path.getsize(path)
+
+
+def _child_boxes(data, start, end):
+    """Yield (type, payload start, payload end) of the boxes nested in data[start:end]."""
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            return
+        yield kind.decode('latin-1'), offset + header_size, offset + size
+        offset += size
+
+
+def _find_box(data, start, end, *path):
+    """Return the (payload start, payload end) of the box at `path` below data[start:end], or None."""
+    for kind, payload_start, payload_end in _child_boxes(data, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return payload_start, payload_end
+            return _find_box(data, payload_start, payload_end, *path[1:])
+    return None
+
+
+def _table(data, box, entry_format, header=8):
+    """Read the entries of a sample table box: a count at header-4 followed by fixed size entries."""
+    if box is None:
+        return None
+    count = struct.unpack_from('>I', data, box[0] + header - 4)[0]
+    if len(set(entry_format)) == 1:
+        return struct.unpack_from(f">{count * len(entry_format)}{entry_format[0]}", data, box[0] + header)
+    # Mixed fields, e.g. unsigned counts with signed offsets
+    return struct.unpack_from('>' + entry_format * count, data, box[0] + header)
+
+
+def mp4_keyframe_index(path):
+    """
+    Build a seek index of the video track of an MP4/MOV file from its sample tables.
+
+    Only the `moov` box is read, so this costs the same for a one minute clip as
+    for a multi-hour trip's media data.
+
+    Args:
+        path (str): The video file.
+
+    Returns:
+        dict or None: 'duration' in seconds, 'faststart' (index ahead of the media)
+        and 'keyframes' as [presentation time in seconds, byte offset] pairs;
+        None if the file has no readable video track.
+    """
+    boxes = mp4_boxes(path)
+    moov = next(((offset, size) for kind, offset, size in boxes if kind == 'moov'), None)
+    mdat = next((offset for kind, offset, size in boxes if kind == 'mdat'), None)
+    if moov is None:
+        return None
+    with open(path, 'rb') as video_file:
+        video_file.seek(moov[0])
+        data = video_file.read(moov[1])
+
+    for kind, start, end in _child_boxes(data, 8, len(data)):
+        if kind != 'trak':
+            continue
+        hdlr = _find_box(data, start, end, 'mdia', 'hdlr')
+        if hdlr is None or data[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        mdhd = _find_box(data, start, end, 'mdia', 'mdhd')
+        if mdhd is None:
+            return None
+        if data[mdhd[0]] == 1:
+            timescale, track_duration = struct.unpack_from('>IQ', data, mdhd[0] + 20)
+        else:
+            timescale, track_duration = struct.unpack_from('>II', data, mdhd[0] + 12)
+        stbl = _find_box(data, start, end, 'mdia', 'minf', 'stbl')
+        if stbl is None or not timescale:
+            return None
+        # The edit list shifts presentation back by the encoder delay (B-frame reordering)
+        start_offset = 0
+        elst = _find_box(data, start, end, 'edts', 'elst')
+        if elst is not None:
+            entry_format = '>Qq' if data[elst[0]] == 1 else '>Ii'
+            entry_size = struct.calcsize(entry_format) + 4
+            for entry in range(struct.unpack_from('>I', data, elst[0] + 4)[0]):
+                media_time = struct.unpack_from(entry_format, data, elst[0] + 8 + entry * entry_size)[1]
+                # -1 marks an empty edit (a gap before the media starts)
+                if media_time >= 0:
+                    start_offset = media_time
+                    break
+
+        def table(name, entry_format, header=8):
+            return _table(data, _find_box(data, stbl[0], stbl[1], name), entry_format, header)
+
+        time_deltas = table('stts', 'II')
+        # Without a sync sample table every sample is a keyframe
+        sync_samples = table('stss', 'I')
+        sync_samples = set(sync_samples) if sync_samples is not None else None
+        # Version 1 composition offsets are signed
+        ctts = _find_box(data, stbl[0], stbl[1], 'ctts')
+        composition = _table(data, ctts, 'Ii' if ctts and data[ctts[0]] == 1 else 'II')
+        chunk_runs = table('stsc', 'III')
+        # 32-bit chunk offsets, or 64-bit ones in files over 4 GB (an empty stco is still an stco)
+        chunk_offsets = table('stco', 'I')
+        if chunk_offsets is None:
+            chunk_offsets = table('co64', 'Q')
+        stsz = _find_box(data, stbl[0], stbl[1], 'stsz')
+        # Compact sample sizes (stz2) are not supported
+        if time_deltas is None or chunk_runs is None or chunk_offsets is None or stsz is None:
+            return None
+        constant_size, sample_count = struct.unpack_from('>II', data, stsz[0] + 4)
+        sample_sizes = (struct.unpack_from(f">{sample_count}I", data, stsz[0] + 12)
+                        if constant_size == 0 else None)
+
+        def expand(pairs):
+            # Run length (count, value) pairs to one value per sample
+            for run in range(0, len(pairs), 2):
+                for _ in range(pairs[run]):
+                    yield pairs[run + 1]
+
+        deltas = expand(time_deltas)
+        offsets = expand(composition) if composition else None
+        keyframes = []
+        sample = 1
+        decode_time = 0
+        for chunk in range(1, len(chunk_offsets) + 1):
+            # stsc lists the first chunk of each run of chunks with the same sample count
+            run = bisect.bisect_right(chunk_runs[0::3], chunk) - 1
+            byte_offset = chunk_offsets[chunk - 1]
+            for _ in range(chunk_runs[run * 3 + 1]):
+                if sample > sample_count:
+                    break
+                composition_offset = next(offsets, 0) if offsets else 0
+                if sync_samples is None or sample in sync_samples:
+                    presentation_time = max(decode_time + composition_offset - start_offset, 0)
+                    keyframes.append([round(presentation_time / timescale, 3), byte_offset])
+                byte_offset += sample_sizes[sample - 1] if sample_sizes else constant_size
+                decode_time += next(deltas, 0)
+                sample += 1
+        return {
+            'duration': round(track_duration / timescale, 3),
+            'faststart': mdat is None or moov[0] < mdat,
+            'keyframes': keyframes,
+        }
+    return None
+
+
+def keyframe_index_path(path):
+    """Return the path of the keyframe index sidecar of a joined video."""
+    return f"{os.path.splitext(path)[0]}.keyframes.json"
+
+
+def write_keyframe_index(path):
+    """
+    Write the keyframe index sidecar of an MP4/MOV video.
+
+    Args:
+        path (str): The video file.
+
+    Returns:
+        str or None: The sidecar path, or None if the container has no sample tables to index.
+    """
+    if CONTAINER_FORMATS.get(os.path.splitext(path)[1].lower()) not in ('mp4', 'mov'):
+        return None
+    index = mp4_keyframe_index(path)
+    if index is None:
+        logging.warning(f"No video track to index in {path}")
+        return None
+    index['path'] = os.path.basename(path)
+    index_path = keyframe_index_path(path)
+    with open(index_path, 'w') as index_file:
+        json.dump(index, index_file)
+    logging.info(f"Keyframe index written: {index_path} ({len(index['keyframes'])} keyframes)")
+    return index_path
+
+class SummaryPolicy:
+    """Settings for the keyframe-only trip summaries written next to joined files."""
+
+    def __init__(self, enabled=False, timelapse=True, contact_sheet=True, columns=4, rows=4,
+                 height=360, fps=10):
+        self.enabled = enabled
+        # Write a timelapse made of every keyframe in the trip
+        self.timelapse = timelapse
+        # Write a single image tiling evenly spaced keyframes
+        self.contact_sheet = contact_sheet
+        self.columns = columns
+        self.rows = rows
+        # Height of timelapse frames and contact sheet tiles
+        self.height = height
+        # Playback rate of the timelapse, in keyframes per second
+        self.fps = fps
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Summary] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            SummaryPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Summary' not in config:
+            return cls()
+        section = config['Summary']
+        return cls(
+            enabled=section.getboolean('enabled', fallback=False),
+            timelapse=section.getboolean('timelapse', fallback=True),
+            contact_sheet=section.getboolean('contact_sheet', fallback=True),
+            columns=section.getint('columns', fallback=4),
+            rows=section.getint('rows', fallback=4),
+            height=section.getint('height', fallback=360),
+            fps=section.getint('fps', fallback=10),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'enabled': str(self.enabled).lower(),
+            'timelapse': str(self.timelapse).lower(),
+            'contact_sheet': str(self.contact_sheet).lower(),
+            'columns': str(self.columns),
+            'rows': str(self.rows),
+            'height': str(self.height),
+            'fps': str(self.fps),
+        }
+
+
+class TripSummarizer:
+    """
+    Builds timelapse and contact sheet sidecars for a joined trip.
+
+    Only keyframes are ever decoded: the timelapse tells the decoder to skip
+    every other frame, and the contact sheet seeks through the container index
+    straight to the keyframe nearest each sample point.
+    """
+
+    # Summaries run after joins but ahead of retention work
+    JOB_PRIORITY = 50
+
+    def __init__(self, policy, scheduler, catalog=None):
+        self.policy = policy
+        self.scheduler = scheduler
+        # Sidecars are cataloged against their trip, so retention counts and deletes them with it
+        self.catalog = catalog
+
+    def submit(self, path):
+        """
+        Queue the summary job for a joined trip on the scheduler.
+
+        Args:
+            path (str): The joined video.
+        """
+        if not self.policy.enabled:
+            return
+        self.scheduler.submit(f"summarize {os.path.basename(path)}", self.summarize, args=(path,),
+                              priority=self.JOB_PRIORITY, kind='summary')
+
+    @staticmethod
+    def sidecar_paths(path):
+        """Return the (timelapse, contact sheet) paths for a joined video."""
+        base = os.path.splitext(path)[0]
+        return f"{base}.summary.mp4", f"{base}.contact.jpg"
+
+    def summarize(self, path):
+        """
+        Write the configured sidecars for a joined video.
+
+        Args:
+            path (str): The joined video.
+        """
+        timelapse_path, contact_path = self.sidecar_paths(path)
+        if self.policy.timelapse:
+            self._write_timelapse(path, timelapse_path)
+            logging.info(f"Timelapse summary written: {timelapse_path}")
+        if self.policy.contact_sheet:
+            self._write_contact_sheet(path, contact_path)
+            logging.info(f"Contact sheet written: {contact_path}")
+        if self.catalog:
+            self.catalog.add_derived(path, [timelapse_path, contact_path])
+
+    def _threads(self):
+        threads = self.scheduler.policy.encoder_threads
+        return ['-threads', str(threads)] if threads else []
+
+    def _write_timelapse(self, path, output_path):
+        """Encode every keyframe of the trip as one frame of a short video."""
+        command = [
+            get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+            '-skip_frame', 'nokey', '-i', path, '-an',
+            '-vf', f"setpts=N/({self.policy.fps}*TB),scale=-2:'min({self.policy.height},ih)'",
+            '-r', str(self.policy.fps), '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+            '-pix_fmt', 'yuv420p'
+        ] + self._threads() + ['-f', 'mp4', output_path]
+        run_ffmpeg(command, self.scheduler.limiter)
+
+    def _write_contact_sheet(self, path, output_path):
+        """Tile the keyframes nearest to evenly spaced points in the trip."""
+        duration = probe_duration(path)
+        if not duration:
+            logging.warning(f"Unknown duration, skipping contact sheet for {path}")
+            return
+        count = self.policy.columns * self.policy.rows
+        command = [get_ffmpeg_exe(), '-y', '-loglevel', 'error']
+        for index in range(count):
+            # Seek before opening the input so ffmpeg jumps straight to the keyframe
+            offset = duration * (index + 0.5) / count
+            command += ['-skip_frame', 'nokey', '-noaccurate_seek', '-ss', f"{offset:.3f}", '-i', path]
+        tile_height = max(2, self.policy.height // self.policy.rows) // 2 * 2
+        filters = [f"[{index}:v]trim=end_frame=1,setpts=PTS-STARTPTS,scale=-2:{tile_height},setsar=1[t{index}]"
+                   for index in range(count)]
+        filters.append(''.join(f"[t{index}]" for index in range(count))
+                       + f"concat=n={count}:v=1:a=0,tile={self.policy.columns}x{self.policy.rows}[sheet]")
+        command += ['-filter_complex', ';'.join(filters), '-map', '[sheet]', '-frames:v', '1',
+                    '-q:v', '3', output_path]
+        run_ffmpeg(command, self.scheduler.limiter)
+
+
+class Rendition:
+    """An extra output produced from the same decode as the joined video."""
+
+    KINDS = ('video', 'thumbnail')
+
+    def __init__(self, name, kind='video', height=480, bitrate='800k'):
+        # Used as a suffix in the output filename, e.g. joined_....preview.mp4
+        self.name = name
+        # 'video' for a low bitrate copy, 'thumbnail' for a single poster frame
+        self.kind = kind
+        self.height = height
+        self.bitrate = bitrate
+
+    @classmethod
+    def parse(cls, name, spec):
+        """
+        Parse a rendition from its config value.
+
+        Args:
+            name (str): The option name, used as the filename suffix.
+            spec (str): "video <height> <bitrate>" or "thumbnail <height>".
+
+        Returns:
+            Rendition: The parsed rendition.
+
+        Raises:
+            ValueError: If the specification is malformed.
+        """
+        parts = spec.split()
+        if not parts or parts[0] not in cls.KINDS:
+            raise ValueError(f"Rendition '{name}' must start with one of {', '.join(cls.KINDS)}")
+        kind = parts[0]
+        height = int(parts[1]) if len(parts) > 1 else (480 if kind == 'video' else 360)
+        bitrate = parts[2] if len(parts) > 2 else '800k'
+        return cls(name, kind, height, bitrate)
+
+    def to_spec(self):
+        """Return the config value for this rendition."""
+        if self.kind == 'thumbnail':
+            return f"thumbnail {self.height}"
+        return f"video {self.height} {self.bitrate}"
+
+    def filter_chain(self):
+        """Return the ffmpeg filter chain applied to this rendition's split branch."""
+        scale = f"scale=-2:'min({self.height},ih)'"
+        if self.kind == 'thumbnail':
+            # Pick a representative frame from the first few seconds
+            return f"thumbnail=150,{scale}"
+        return scale
+
+    def output_options(self):
+        """Return the ffmpeg output options for this rendition."""
+        if self.kind == 'thumbnail':
+            return ['-frames:v', '1', '-update', '1', '-q:v', '3']
+        return ['-map', '0:a?', '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', self.bitrate,
+                '-maxrate', self.bitrate, '-bufsize', self.bitrate, '-c:a', 'aac', '-b:a', '64k']
+
+    def output_path(self, main_output_path):
+        """
+        Return the path of this rendition for a given joined video.
+
+        Args:
+            main_output_path (str): Path of the full quality output.
+        """
+        base, extension = os.path.splitext(main_output_path)
+        return f"{base}.{self.name}" + ('.jpg' if self.kind == 'thumbnail' else extension)
+
+
+def load_renditions(config):
+    """
+    Read the renditions configured in the [Renditions] section.
+
+    Args:
+        config (configparser.ConfigParser): The parsed configuration file.
+
+    Returns:
+        list: Rendition objects; invalid entries are logged and skipped.
+    """
+    renditions = []
+    if 'Renditions' in config:
+        for name, spec in config['Renditions'].items():
+            try:
+                renditions.append(Rendition.parse(name, spec))
+            except ValueError as e:
+                logging.error(f"Invalid rendition: {e}")
+    return renditions
+
+
+class TripCatalog:
+    """
+    A persistent SQLite index of joined trips and loose segments.
+
+    Entries are added and removed as files are detected and joined, so other
+    components can query the archive without rescanning the directory tree.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # The connection is shared between the observer, worker and GUI threads
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " path TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"           # 'trip', 'segment' or 'derived'
+                " start_time TEXT NOT NULL,"     # ISO format, sorts chronologically
+                " end_time TEXT NOT NULL,"
+                " size_bytes INTEGER NOT NULL,"
+                " profile TEXT NOT NULL DEFAULT 'full',"  # 'full' or 'archive'
+                " channel TEXT NOT NULL DEFAULT '',"      # '<watch root>/<camera subfolder>'
+                " added_at TEXT,"                         # When the file was first cataloged
+                " span_seconds REAL NOT NULL DEFAULT 0,"  # end_time - start_time, or a segment's longest length
+                " parent TEXT)"                           # Trip a derived file was made from
+            )
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(entries)")]
+            # Catalogs from before camera channels were recorded
+            if 'channel' not in columns:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN channel TEXT NOT NULL DEFAULT ''")
+            # Catalogs from before arrival times were recorded; their files count as arriving now
+            if 'added_at' not in columns:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN added_at TEXT")
+                self.connection.execute("UPDATE entries SET added_at = ?",
+                                        (datetime.datetime.now().isoformat(sep=' '),))
+            # Catalogs from before spans were stored
+            if 'span_seconds' not in columns:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN span_seconds REAL NOT NULL DEFAULT 0")
+                self.connection.execute(
+                    "UPDATE entries SET span_seconds = (julianday(end_time) - julianday(start_time)) * 86400")
+            # Catalogs from before derived outputs (renditions, previews, sidecars) were recorded
+            if 'parent' not in columns:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN parent TEXT")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_added ON entries (kind, added_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_start ON entries (kind, start_time)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_end ON entries (kind, profile, end_time)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_time ON entries (start_time)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)")
+            # Longest span of any entry. A time range query only has to look at entries
+            # starting this long before the range, so it is an index range scan instead
+            # of a pass over the table. Inserts raise it in memory; the span index keeps
+            # it cheap to recompute when entries are removed.
+            self.connection.execute("CREATE INDEX IF NOT EXISTS entries_span ON entries (span_seconds)")
+            self.max_span_seconds = self._longest_span()
+            # Sampled content hashes of segments, used to reject duplicates
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS content_hashes ("
+                " hash TEXT PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " size_bytes INTEGER NOT NULL,"
+                " joined_into TEXT)"             # Output the segment went into, once joined
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS content_hashes_path ON content_hashes (path)")
+            # Finished jobs, used to calibrate the planner's estimates
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_history ("
+                " finished_at TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " mode TEXT NOT NULL,"
+                " source_bytes INTEGER NOT NULL,"
+                " output_bytes INTEGER NOT NULL,"
+                " seconds REAL NOT NULL)"
+            )
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.connection.close()
+
+    def _longest_span(self):
+        """Return the longest span of any entry in seconds, read from the span index. Lock must be held."""
+        return self.connection.execute("SELECT COALESCE(MAX(span_seconds), 0) FROM entries").fetchone()[0]
+
+    def add(self, path, kind, start_time, end_time, size_bytes, profile='full', channel='', segment_seconds=0):
+        """
+        Insert or replace a catalog entry.
+
+        Args:
+            path (str): Full path of the file.
+            kind (str): 'trip' for joined outputs, 'segment' for source clips.
+            start_time (datetime.datetime): Start of the footage.
+            end_time (datetime.datetime): End of the footage.
+            size_bytes (int): File size.
+            profile (str): 'full' or 'archive' quality.
+            channel (str): Watch root and camera subfolder of the footage, '<root>/<subfolder>'.
+            segment_seconds (float): Longest a loose segment can run, e.g. the grouping threshold.
+                Its real end is not known until it is joined, so searches use this instead.
+        """
+        span = max((end_time - start_time).total_seconds(), segment_seconds)
+        with self.lock, self.connection:
+            # A file cataloged again (e.g. found by a rescan) keeps its original arrival time
+            self.connection.execute(
+                "INSERT INTO entries (path, kind, start_time, end_time, size_bytes, profile, channel, added_at,"
+                " span_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (path) DO UPDATE SET kind = excluded.kind, start_time = excluded.start_time,"
+                " end_time = excluded.end_time, size_bytes = excluded.size_bytes, profile = excluded.profile,"
+                " channel = excluded.channel, span_seconds = excluded.span_seconds",
+                (path, kind, start_time.isoformat(sep=' '), end_time.isoformat(sep=' '), size_bytes, profile, channel,
+                 datetime.datetime.now().isoformat(sep=' '), span)
+            )
+            # A replaced entry that held the longest span only leaves the search window wider than needed
+            self.max_span_seconds = max(self.max_span_seconds, span)
+
+    def remove(self, paths):
+        """
+        Remove entries by path.
+
+        Args:
+            paths (list): Paths of the files to forget.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM entries WHERE path = ?", [(path,) for path in paths])
+            # Shrink the search window if the longest entry went
+            self.max_span_seconds = self._longest_span()
+
+    def add_derived(self, parent, paths):
+        """
+        Catalog files made from a trip (renditions, keyframe index, summary sidecars, composite).
+
+        Derived files take the trip's footage times and channel, count towards the
+        storage quota and are deleted with the trip. They are left out of searches.
+        Paths that do not exist are skipped.
+
+        Args:
+            parent (str): Path of the cataloged trip the files were made from.
+            paths (list): Paths of the derived files.
+        """
+        rows = []
+        for path in paths:
+            try:
+                rows.append((path, os.path.getsize(path), parent))
+            except OSError:
+                continue
+        with self.lock, self.connection:
+            # Copy the footage times from the parent; nothing is recorded for a trip that is not cataloged
+            self.connection.executemany(
+                "INSERT INTO entries (path, kind, start_time, end_time, size_bytes, profile, channel, added_at,"
+                " span_seconds, parent) SELECT ?1, 'derived', start_time, end_time, ?2, profile, channel, ?4,"
+                " span_seconds, ?3 FROM entries WHERE path = ?3"
+                " ON CONFLICT (path) DO UPDATE SET size_bytes = excluded.size_bytes, parent = excluded.parent",
+                [row + (datetime.datetime.now().isoformat(sep=' '),) for row in rows]
+            )
+
+    def derived(self, parents):
+        """
+        Return the derived files cataloged against some trips.
+
+        Args:
+            parents (list): Paths of the trips.
+
+        Returns:
+            list: Paths of their derived files.
+        """
+        with self.lock:
+            return [row[0] for parent in parents for row in self.connection.execute(
+                "SELECT path FROM entries WHERE parent = ?", (parent,))]
+
+    def update(self, path, size_bytes, profile):
+        """Record a new size and quality profile for an existing entry."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE entries SET size_bytes = ?, profile = ? WHERE path = ?", (size_bytes, profile, path)
+            )
+
+    def overlapping(self, start, end):
+        """
+        Return entries whose footage overlaps a time range, in start order.
+
+        Args:
+            start (datetime.datetime): Start of the range.
+            end (datetime.datetime): End of the range.
+
+        Returns:
+            list: (path, kind, start_time, end_time) tuples with datetime values.
+        """
+        return [(entry['path'], entry['kind'], entry['start'], entry['end']) for entry in self.search(start, end)]
+
+    def search(self, start, end, kind=None, channel=None):
+        """
+        Return the entries whose footage overlaps a time range, in start order.
+
+        Only entries starting between `start` minus the longest span in the
+        catalog and `end` are read, found through the start time index, so the
+        cost grows with the number of matches rather than the archive size.
+        Loose segments are recorded with their start time only; they match when
+        they start inside the range or less than their longest possible length
+        before it.
+
+        Args:
+            start (datetime.datetime): Start of the range.
+            end (datetime.datetime): End of the range.
+            kind (str): Optionally only 'trip' or 'segment' entries.
+            channel (str): Optionally only one camera: '<root>/<subfolder>' for one watch root,
+                or just the subfolder to match it under every root ('' for files directly in a root).
+
+        Returns:
+            list: Dicts with path, kind, channel, start, end (datetimes), duration (seconds,
+            None for loose segments) and size_bytes.
+        """
+        query = ("SELECT path, kind, channel, start_time, end_time, size_bytes FROM entries INDEXED BY entries_time"
+                 " WHERE start_time >= ? AND start_time <= ?"
+                 " AND (end_time >= ? OR kind = 'segment' AND julianday(start_time) + span_seconds / 86400.0"
+                 " >= julianday(?))")
+        params = [(start - datetime.timedelta(seconds=self.max_span_seconds)).isoformat(sep=' '),
+                  end.isoformat(sep=' '), start.isoformat(sep=' '), start.isoformat(sep=' ')]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        else:
+            # Renditions and sidecars are reached through their trip
+            query += " AND kind != 'derived'"
+        if channel is not None and '/' in channel:
+            query += " AND channel = ?"
+            params.append(channel)
+        elif channel is not None:
+            # Entries from before watch roots were recorded hold the bare subfolder
+            query += " AND (channel = ? OR substr(channel, instr(channel, '/') + 1) = ? AND instr(channel, '/') > 0)"
+            params += [channel, channel]
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY start_time", params).fetchall()
+        entries = []
+        for path, entry_kind, entry_channel, entry_start, entry_end, size_bytes in rows:
+            entry_start = datetime.datetime.fromisoformat(entry_start)
+            entry_end = datetime.datetime.fromisoformat(entry_end)
+            entries.append({
+                'path': path,
+                'kind': entry_kind,
+                'channel': entry_channel,
+                'start': entry_start,
+                'end': entry_end,
+                'duration': (entry_end - entry_start).total_seconds() if entry_end > entry_start else None,
+                'size_bytes': size_bytes,
+            })
+        return entries
+
+    def added_before(self, kind, cutoff):
+        """
+        Return entries of a kind that were cataloged before `cutoff`, oldest arrival first.
+
+        Args:
+            kind (str): 'trip' or 'segment'.
+            cutoff (datetime.datetime): Upper bound for the arrival time.
+
+        Returns:
+            list: (path, size_bytes) tuples.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT path, size_bytes FROM entries WHERE kind = ? AND added_at < ? ORDER BY added_at",
+                (kind, cutoff.isoformat(sep=' '))
+            ).fetchall()
+
+    def ended_before(self, kind, cutoff, profile=None):
+        """
+        Return entries of a kind whose footage ended before `cutoff`, oldest first.
+
+        Args:
+            kind (str): 'trip' or 'segment'.
+            cutoff (datetime.datetime): Upper bound for the end time.
+            profile (str): Optionally restrict to one quality profile.
+
+        Returns:
+            list: (path, size_bytes) tuples.
+        """
+        query = "SELECT path, size_bytes FROM entries WHERE kind = ? AND end_time < ?"
+        params = [kind, cutoff.isoformat(sep=' ')]
+        if profile:
+            query += " AND profile = ?"
+            params.append(profile)
+        with self.lock:
+            return self.connection.execute(query + " ORDER BY end_time", params).fetchall()
+
+    def segment_sizes(self):
+        """Return a dict of path -> size_bytes for every loose segment."""
+        with self.lock:
+            return dict(self.connection.execute("SELECT path, size_bytes FROM entries WHERE kind = 'segment'"))
+
+    def claim_content(self, content_hash, path, size_bytes):
+        """
+        Register a segment's content hash unless another file already holds it.
+
+        A hash held by a file that no longer exists and was never joined is handed
+        over to the new path (the original was deleted, not duplicated).
+
+        Args:
+            content_hash (str): The sampled content hash.
+            path (str): The new segment.
+            size_bytes (int): Its size.
+
+        Returns:
+            tuple: (path of the earlier file, output it was joined into) for a duplicate,
+            otherwise (None, None).
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT path, joined_into FROM content_hashes WHERE hash = ?", (content_hash,)).fetchone()
+            if row and row[0] != path and (row[1] or os.path.exists(row[0])):
+                return row
+            self.connection.execute("INSERT OR REPLACE INTO content_hashes VALUES (?, ?, ?, NULL)",
+                                    (content_hash, path, size_bytes))
+        return None, None
+
+    def mark_content_joined(self, paths, output_path):
+        """Record the output the given segments were joined into."""
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE content_hashes SET joined_into = ? WHERE path = ?",
+                                        [(output_path, path) for path in paths])
+
+    def record_job(self, kind, mode, source_bytes, output_bytes, seconds):
+        """
+        Record a finished job for future estimates.
+
+        Args:
+            kind (str): The job kind, e.g. 'join'.
+            mode (str): The join mode used.
+            source_bytes (int): Bytes read.
+            output_bytes (int): Bytes written.
+            seconds (float): How long the job took.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO job_history VALUES (?, ?, ?, ?, ?, ?)",
+                (datetime.datetime.now().isoformat(sep=' '), kind, mode, source_bytes, output_bytes, seconds)
+            )
+
+    def job_rates(self, kind, mode, limit=50):
+        """
+        Return the throughput and output ratio of the most recent jobs of a kind and mode.
+
+        Args:
+            kind (str): The job kind.
+            mode (str): The join mode.
+            limit (int): How many recent jobs to average over.
+
+        Returns:
+            tuple or None: (source bytes per second, output/source ratio, number of jobs), or None without history.
+        """
+        with self.lock:
+            source, output, seconds, samples = self.connection.execute(
+                "SELECT SUM(source_bytes), SUM(output_bytes), SUM(seconds), COUNT(*) FROM"
+                " (SELECT * FROM job_history WHERE kind = ? AND mode = ? ORDER BY finished_at DESC LIMIT ?)",
+                (kind, mode, limit)
+            ).fetchone()
+        if not samples or not source or not seconds:
+            return None
+        return source / seconds, output / source, samples
+
+    def total_bytes(self):
+        """Return the combined size of every cataloged file, derived outputs included."""
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+
+    def oldest_first(self):
+        """
+        Yield every trip and segment, oldest footage first.
+
+        Yields:
+            tuple: (path, kind, size_bytes), the size including the entry's derived files.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT path, kind, size_bytes + (SELECT COALESCE(SUM(size_bytes), 0) FROM entries AS derived"
+                " WHERE derived.parent = entries.path) FROM entries WHERE kind != 'derived' ORDER BY start_time"
+            ).fetchall()
+        yield from rows
+
+
+class OutputPolicy:
+    """Settings for the size of joined files and the layout of the output directory."""
+
+    # Shards shorter than this are not worth a file of their own
+    MIN_SHARD_SECONDS = 10
+
+    def __init__(self, max_minutes=0, max_mb=0, dated_directories=False):
+        # Longest joined file in minutes (0 for no limit)
+        self.max_minutes = max_minutes
+        # Largest joined file in MB (0 for no limit)
+        self.max_mb = max_mb
+        # Write joined files under YYYY/MM/DD subfolders of the output directory
+        self.dated_directories = dated_directories
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Output] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            OutputPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Output' not in config:
+            return cls()
+        section = config['Output']
+        return cls(
+            max_minutes=section.getfloat('max_minutes', fallback=0),
+            max_mb=section.getfloat('max_mb', fallback=0),
+            dated_directories=section.getboolean('dated_directories', fallback=False),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'max_minutes': f"{self.max_minutes:g}",
+            'max_mb': f"{self.max_mb:g}",
+            'dated_directories': str(self.dated_directories).lower(),
+        }
+
+    def for_root(self, watch_root):
+        """
+        Return the policy to use for a watch root.
+
+        Dated folders written inside a recursively watched root would be routed as new
+        camera channels, so such roots without an output_directory write flat instead.
+
+        Args:
+            watch_root (WatchRoot): The root the outputs belong to.
+
+        Returns:
+            OutputPolicy: This policy, or a copy without dated directories.
+        """
+        if self.dated_directories and watch_root.recursive and not watch_root.output_directory:
+            return OutputPolicy(self.max_minutes, self.max_mb, dated_directories=False)
+        return self
+
+    def directory_for(self, directory, start_time):
+        """Return the folder a trip starting at `start_time` is written to under `directory`."""
+        if not self.dated_directories:
+            return directory
+        return os.path.join(directory, start_time.strftime('%Y'), start_time.strftime('%m'), start_time.strftime('%d'))
+
+    def shard_seconds(self, duration, size_bytes):
+        """
+        Return the shard length for a joined file, or None if it is within the limits.
+
+        The size limit is turned into a duration at the file's average bitrate,
+        since shards can only be cut at keyframes.
+
+        Args:
+            duration (float): Length of the file in seconds.
+            size_bytes (int): Size of the file.
+
+        Returns:
+            float or None: Seconds per shard.
+        """
+        limits = []
+        if self.max_minutes and duration > self.max_minutes * 60:
+            limits.append(self.max_minutes * 60)
+        if self.max_mb and size_bytes > self.max_mb * 1024 * 1024:
+            limits.append(duration * self.max_mb * 1024 * 1024 / size_bytes)
+        if not limits:
+            return None
+        return max(min(limits), self.MIN_SHARD_SECONDS)
+
+
+class DedupPolicy:
+    """Settings for detecting re-imported and copied segments."""
+
+    def __init__(self, enabled=False, block_kb=64, settle_seconds=2.0):
+        # Whether new segments are checked against the content hash index
+        self.enabled = enabled
+        # Size of each of the head, middle and tail blocks that are hashed
+        self.block_kb = block_kb
+        # A segment is hashed once its size and mtime have not changed for this long
+        self.settle_seconds = settle_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Dedup] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            DedupPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Dedup' not in config:
+            return cls()
+        section = config['Dedup']
+        return cls(
+            enabled=section.getboolean('enabled', fallback=False),
+            block_kb=section.getint('block_kb', fallback=64),
+            settle_seconds=section.getfloat('settle_seconds', fallback=2.0),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'enabled': str(self.enabled).lower(),
+            'block_kb': str(self.block_kb),
+            'settle_seconds': f"{self.settle_seconds:g}",
+        }
+
+
+def sampled_hash(path, block_size):
+    """
+    Hash a file's size and its first, middle and last blocks.
+
+    Reads at most three blocks however large the file is, which is enough to tell
+    video segments apart while staying cheap on network shares.
+
+    Args:
+        path (str): The file.
+        block_size (int): Bytes per sampled block.
+
+    Returns:
+        str: A hex digest.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode('ascii'), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - block_size // 2), max(0, size - block_size)}):
+            f.seek(offset)
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+class Deduplicator:
+    """
+    Rejects segments whose content was already seen, using sampled hashes kept in the catalog.
+
+    Hashes of joined segments are kept, so re-importing a card whose footage was
+    already joined is caught even though the original files are gone.
+    """
+
+    # Give up waiting for a file that is still being written after this long
+    SETTLE_TIMEOUT = 600
+
+    def __init__(self, policy, catalog):
+        self.policy = policy
+        self.catalog = catalog
+
+    def wait_until_settled(self, path):
+        """
+        Wait until a file has stopped changing, i.e. the camera or copy finished writing it.
+
+        A file not modified for settle_seconds counts as settled straight away, so a
+        backfill of existing footage does not wait at all.
+
+        Args:
+            path (str): The file.
+
+        Returns:
+            int or None: Its final size, or None if it vanished or kept changing.
+        """
+        previous = None
+        deadline = time.monotonic() + self.SETTLE_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == previous or time.time() - stat.st_mtime >= self.policy.settle_seconds:
+                return stat.st_size
+            previous = current
+            time.sleep(self.policy.settle_seconds)
+        logging.warning(f"{path} is still being written after {self.SETTLE_TIMEOUT}s; not checking it for duplicates.")
+        return None
+
+    def is_duplicate(self, path):
+        """
+        Check a new segment against the index and record it if it is new.
+
+        Blocks until the file has settled and reads from it, so it runs on a worker
+        thread, not on the engine loop.
+
+        Args:
+            path (str): The segment.
+
+        Returns:
+            bool: True if the same content is already known under another path.
+        """
+        block_size = self.policy.block_kb * 1024
+        size = self.wait_until_settled(path)
+        if size is None or size < 3 * block_size:
+            # Too small for the sampled blocks to tell files apart (e.g. empty or truncated clips)
+            return False
+        try:
+            content_hash = sampled_hash(path, block_size)
+        except OSError as e:
+            logging.warning(f"Could not hash {path}: {e}")
+            return False
+        original, joined_into = self.catalog.claim_content(content_hash, path, size)
+        if original is None:
+            return False
+        if joined_into:
+            logging.warning(f"Skipping {path}: same content as {original}, already joined into {joined_into}.")
+        else:
+            logging.warning(f"Skipping {path}: duplicate of {original}.")
+        return True
+
+    def mark_joined(self, paths, output_path):
+        """Remember that the given segments were joined into `output_path`."""
+        self.catalog.mark_content_joined(paths, output_path)
+
+
+# Name prefixes of the files joins write next to the segments
+OUTPUT_PREFIXES = ('joined_', 'composite_')
+
+
+class JoinPlanner:
+    """
+    Dry run of a backfill: which trips would be formed from the files in the
+    watch roots, where they go, and what they would cost.
+
+    Uses the same grouping as process_videos and the catalog's cached sizes, and
+    never writes, moves or deletes a file. Output size and time are calibrated
+    from the job history in the catalog when there is one. In copy mode each
+    group's clips are probed, since incompatible groups are transcoded instead.
+    """
+
+    def __init__(self, watch_roots, catalog, join_mode='compose', workers=1, output_policy=None):
+        self.watch_roots = watch_roots
+        self.catalog = catalog
+        self.join_mode = join_mode
+        # Jobs running at once, used to turn the summed job time into wall time
+        self.workers = max(1, workers)
+        # Places the planned outputs in the dated folders the joins would use
+        self.output_policy = output_policy or OutputPolicy()
+
+    def estimates(self, join_mode=None):
+        """
+        Return the rates used for the estimates.
+
+        Args:
+            join_mode (str): The mode the estimates are for (default: the configured mode).
+
+        Returns:
+            tuple: (source bytes per second, output/source size ratio, description of the basis).
+        """
+        join_mode = join_mode or self.join_mode
+        history = self.catalog.job_rates('join', join_mode)
+        if history:
+            bytes_per_second, output_ratio, samples = history
+            return bytes_per_second, output_ratio, f"{samples} past job(s)"
+        return JOIN_THROUGHPUT_DEFAULTS[join_mode], OUTPUT_SIZE_FACTORS[join_mode], "defaults"
+
+    def join_mode_for(self, group, output_path):
+        """
+        Return the mode a group would actually be joined with.
+
+        Copy mode falls back to a transcode when the clips cannot be packet copied,
+        which costs far more, so the clips are probed the way _copy_join does.
+
+        Args:
+            group (list): (path, timestamp) tuples of the group.
+            output_path (str): Where the group would be written.
+
+        Returns:
+            str: The join mode.
+        """
+        if self.join_mode != 'copy':
+            return self.join_mode
+        container = CONTAINER_FORMATS.get(os.path.splitext(output_path)[1].lower(), 'mp4')
+        blocker = copy_blocker([probe_streams(path) for path, _ in group], container)
+        if blocker:
+            logging.info(f"{blocker} in the group starting at {group[0][1]}; it would be transcoded.")
+            return 'transcode'
+        return 'copy'
+
+    def plan(self):
+        """
+        Group the existing files of every watch root.
+
+        Returns:
+            dict: 'trips' (one dict per planned join), 'unmatched' (file count), 'outputs' (earlier
+            joined files skipped), 'basis', 'total_seconds' (summed job time) and 'wall_seconds'
+            (spread over the workers).
+        """
+        rates = {}
+        cached_sizes = self.catalog.segment_sizes()
+        trips = []
+        unmatched = 0
+        outputs = 0
+        for watch_root in self.watch_roots:
+            for channel, directory in self._channels(watch_root):
+                handler = VideoFileHandler(
+                    watch_root.time_threshold, watch_root.timestamp_format, watch_root.video_extension,
+                    root=None, scheduler=None, catalog=None, join_mode=self.join_mode,
+                    output_extension=watch_root.output_extension, output_policy=self.output_policy.for_root(watch_root),
+                    output_directory=os.path.join(watch_root.output_directory, channel)
+                    if watch_root.output_directory else None)
+                video_files = []
+                for filename in os.listdir(directory):
+                    if not filename.lower().endswith(handler.video_extensions):
+                        continue
+                    if filename.startswith(OUTPUT_PREFIXES):
+                        # A trip joined earlier, not a segment
+                        outputs += 1
+                        continue
+                    path = os.path.join(directory, filename)
+                    # Non-matching names are only counted; the plan reports the total
+                    timestamp = handler.extract_timestamp(path, quiet=True)
+                    if timestamp:
+                        video_files.append((path, timestamp))
+                    else:
+                        unmatched += 1
+                video_files.sort(key=lambda video: video[1])
+                for group in handler.group_videos(video_files):
+                    if len(group) < 2:
+                        continue
+                    source_bytes = sum(cached_sizes.get(path) or os.path.getsize(path) for path, _ in group)
+                    output_path = handler.output_path_for(group)
+                    join_mode = self.join_mode_for(group, output_path)
+                    if join_mode not in rates:
+                        rates[join_mode] = self.estimates(join_mode)
+                    bytes_per_second, output_ratio, _ = rates[join_mode]
+                    trips.append({
+                        'root': watch_root.name,
+                        'channel': channel,
+                        'start': group[0][1],
+                        'end': group[-1][1],
+                        'segments': [path for path, _ in group],
+                        'output': output_path,
+                        'join_mode': join_mode,
+                        'source_bytes': source_bytes,
+                        'output_bytes': int(source_bytes * output_ratio),
+                        'seconds': source_bytes / bytes_per_second,
+                    })
+        total_seconds = sum(trip['seconds'] for trip in trips)
+        return {
+            'trips': trips,
+            'unmatched': unmatched,
+            'outputs': outputs,
+            'basis': '; '.join(f"{mode} from {basis}" for mode, (_, _, basis) in sorted(rates.items()))
+                     or self.estimates()[2],
+            'total_seconds': total_seconds,
+            'wall_seconds': total_seconds / self.workers,
+        }
+
+    @staticmethod
+    def _channels(watch_root):
+        """Yield (channel, directory) for the directories of a watch root that hold segments."""
+        if not watch_root.recursive:
+            yield '', watch_root.directory
+            return
+        for directory, _, _ in os.walk(watch_root.directory):
+            relative = os.path.relpath(directory, watch_root.directory)
+            yield ('' if relative == os.curdir else relative), directory
+
+    @staticmethod
+    def format_table(plan):
+        """
+        Render a plan as a plain text table.
+
+        Args:
+            plan (dict): The result of plan().
+
+        Returns:
+            str: The table followed by the totals.
+        """
+        header = ('Start', 'End', 'Clips', 'Channel', 'Mode', 'Source MB', 'Est. MB', 'Est. time', 'Output')
+        rows = [(str(trip['start']), str(trip['end']), str(len(trip['segments'])),
+                 f"{trip['root']}/{trip['channel']}".rstrip('/'), trip['join_mode'],
+                 f"{trip['source_bytes'] / 1048576:.0f}", f"{trip['output_bytes'] / 1048576:.0f}",
+                 str(datetime.timedelta(seconds=round(trip['seconds']))), os.path.basename(trip['output']))
+                for trip in plan['trips']]
+        widths = [max(len(row[index]) for row in [header] + rows) for index in range(len(header))]
+        lines = ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [header] + rows]
+        lines.insert(1, '  '.join('-' * width for width in widths))
+        lines.append('')
+        lines.append(f"{len(plan['trips'])} trip(s) from {sum(len(trip['segments']) for trip in plan['trips'])} "
+                     f"segment(s); {plan['unmatched']} file(s) did not match the timestamp format, "
+                     f"{plan['outputs']} earlier output(s) skipped.")
+        lines.append(f"Estimated wall time {datetime.timedelta(seconds=round(plan['wall_seconds']))} "
+                     f"(estimates based on {plan['basis']}).")
+        return '\n'.join(lines)
+
+
+class RetentionPolicy:
+    """Rules for how long footage is kept and when it is compacted."""
+
+    def __init__(self, enabled=False, full_quality_days=30, archive_height=480, archive_crf=30,
+                 quota_gb=0.0, loose_segment_days=0, interval_minutes=60):
+        self.enabled = enabled
+        # Trips newer than this are kept at full quality
+        self.full_quality_days = full_quality_days
+        # Archive profile: output height in pixels and x264 constant rate factor
+        self.archive_height = archive_height
+        self.archive_crf = archive_crf
+        # Oldest footage is deleted once the archive exceeds this size (0 disables)
+        self.quota_gb = quota_gb
+        # Loose segments that never joined into a trip are deleted after this many days (0 disables)
+        self.loose_segment_days = loose_segment_days
+        # How often the engine evaluates the rules
+        self.interval_minutes = interval_minutes
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Retention] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            RetentionPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Retention' not in config:
+            return cls()
+        section = config['Retention']
+        return cls(
+            enabled=section.getboolean('enabled', fallback=False),
+            full_quality_days=section.getint('full_quality_days', fallback=30),
+            archive_height=section.getint('archive_height', fallback=480),
+            archive_crf=section.getint('archive_crf', fallback=30),
+            quota_gb=section.getfloat('quota_gb', fallback=0.0),
+            loose_segment_days=section.getint('loose_segment_days', fallback=0),
+            interval_minutes=section.getint('interval_minutes', fallback=60),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'enabled': str(self.enabled).lower(),
+            'full_quality_days': str(self.full_quality_days),
+            'archive_height': str(self.archive_height),
+            'archive_crf': str(self.archive_crf),
+            'quota_gb': str(self.quota_gb),
+            'loose_segment_days': str(self.loose_segment_days),
+            'interval_minutes': str(self.interval_minutes),
+        }
+
+
+class RetentionEngine:
+    """
+    Applies a RetentionPolicy to the cataloged archive.
+
+    Each pass only asks the catalog for entries that crossed a threshold, and
+    submits the resulting transcodes and deletions as low-priority scheduler jobs.
+    """
+
+    # Retention work yields to every join
+    JOB_PRIORITY = 100
+
+    def __init__(self, policy, catalog, scheduler, pending=None):
+        self.policy = policy
+        self.catalog = catalog
+        self.scheduler = scheduler
+        # Returns the set of segment paths still waiting to be grouped or joined, or None
+        # when that is unknown (not monitoring); loose segments are only deleted when known
+        self.pending = pending
+        # Paths with a queued or running retention job, to avoid submitting twice
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Evaluate the policy periodically on a background thread."""
+        if not self.policy.enabled:
+            return
+        self.thread = threading.Thread(target=self._run_loop, name="retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the periodic evaluation."""
+        self.stop_event.set()
+
+    def _run_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Retention pass failed: {e}", exc_info=True)
+            self.stop_event.wait(self.policy.interval_minutes * 60)
+
+    def _claim(self, path):
+        """Mark a path as having a pending job. Returns False if it already has one."""
+        with self.lock:
+            if path in self.in_flight:
+                return False
+            self.in_flight.add(path)
+            return True
+
+    def _release(self, path):
+        with self.lock:
+            self.in_flight.discard(path)
+
+    def run_once(self, now=None):
+        """
+        Evaluate every rule once and queue the resulting jobs.
+
+        Args:
+            now (datetime.datetime): The reference time (defaults to the current time).
+        """
+        now = now or datetime.datetime.now()
+
+        # Compact trips that are past the full quality window
+        cutoff = now - datetime.timedelta(days=self.policy.full_quality_days)
+        for path, size_bytes in self.catalog.ended_before('trip', cutoff, profile='full'):
+            if self._claim(path):
+                self.scheduler.submit(
+                    f"archive {os.path.basename(path)}", self._archive_trip, args=(path,),
+                    priority=self.JOB_PRIORITY, source_bytes=size_bytes,
+                    space_needs=[(os.path.dirname(path), size_bytes // 2)], kind='archive'
+                )
+
+        # Delete loose segments that were never joined. Age counts from when the file
+        # arrived, not from the footage time, so an old card imported today is safe.
+        # Segments a handler still tracks (pending, including single-clip trips that
+        # will never group) or that a queued or running join uses are left alone.
+        # The quota rule below needs the same protection.
+        wants_pending = self.policy.loose_segment_days > 0 or self.policy.quota_gb > 0
+        pending = self.pending() if self.pending and wants_pending else None
+        if pending is not None and self.policy.loose_segment_days > 0:
+            cutoff = now - datetime.timedelta(days=self.policy.loose_segment_days)
+            stale = [path for path, _ in self.catalog.added_before('segment', cutoff)
+                     if path not in pending and self._claim(path)]
+            if stale:
+                self.scheduler.submit(f"delete {len(stale)} loose segment(s)", self._delete_files,
+                                      args=(stale,), priority=self.JOB_PRIORITY, kind='delete')
+
+        # Delete the oldest footage until the archive is back under quota. Segments are
+        # skipped while they may still be joined, and entirely when that is unknown.
+        if self.policy.quota_gb > 0:
+            excess = self.catalog.total_bytes() - int(self.policy.quota_gb * 1024 ** 3)
+            doomed = []
+            for path, kind, size_bytes in self.catalog.oldest_first():
+                if excess <= 0:
+                    break
+                if kind == 'segment' and (pending is None or path in pending):
+                    continue
+                if self._claim(path):
+                    doomed.append(path)
+                    excess -= size_bytes
+            if doomed:
+                self.scheduler.submit(f"delete {len(doomed)} file(s) over quota", self._delete_files,
+                                      args=(doomed,), priority=self.JOB_PRIORITY, kind='delete')
+
+    def _archive_trip(self, path):
+        """Transcode a trip to the archive profile in place."""
+        try:
+            if not os.path.exists(path):
+                self.catalog.remove([path])
+                return
+            extension = os.path.splitext(path)[1].lower()
+            partial = path + '.partial'
+            command = [
+                get_ffmpeg_exe(), '-y', '-loglevel', 'error', '-i', path,
+                '-vf', f"scale=-2:'min({self.policy.archive_height},ih)'",
+                '-c:v', 'libx264', '-preset', 'slow', '-crf', str(self.policy.archive_crf),
+                '-c:a', 'aac', '-b:a', '64k',
+                '-f', CONTAINER_FORMATS.get(extension, 'mp4'), partial
+            ]
+            threads = self.scheduler.policy.encoder_threads
+            if threads:
+                command[-3:-3] = ['-threads', str(threads)]
+            run_ffmpeg(command, self.scheduler.limiter)
+            os.replace(partial, path)
+            # The re-encode moved every keyframe, so refresh a seek index written at join time
+            if os.path.exists(keyframe_index_path(path)):
+                write_keyframe_index(path)
+            self.catalog.update(path, os.path.getsize(path), 'archive')
+            self.catalog.add_derived(path, [keyframe_index_path(path)])
+            logging.info(f"Archived trip to compact profile: {path}")
+        finally:
+            self._release(path)
+
+    def _delete_files(self, paths):
+        """Delete files, the outputs derived from them, and drop them all from the catalog."""
+        try:
+            derived = self.catalog.derived(paths)
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+                    logging.info(f"Retention deleted: {path}")
+                # Keyframe indexes written before derived outputs were cataloged
+                if os.path.exists(keyframe_index_path(path)):
+                    os.remove(keyframe_index_path(path))
+            for path in derived:
+                if os.path.exists(path):
+                    os.remove(path)
+                    logging.info(f"Retention deleted derived output: {path}")
+            self.catalog.remove(list(paths) + derived)
+        finally:
+            for path in paths:
+                self._release(path)
+
+class PipelineMetrics:
+    """
+    Thread-safe counters and latency histograms for the processing pipeline.
+
+    Updates are a dictionary increment under a lock, cheap enough for the
+    file event path. Values are rendered in the Prometheus text format.
+    """
+
+    # Upper bounds (seconds) of the latency histogram buckets
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+    # HELP text of each metric family; unlisted names fall back to the name itself
+    DESCRIPTIONS = {
+        'events_total': "File system events received.",
+        'segments_seen_total': "Video files detected in the watch roots.",
+        'parse_failures_total': "Video files whose name did not match the timestamp format.",
+        'duplicates_total': "Segments skipped as copies of footage already seen.",
+        'groups_formed_total': "Groups of segments queued for joining.",
+        'joins_total': "Finished joins by outcome.",
+        'bytes_in_total': "Bytes of source footage joined.",
+        'bytes_out_total': "Bytes of joined output written.",
+        'queue_depth': "Jobs waiting to run.",
+        'running_jobs': "Jobs currently running.",
+        'event_seconds': "Time spent handling one file system event.",
+        'parse_seconds': "Time spent parsing one filename.",
+        'grouping_seconds': "Time spent regrouping the pending segments.",
+        'join_duration_seconds': "Time taken by one join job.",
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> value
+        self.counters = collections.defaultdict(float)
+        # (name, labels) -> [bucket counts..., sum, count]
+        self.histograms = {}
+        # name -> callable returning the current value
+        self.gauges = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter.
+
+        Args:
+            name (str): Metric name, e.g. 'segments_seen_total'.
+            value (float): Amount to add.
+            **labels: Optional label values.
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a latency in a histogram.
+
+        Args:
+            name (str): Metric name, e.g. 'join_duration_seconds'.
+            seconds (float): The observed duration.
+            **labels: Optional label values.
+        """
+        key = self._key(name, labels)
+        index = bisect.bisect_left(self.LATENCY_BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.LATENCY_BUCKETS) + 1) + [0.0, 0]
+            histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def value(self, name, **labels):
+        """
+        Return the current value of one counter series.
+
+        Args:
+            name (str): Metric name, e.g. 'joins_total'.
+            **labels: The label values of the series.
+
+        Returns:
+            float: The value, 0 if the series was never increased.
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            return self.counters.get(key, 0.0)
+
+    def gauge(self, name, callback):
+        """
+        Register a gauge whose value is read when the metrics are rendered.
+
+        Args:
+            name (str): Metric name, e.g. 'queue_depth'.
+            callback (callable): Returns the current value.
+        """
+        with self.lock:
+            self.gauges[name] = callback
+
+    def snapshot(self):
+        """
+        Return a plain dictionary of the current values for display.
+
+        Returns:
+            dict: Counter totals (summed over labels), gauge values, and histogram averages.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+            gauges = dict(self.gauges)
+        summary = collections.defaultdict(float)
+        for (name, _), value in counters.items():
+            summary[name] += value
+        for name, callback in gauges.items():
+            summary[name] = callback()
+        for (name, _), histogram in histograms.items():
+            total, count = histogram[-2], histogram[-1]
+            summary[name + '_count'] += count
+            summary[name + '_sum'] += total
+        return dict(summary)
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+    def render_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(value)) for key, value in self.histograms.items())
+            gauges = sorted(self.gauges.items())
+        lines = []
+        # The HELP and TYPE lines come once per family, before its first sample
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP dashcam_{name} {self.DESCRIPTIONS.get(name, name.replace('_', ' '))}")
+                lines.append(f"# TYPE dashcam_{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"dashcam_{name}{self._format_labels(labels)} {value:g}")
+        for name, callback in gauges:
+            describe(name, 'gauge')
+            lines.append(f"dashcam_{name} {callback():g}")
+        for (name, labels), histogram in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS + ('+Inf',), histogram):
+                cumulative += count
+                lines.append(f"dashcam_{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"dashcam_{name}_sum{self._format_labels(labels)} {histogram[-2]:g}")
+            lines.append(f"dashcam_{name}_count{self._format_labels(labels)} {histogram[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsPolicy:
+    """Where the pipeline metrics are published."""
+
+    def __init__(self, http_port=0, stats_file='', interval_seconds=30):
+        # Port of the localhost metrics endpoint (0 disables it)
+        self.http_port = http_port
+        # File the metrics are periodically written to ('' disables it)
+        self.stats_file = stats_file
+        self.interval_seconds = interval_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Metrics] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            MetricsPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Metrics' not in config:
+            return cls()
+        section = config['Metrics']
+        return cls(
+            http_port=section.getint('http_port', fallback=0),
+            stats_file=section.get('stats_file', fallback='').strip(),
+            interval_seconds=section.getint('interval_seconds', fallback=30),
+        )
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {
+            'http_port': str(self.http_port),
+            'stats_file': self.stats_file,
+            'interval_seconds': str(self.interval_seconds),
+        }
+
+
+class MetricsPublisher:
+    """Serves the metrics on localhost and/or writes them to a stats file in the background."""
+
+    def __init__(self, policy, metrics):
+        self.policy = policy
+        self.metrics = metrics
+        self.server = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Start the HTTP endpoint and the stats file writer, as configured."""
+        if self.policy.http_port:
+            import http.server  # Local metrics endpoint, only loaded when enabled
+
+            metrics = self.metrics
+
+            class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip('/') not in ('', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.render_prometheus().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    # Scrapes are frequent; keep them out of the application log
+                    pass
+
+            try:
+                self.server = http.server.ThreadingHTTPServer(('127.0.0.1', self.policy.http_port),
+                                                              MetricsRequestHandler)
+            except OSError as e:
+                logging.error(f"Could not start metrics endpoint on port {self.policy.http_port}: {e}")
+            else:
+                threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+                logging.info(f"Metrics available at http://127.0.0.1:{self.policy.http_port}/metrics")
+
+        if self.policy.stats_file:
+            threading.Thread(target=self._write_loop, name="metrics-file", daemon=True).start()
+
+    def stop(self):
+        """Stop publishing and write the stats file one last time."""
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.policy.stats_file:
+            self._write_stats_file()
+
+    def _write_loop(self):
+        while not self.stop_event.wait(self.policy.interval_seconds):
+            self._write_stats_file()
+
+    def _write_stats_file(self):
+        """Atomically replace the stats file with the current metrics."""
+        try:
+            partial = self.policy.stats_file + '.partial'
+            with open(partial, 'w') as stats:
+                stats.write(self.metrics.render_prometheus())
+            os.replace(partial, self.policy.stats_file)
+        except OSError as e:
+            logging.error(f"Could not write stats file: {e}")
+
+class ControlPolicy:
+    """Settings of the local control API."""
+
+    def __init__(self, http_port=0):
+        # Port of the control API on 127.0.0.1 (0 disables it)
+        self.http_port = http_port
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a policy from the [Control] section of a ConfigParser.
+
+        Args:
+            config (configparser.ConfigParser): The parsed configuration file.
+
+        Returns:
+            ControlPolicy: The policy, with defaults for any missing option.
+        """
+        if 'Control' not in config:
+            return cls()
+        return cls(http_port=config['Control'].getint('http_port', fallback=0))
+
+    def to_config(self):
+        """Return the policy as a dictionary suitable for a ConfigParser section."""
+        return {'http_port': str(self.http_port)}
+
+
+class ControlServer:
+    """
+    JSON control API for scripts and dashboards, served on 127.0.0.1.
+
+    GET  /status          monitoring state, queue depth and metrics
+    GET  /jobs            running and queued jobs
+    POST /join            {"paths": [...]} or {"start": ISO time, "end": ISO time}
+    POST /backfill        {"path": directory} or {} for every watch root
+    POST /pause, /resume  hold or release the job scheduler
+    POST /reload          re-read config.ini and apply grouping changes live
+
+    Requests are served on their own threads and only call the thread-safe
+    JoinerService methods, so the GUI thread is never involved.
+    """
+
+    def __init__(self, policy, service):
+        self.policy = policy
+        self.service = service
+        self.server = None
+
+    def start(self):
+        """Start serving, if a port is configured."""
+        if not self.policy.http_port:
+            return
+        import http.server  # Only loaded when the API is enabled
+
+        service = self.service
+
+        class ControlRequestHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/status':
+                    self.reply(200, service.status())
+                elif self.path == '/jobs':
+                    self.reply(200, service.scheduler.snapshot())
+                else:
+                    self.reply(404, {'error': f"unknown endpoint {self.path}"})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                    if not isinstance(body, dict):
+                        raise TypeError("the request body must be a JSON object")
+                    if self.path == '/join':
+                        if body.get('paths'):
+                            if not isinstance(body['paths'], list):
+                                raise TypeError("'paths' must be a list of file paths")
+                            queued = service.join_paths(body['paths'])
+                        else:
+                            queued = service.join_range(datetime.datetime.fromisoformat(body['start']),
+                                                        datetime.datetime.fromisoformat(body['end']))
+                        self.reply(202, {'queued_groups': queued})
+                    elif self.path == '/backfill':
+                        service.backfill(body.get('path'))
+                        self.reply(202, {'backfill': body.get('path') or 'all'})
+                    elif self.path == '/reload':
+                        service.reload_config()
+                        self.reply(200, {'reloaded': service.config_file})
+                    elif self.path in ('/pause', '/resume'):
+                        service.scheduler.set_paused(self.path == '/pause')
+                        self.reply(200, {'paused': service.scheduler.paused})
+                    else:
+                        self.reply(404, {'error': f"unknown endpoint {self.path}"})
+                except (ValueError, KeyError, TypeError) as e:
+                    self.reply(400, {'error': str(e)})
+                except RuntimeError as e:
+                    # E.g. monitoring is not active
+                    self.reply(409, {'error': str(e)})
+                except (FileNotFoundError, NotADirectoryError) as e:
+                    # A path in the request that is missing or of the wrong type
+                    self.reply(400, {'error': str(e)})
+                except PermissionError as e:
+                    self.reply(403, {'error': str(e)})
+                except OSError as e:
+                    logging.error(f"Control API request {self.path} failed: {e}")
+                    self.reply(500, {'error': str(e)})
+                except Exception as e:
+                    # Never drop the connection without an answer
+                    logging.error(f"Control API request {self.path} failed: {e}", exc_info=True)
+                    self.reply(500, {'error': f"internal error: {e}"})
+
+            def reply(self, status, payload):
+                body = json.dumps(payload, default=str).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Control API: {format % args}")
+
+        try:
+            self.server = http.server.ThreadingHTTPServer(('127.0.0.1', self.policy.http_port), ControlRequestHandler)
+        except OSError as e:
+            logging.error(f"Could not start control API on port {self.policy.http_port}: {e}")
+            return
+        threading.Thread(target=self.server.serve_forever, name="control-http", daemon=True).start()
+        logging.info(f"Control API listening on http://127.0.0.1:{self.policy.http_port}/")
+
+    def stop(self):
+        """Stop serving."""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+# Correlation id of the job or file event the current thread is working on
+correlation_id = contextvars.ContextVar('correlation_id', default='-')
+
+# Listener draining the logging queue, set by configure_logging()
+_log_listener = None
+
+# Rotating JSON log written by the background log listener
+LOG_FILE = os.path.join(LOG_DIR, 'dashcam.jsonl')
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+
+class CorrelationFilter(logging.Filter):
+    """Stamps each record with the current correlation id."""
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Drops repeats of warnings and errors logged from the same line.
+
+    Each call site may log `burst` records per `window` seconds. Further
+    records are dropped and counted; the count is appended to the first record
+    from that site after the window ends, so a backfill full of unparseable
+    names cannot flood the log.
+    """
+
+    def __init__(self, burst=20, window=10.0, min_level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.min_level = min_level
+        # (pathname, lineno) -> [window start, records logged, records suppressed]
+        self.sites = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = record.created
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} ({suppressed} similar message(s) suppressed)"
+                    record.args = None
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'correlation_id': getattr(record, 'correlation_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted before the record crossed the logging queue
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that keeps a record's message and traceback apart.
+
+    The stock prepare() folds the formatted traceback into the message, which
+    leaves the JSON log's 'message' holding a traceback and no 'exception'.
+    Here the message is only merged with its arguments, and the traceback is
+    formatted into exc_text; text formatters still append it as usual.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks cannot cross a process queue and reference live frames, so send text
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Route all logging through a queue drained by a background listener.
+
+    Observer, worker and GUI threads only enqueue records; formatting and the
+    console and rotating JSON file output happen on the listener thread.
+
+    Args:
+        level (int): The root logger level.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener. Stop it on exit to flush.
+    """
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(CorrelationFilter())
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(correlation_id)s] %(message)s'))
+    handlers = [console_handler]
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        console_handler.handle(logging.makeLogRecord({'msg': f"Log file disabled: {e}", 'levelno': logging.WARNING,
+                                                      'levelname': 'WARNING', 'correlation_id': '-'}))
+
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [queue_handler]
+    root_logger.setLevel(level)
+
+    global _log_listener
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _log_listener = listener
+    return listener
+
+
+def attach_log_handler(handler):
+    """
+    Add a handler to the logging pipeline.
+
+    With the queue pipeline running, the handler runs on the listener thread
+    after rate limiting; otherwise it is attached to the root logger.
+
+    Args:
+        handler (logging.Handler): The handler to add.
+    """
+    if _log_listener is not None:
+        _log_listener.handlers = _log_listener.handlers + (handler,)
+    else:
+        logging.getLogger().addHandler(handler)
+
+# Most recent records kept in memory for the log window
+LOG_BUFFER_SIZE = 200000
+# Lines the log window's Text widget holds at once
+LOG_VIEW_LINES = 5000
+# How often the log window picks up new records
+LOG_POLL_INTERVAL_MS = 200
+# Pause in typing before the log window re-filters on the search text
+LOG_SEARCH_DEBOUNCE_MS = 300
+
+
+class LogRingBuffer:
+    """A bounded, thread-safe buffer of formatted log records with sequence numbers."""
+
+    def __init__(self, maxlen):
+        # (sequence, levelno, text) tuples; the oldest fall off when full
+        self.records = collections.deque(maxlen=maxlen)
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def append(self, levelno, text):
+        """Add a formatted record."""
+        with self.lock:
+            self.sequence += 1
+            self.records.append((self.sequence, levelno, text))
+
+    def since(self, sequence):
+        """
+        Return the records added after `sequence`, oldest first.
+
+        Only the new records are visited, so polling costs nothing when idle.
+        """
+        newer = []
+        with self.lock:
+            for record in reversed(self.records):
+                if record[0] <= sequence:
+                    break
+                newer.append(record)
+        newer.reverse()
+        return newer
+
+    def tail(self, predicate, limit):
+        """
+        Return the newest `limit` records accepted by `predicate`, oldest first.
+
+        The records are copied under the lock and filtered outside it, so logging
+        threads are not held up while a large buffer is searched.
+
+        Args:
+            predicate (callable): Called with (levelno, text).
+            limit (int): Maximum number of records to return.
+
+        Returns:
+            tuple: (current sequence number, list of records).
+        """
+        with self.lock:
+            sequence = self.sequence
+            records = list(self.records)
+        selected = []
+        for record in reversed(records):
+            if predicate(record[1], record[2]):
+                selected.append(record)
+                if len(selected) >= limit:
+                    break
+        selected.reverse()
+        return sequence, selected
+
+
+# Handle logging in Tkinter
+class TextHandler(logging.Handler):
+    """This class allows logging to a ring buffer, which is polled from the main thread."""
+    def __init__(self, log_buffer):
+        super().__init__()
+        self.log_buffer = log_buffer
+
+    def emit(self, record):
+        msg = self.format(record)
+        # Put the message into the ring buffer
+        self.log_buffer.append(record.levelno, msg)
+
+def print_plan(config_file, as_json=False):
+    """
+    Print the backfill plan for a configuration without starting the service.
+
+    Args:
+        config_file (str): Path of config.ini; the catalog next to it supplies cached sizes and history.
+        as_json (bool): Print the full plan, including segment paths, as JSON instead of a table.
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(config_file)
+    defaults, watch_roots = WatchRoot.from_config(config)
+    if defaults.directory:
+        watch_roots.insert(0, defaults)
+    join_mode = config.get('Settings', 'join_mode', fallback='compose')
+    catalog = TripCatalog(os.path.join(os.path.dirname(config_file), 'catalog.db'))
+    try:
+        planner = JoinPlanner(watch_roots, catalog, join_mode if join_mode in JOIN_MODES else 'compose',
+                              ResourcePolicy.from_config(config).max_workers, OutputPolicy.from_config(config))
+        plan = planner.plan()
+    finally:
+        catalog.close()
+    print(json.dumps(plan, indent=2, default=str) if as_json else JoinPlanner.format_table(plan))
+
+def format_search_results(entries):
+    """
+    Render catalog search results as a plain text table.
+
+    Args:
+        entries (list): The result of TripCatalog.search().
+
+    Returns:
+        str: The table.
+    """
+    lines = [f"{'Start':<20} {'End':<20} {'Duration':>9} {'Camera':<10} {'Kind':<8} {'MB':>8}  Path"]
+    for entry in entries:
+        duration = str(datetime.timedelta(seconds=round(entry['duration']))) if entry['duration'] else '-'
+        lines.append(f"{entry['start'].isoformat(sep=' ', timespec='seconds'):<20} "
+                     f"{entry['end'].isoformat(sep=' ', timespec='seconds'):<20} {duration:>9} "
+                     f"{entry['channel'] or '-':<10} {entry['kind']:<8} {entry['size_bytes'] / 1048576:>8.1f}  "
+                     f"{entry['path']}")
+    lines.append(f"{len(entries)} file(s), {sum(entry['size_bytes'] for entry in entries) / 1048576:.1f} MB.")
+    return '\n'.join(lines)
+
+
+def print_query(config_file, start, end, camera=None, kind=None, as_json=False):
+    """
+    Print the cataloged footage overlapping a time range, for --query.
+
+    Args:
+        config_file (str): Path of config.ini; the catalog next to it is queried.
+        start (str): Start of the range, e.g. '2024-03-03 14:00'.
+        end (str): End of the range.
+        camera (str): Optionally only one camera channel.
+        kind (str): Optionally only 'trip' or 'segment' entries.
+        as_json (bool): Print the entries as JSON instead of a table.
+
+    Returns:
+        int: The process exit code.
+    """
+    try:
+        start_time = datetime.datetime.fromisoformat(start)
+        end_time = datetime.datetime.fromisoformat(end)
+    except ValueError:
+        print("Times must look like YYYY-MM-DD HH:MM[:SS].", file=sys.stderr)
+        return 2
+    catalog = TripCatalog(os.path.join(os.path.dirname(config_file), 'catalog.db'))
+    try:
+        entries = catalog.search(start_time, end_time, kind=kind, channel=camera)
+    finally:
+        catalog.close()
+    print(json.dumps(entries, indent=2, default=str) if as_json else format_search_results(entries))
+    return 0
+
+def run_headless(config_file, profile=False):
+    """
+    Run the joiner without a window until interrupted with Ctrl+C or SIGTERM.
+
+    Args:
+        config_file (str): Path of config.ini.
+        profile (bool): Profile join jobs, as with --profile.
+
+    Returns:
+        int: The process exit code.
+    """
+    service = JoinerService(config_file, profile=profile)
+    if not service.start_monitoring():
+        service.shutdown()
+        return 1
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    try:
+        # Wake up regularly so Ctrl+C is handled promptly
+        while not stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    service.shutdown()
+    return 0
+
+def main():
+    # Start the background logging pipeline
+    log_listener = configure_logging()
+
+    # Parse command line options
+    parser = argparse.ArgumentParser(description="Dash Cam Video Joiner")
+    parser.add_argument('--config', default=os.path.join(APP_DIR, 'config.ini'),
+                        help="configuration file to use (default: config.ini next to the application)")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile join jobs with cProfile and tracemalloc (saved under logs/profiles)")
+    parser.add_argument('--startup-benchmark', action='store_true',
+                        help="print the time until the window is drawn, then exit")
+    parser.add_argument('--headless', action='store_true',
+                        help="monitor and join without a window, e.g. on a processing node")
+    parser.add_argument('--plan', action='store_true',
+                        help="print the trips a backfill of the watch roots would produce, then exit")
+    parser.add_argument('--plan-json', action='store_true', help="with --plan, print the full plan as JSON")
+    parser.add_argument('--query', nargs=2, metavar=('START', 'END'),
+                        help="print the cataloged footage between two times (YYYY-MM-DD HH:MM), then exit")
+    parser.add_argument('--camera', help="with --query, only this camera: <root>/<subfolder>, or just the "
+                                         "subfolder to match it under every watch root")
+    parser.add_argument('--kind', choices=['trip', 'segment'], help="with --query, only joined trips or loose segments")
+    parser.add_argument('--query-json', action='store_true', help="with --query, print the entries as JSON")
+    parser.add_argument('--cluster-status', action='store_true',
+                        help="print the status reported by every node sharing the archive, then exit")
+    args = parser.parse_args()
+
+    if args.plan:
+        print_plan(args.config, as_json=args.plan_json)
+        log_listener.stop()
+        return
+    if args.query:
+        exit_code = print_query(args.config, *args.query, camera=args.camera,
+                                kind=args.kind, as_json=args.query_json)
+        log_listener.stop()
+        sys.exit(exit_code)
+    if args.cluster_status:
+        config = configparser.ConfigParser(interpolation=None)
+        config.read(args.config)
+        print(json.dumps(LeaseQueue.read_status(ClusterPolicy.from_config(config).directory), indent=2))
+        log_listener.stop()
+        return
+    if args.headless:
+        exit_code = run_headless(args.config, profile=args.profile)
+        log_listener.stop()
+        sys.exit(exit_code)
 
-def main():
     # Create the main application window
     root = tk.Tk()
     # Instantiate the application class
-    app = DashCamVideoJoinerApp(root)
+    app = DashCamVideoJoinerApp(root, profile=args.profile, config_file=args.config)
+
+    if args.startup_benchmark:
+        def report_startup():
+            # The window has been mapped and drawn once the event loop goes idle
+            root.update_idletasks()
+            print(json.dumps({'time_to_window_seconds': time.perf_counter() - STARTUP_BEGAN}))
+            # A measurement run must not rewrite the configuration it was given
+            app.exit_app(save_config=False)
+        root.after_idle(report_startup)
     # Start the Tkinter event loop
     root.mainloop()
+    # Flush any queued log records
+    log_listener.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""Time range searches of the trip catalog."""
+import datetime
+
+import main
+
+T0 = datetime.datetime(2024, 11, 11, 15, 0, 0)
+
+
+def at(seconds):
+    return T0 + datetime.timedelta(seconds=seconds)
+
+
+def paths(entries):
+    return [entry['path'] for entry in entries]
+
+
+def test_trips_match_when_they_overlap_the_range(tmp_path):
+    catalog = main.TripCatalog(str(tmp_path / 'catalog.db'))
+    catalog.add('/v/before.mp4', 'trip', at(0), at(60), 1)
+    # A long trip that starts well before the range and runs into it
+    catalog.add('/v/long.mp4', 'trip', at(100), at(4000), 1)
+    catalog.add('/v/inside.mp4', 'trip', at(3700), at(3750), 1)
+    catalog.add('/v/after.mp4', 'trip', at(5000), at(5060), 1)
+    assert paths(catalog.search(at(3600), at(4200))) == ['/v/long.mp4', '/v/inside.mp4']
+    assert catalog.search(at(3600), at(4200))[0]['duration'] == 3900
+
+
+def test_segments_match_within_their_longest_length(tmp_path):
+    catalog = main.TripCatalog(str(tmp_path / 'catalog.db'))
+    # Segments only have a start time; the grouping threshold bounds how long they run
+    catalog.add('/v/near.mp4', 'segment', at(0), at(0), 1, segment_seconds=90)
+    catalog.add('/v/far.mp4', 'segment', at(-200), at(-200), 1, segment_seconds=90)
+    entries = catalog.search(at(60), at(120))
+    assert paths(entries) == ['/v/near.mp4']
+    assert entries[0]['duration'] is None
+    assert paths(catalog.search(at(60), at(120), kind='trip')) == []
+
+
+def test_removing_the_longest_entry_keeps_results_exact(tmp_path):
+    catalog = main.TripCatalog(str(tmp_path / 'catalog.db'))
+    catalog.add('/v/long.mp4', 'trip', at(0), at(10000), 1)
+    catalog.add('/v/short.mp4', 'trip', at(9000), at(9100), 1)
+    assert catalog.max_span_seconds == 10000
+    catalog.remove(['/v/long.mp4'])
+    assert catalog.max_span_seconds == 100
+    assert paths(catalog.search(at(9050), at(9060))) == ['/v/short.mp4']
+
+
+def test_channel_filter(tmp_path):
+    catalog = main.TripCatalog(str(tmp_path / 'catalog.db'))
+    catalog.add('/a/front/1.mp4', 'trip', at(0), at(60), 1, channel='a/front')
+    catalog.add('/b/front/1.mp4', 'trip', at(0), at(60), 1, channel='b/front')
+    catalog.add('/a/rear/1.mp4', 'trip', at(0), at(60), 1, channel='a/rear')
+    # Entries from before watch roots were recorded
+    catalog.add('/old/front/1.mp4', 'trip', at(0), at(60), 1, channel='front')
+    assert paths(catalog.search(at(0), at(60), channel='a/front')) == ['/a/front/1.mp4']
+    assert sorted(paths(catalog.search(at(0), at(60), channel='front'))) == [
+        '/a/front/1.mp4', '/b/front/1.mp4', '/old/front/1.mp4']
+
+
+def test_derived_files_are_left_out_of_searches(tmp_path):
+    catalog = main.TripCatalog(str(tmp_path / 'catalog.db'))
+    trip = tmp_path / 'trip.mp4'
+    sidecar = tmp_path / 'trip.keyframes.json'
+    trip.write_bytes(b'\0' * 10)
+    sidecar.write_bytes(b'{}')
+    catalog.add(str(trip), 'trip', at(0), at(60), 10)
+    catalog.add_derived(str(trip), [str(sidecar), str(tmp_path / 'missing.mp4')])
+    assert catalog.derived([str(trip)]) == [str(sidecar)]
+    assert paths(catalog.search(at(0), at(60))) == [str(trip)]
@@ -0,0 +1,48 @@
+"""Grouping segments into trips and forgetting grouped segments."""
+import datetime
+
+import main
+
+T0 = datetime.datetime(2024, 11, 11, 15, 0, 0)
+
+
+def make_handler(time_threshold=90):
+    return main.VideoFileHandler(time_threshold, '%Y-%m-%d %Hh %Mm %Ss', '.mp4', None, None, None)
+
+
+def videos(*offsets):
+    return [(f"/v/{offset}.mp4", T0 + datetime.timedelta(seconds=offset)) for offset in offsets]
+
+
+def track(handler, video_files):
+    handler.video_files = sorted(video_files, key=lambda video: video[1])
+    handler.video_paths = {path for path, _ in video_files}
+
+
+def test_groups_split_where_the_gap_exceeds_the_threshold():
+    handler = make_handler()
+    groups = handler.group_videos(videos(0, 60, 150, 300, 390))
+    assert groups == [videos(0, 60, 150), videos(300, 390)]
+    assert handler.group_videos([]) == []
+    assert handler.group_videos(videos(0)) == [videos(0)]
+
+
+def test_drop_videos_forgets_only_the_given_segments():
+    handler = make_handler()
+    track(handler, videos(0, 60, 120, 180))
+    handler._drop_videos(videos(60, 180))
+    assert handler.video_files == videos(0, 120)
+    assert handler.video_paths == {'/v/0.mp4', '/v/120.mp4'}
+    # Segments that are not tracked are ignored
+    handler._drop_videos(videos(60, 500))
+    assert handler.video_files == videos(0, 120)
+
+
+def test_drop_videos_with_shared_timestamps():
+    handler = make_handler()
+    same = T0 + datetime.timedelta(seconds=60)
+    tracked = videos(0) + [('/v/a.mp4', same), ('/v/b.mp4', same), ('/v/c.mp4', same)] + videos(120)
+    track(handler, tracked)
+    handler._drop_videos([('/v/b.mp4', same)])
+    assert [path for path, _ in handler.video_files] == ['/v/0.mp4', '/v/a.mp4', '/v/c.mp4', '/v/120.mp4']
+    assert '/v/b.mp4' not in handler.video_paths
@@ -0,0 +1,113 @@
+"""
+The window's thread only moves commands and state snapshots while a backfill runs.
+
+The Tk thread is emulated by a loop that wakes every frame and drains the update
+queue the way DashCamVideoJoinerApp.poll_updates does, so no display is needed.
+"""
+import configparser
+import datetime
+import os
+import queue
+import time
+
+import main
+
+FILES = 10000
+THRESHOLD = 90
+TIMESTAMP_FORMAT = '%Y-%m-%d %Hh %Mm %Ss'
+# Largest delay of a frame past its due time, the default bound of benchmark.py --ui-latency-bound-ms
+FRAME_BOUND_SECONDS = 0.1
+FRAME_SECONDS = 0.01
+TIMEOUT_SECONDS = 300
+
+
+def write_ungroupable_files(directory, count):
+    """Write small segments spaced beyond the threshold, so the backfill scans but never joins."""
+    base = datetime.datetime(2024, 11, 11, 8, 0, 0)
+    for index in range(count):
+        timestamp = base + datetime.timedelta(seconds=(THRESHOLD + 1) * index)
+        with open(os.path.join(directory, timestamp.strftime(TIMESTAMP_FORMAT) + '.mp4'), 'wb') as f:
+            f.write(b'\0' * 1024)
+
+
+def make_app(tmp_path, count=FILES):
+    """Return a window without widgets whose command thread runs a service over `count` segments."""
+    watch_directory = tmp_path / 'watch'
+    watch_directory.mkdir()
+    write_ungroupable_files(watch_directory, count)
+    config = configparser.ConfigParser(interpolation=None)
+    config['Settings'] = {
+        'selected_directory': str(watch_directory),
+        'time_threshold': str(THRESHOLD),
+        'timestamp_format': TIMESTAMP_FORMAT,
+        'video_extension': '.mp4',
+    }
+    config_file = tmp_path / 'config.ini'
+    with open(config_file, 'w') as f:
+        config.write(f)
+    app = main.DashCamVideoJoinerApp.__new__(main.DashCamVideoJoinerApp)
+    app.root = None
+    app.start_service(str(config_file))
+    return app
+
+
+def drain(app):
+    """Take every pending update off the queue, as one poll_updates tick does."""
+    updates = []
+    while True:
+        try:
+            updates.append(app.updates.get_nowait())
+        except queue.Empty:
+            return updates
+
+
+def test_frame_latency_during_backfill(tmp_path):
+    app = make_app(tmp_path)
+    # Starting monitoring scans the files already in the directory
+    app.send('start_monitoring')
+
+    delays = []
+    seen = 0
+    started = time.perf_counter()
+    due = started + FRAME_SECONDS
+    try:
+        while seen < FILES:
+            time.sleep(max(0.0, due - time.perf_counter()))
+            now = time.perf_counter()
+            delays.append(now - due)
+            for kind, payload in drain(app):
+                assert kind != 'error', payload
+                if kind == 'state':
+                    seen = payload['metrics'].get('segments_seen_total', 0)
+            assert now - started < TIMEOUT_SECONDS, f"backfill saw {seen} of {FILES} files"
+            due = now + FRAME_SECONDS
+    finally:
+        app.exit_app(save_config=False)
+        deadline = time.perf_counter() + 60
+        while time.perf_counter() < deadline:
+            if any(kind == 'exited' for kind, _ in drain(app)):
+                break
+            time.sleep(FRAME_SECONDS)
+
+    assert seen == FILES
+    assert max(delays) <= FRAME_BOUND_SECONDS, f"slowest frame was {max(delays) * 1000:.0f} ms late"
+
+
+def test_settings_go_through_the_command_queue(tmp_path):
+    app = make_app(tmp_path, count=10)
+    try:
+        app.send('apply_settings', 120, TIMESTAMP_FORMAT, '.mp4')
+        app.send('set_directory', str(tmp_path))
+        deadline = time.perf_counter() + 30
+        settings = None
+        while time.perf_counter() < deadline:
+            states = [payload for kind, payload in drain(app) if kind == 'state']
+            if states and states[-1]['settings']['time_threshold'] == 120:
+                settings = states[-1]['settings']
+                if settings['selected_directory'] == str(tmp_path):
+                    break
+            time.sleep(FRAME_SECONDS)
+        assert settings and settings['selected_directory'] == str(tmp_path)
+    finally:
+        app.exit_app(save_config=False)
+        app.command_thread.join(60)
@@ -0,0 +1,204 @@
+"""Claims, renewals and reaping of the shared lease queue, within one process and across several."""
+import multiprocessing
+import os
+import random
+import time
+
+import main
+
+LEASE_SECONDS = 1
+
+
+class IdleScheduler:
+    """Stands in for the JoinScheduler in node status files."""
+
+    def snapshot(self):
+        return []
+
+
+def make_queue(directory, node, lease_seconds=LEASE_SECONDS):
+    queue = main.LeaseQueue(main.ClusterPolicy(True, str(directory), node, lease_seconds), IdleScheduler())
+    os.makedirs(queue.lease_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(queue.status_path), exist_ok=True)
+    return queue
+
+
+def age(path, seconds):
+    """Make a lease look as if it was last renewed `seconds` ago."""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_claim_is_all_or_nothing(tmp_path):
+    first = make_queue(tmp_path, 'a')
+    second = make_queue(tmp_path, 'b')
+    assert first.claim(['x', 'y'])
+    assert not second.claim(['w', 'y', 'z'])
+    # The keys the second node got before the conflict were handed back
+    assert second.held == set()
+    assert not os.path.exists(second._lease_path('w'))
+    assert second.held_elsewhere(['x', 'w']) == {'x'}
+    assert first.held_elsewhere(['x', 'w']) == set()
+
+
+def test_release_lets_another_node_claim(tmp_path):
+    first = make_queue(tmp_path, 'a')
+    second = make_queue(tmp_path, 'b')
+    assert first.claim(['x'])
+    first.finished(['x'], succeeded=True)
+    assert first.completed == 1 and first.held == set()
+    assert second.claim(['x'])
+
+
+def test_renew_keeps_a_lease_from_being_reaped(tmp_path):
+    holder = make_queue(tmp_path, 'a')
+    reaper = make_queue(tmp_path, 'r')
+    assert holder.claim(['x'])
+    age(holder._lease_path('x'), LEASE_SECONDS * 10)
+    holder._renew()
+    reaper._reap(time.time())
+    assert os.path.exists(holder._lease_path('x'))
+
+
+def test_reap_breaks_expired_leases_and_requeues(tmp_path):
+    requeued = []
+    holder = make_queue(tmp_path, 'a')
+    reaper = make_queue(tmp_path, 'r')
+    reaper.on_requeue = lambda: requeued.append(True)
+    assert holder.claim(['stale', 'fresh'])
+    age(holder._lease_path('stale'), LEASE_SECONDS * 10)
+    reaper._reap(time.time())
+    assert not os.path.exists(holder._lease_path('stale'))
+    assert os.path.exists(holder._lease_path('fresh'))
+    assert requeued == [True]
+    # Nothing but leases is left in the directory
+    assert all(name.endswith('.lease') for name in os.listdir(reaper.lease_dir))
+    assert make_queue(tmp_path, 'b').claim(['stale'])
+
+
+def test_reap_removes_markers_left_by_a_stopped_node(tmp_path):
+    reaper = make_queue(tmp_path, 'r')
+    marker_path = reaper._lease_path('x') + '.reaping'
+    open(marker_path, 'w').close()
+    assert not reaper.claim(['x'])
+    age(marker_path, LEASE_SECONDS * 10)
+    reaper._reap(time.time())
+    assert not os.path.exists(marker_path)
+    assert reaper.claim(['x'])
+
+
+def test_claim_inside_the_reap_window_backs_off(tmp_path, monkeypatch):
+    holder = make_queue(tmp_path, 'a')
+    reaper = make_queue(tmp_path, 'r')
+    other = make_queue(tmp_path, 'b')
+    assert holder.claim(['x'])
+    lease_path = holder._lease_path('x')
+    # The reaper's scan sees an expired lease...
+    age(lease_path, LEASE_SECONDS * 10)
+    claims = []
+    rename = os.rename
+
+    def renew_then_rename(source, destination):
+        # ...the holder renews it just before the rename...
+        holder._renew()
+        rename(source, destination)
+        # ...and while it is moved aside another node tries to take the key
+        claims.append(other.claim(['x']))
+
+    monkeypatch.setattr(os, 'rename', renew_then_rename)
+    reaper._reap(time.time())
+    monkeypatch.undo()
+
+    assert claims == [False]
+    assert os.path.exists(lease_path)
+    assert 'x' in holder.held and 'x' not in other.held
+    assert sorted(os.listdir(reaper.lease_dir)) == [os.path.basename(lease_path)]
+
+
+def join_worker(cluster_dir, segment_dir, log_path, node, groups, crash, deadline):
+    """
+    Join every group of segments this node can claim, the way VideoFileHandler.process_videos does.
+
+    A crashing node claims its groups and exits without joining or releasing them, so
+    the others only get them after reaping the expired leases.
+    """
+    rename = os.rename
+
+    def slow_rename(source, destination):
+        rename(source, destination)
+        # Keep the lease moved aside long enough for other nodes' claims to land in the window
+        if destination.endswith('.stale'):
+            time.sleep(0.005)
+
+    os.rename = slow_rename
+    queue = make_queue(cluster_dir, node)
+    groups = list(groups)
+    random.Random(node).shuffle(groups)
+    while time.time() < deadline:
+        remaining = 0
+        for keys in groups:
+            paths = [os.path.join(segment_dir, key) for key in keys]
+            if not any(os.path.exists(path) for path in paths):
+                continue
+            remaining += 1
+            if not queue.claim(keys):
+                continue
+            # Segments joined by another node between the scan and the claim drop out of
+            # the group, the way process_videos drops contested segments
+            present = [path for path in paths if os.path.exists(path)]
+            if not present:
+                queue.release(keys)
+                continue
+            if crash:
+                continue
+            with open(log_path, 'a') as log:
+                log.write(''.join(f"{node} {os.path.basename(path)}\n" for path in present))
+            time.sleep(0.001)
+            for path in present:
+                os.remove(path)
+            queue.finished(keys, succeeded=True)
+        if crash:
+            # Die holding the leases: no renewal, no release
+            os._exit(0)
+        if not remaining:
+            break
+        # One heartbeat of LeaseQueue._run per pass
+        queue._renew()
+        queue._reap(queue._write_status('running'))
+        time.sleep(0.05)
+    queue.stop()
+
+
+def test_each_segment_is_joined_exactly_once_across_processes(tmp_path):
+    segment_dir = tmp_path / 'segments'
+    segment_dir.mkdir()
+    cluster_dir = tmp_path / 'cluster'
+    log_path = tmp_path / 'joined.log'
+    groups = [[f"trip{trip:03d}_{segment}.mp4" for segment in range(3)] for trip in range(60)]
+    # Neighbouring trips share a segment, so groups overlap the way regrouping can make them
+    for trip in range(0, len(groups) - 1, 4):
+        groups[trip].append(groups[trip + 1][0])
+    for keys in groups:
+        for key in keys:
+            (segment_dir / key).write_bytes(b'\0')
+    segments = sorted({key for keys in groups for key in keys})
+
+    context = multiprocessing.get_context('spawn')
+    deadline = time.time() + 120
+    crashed = context.Process(target=join_worker, args=(
+        str(cluster_dir), str(segment_dir), str(log_path), 'crashed', groups[:10], True, deadline))
+    crashed.start()
+    crashed.join(60)
+    assert crashed.exitcode == 0
+    workers = [context.Process(target=join_worker, args=(
+        str(cluster_dir), str(segment_dir), str(log_path), f"node{index}", groups, False, deadline))
+        for index in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(150)
+        assert worker.exitcode == 0
+
+    joined = [line.split()[1] for line in log_path.read_text().splitlines()]
+    assert sorted(joined) == segments
+    assert not os.listdir(segment_dir)
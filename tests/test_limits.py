@@ -0,0 +1,62 @@
+"""Log rate limiting, bandwidth pacing and packet copy checks."""
+import logging
+
+import main
+
+
+def make_record(lineno, created, message='Could not parse %s', level=logging.WARNING):
+    record = logging.LogRecord('test', level, 'main.py', lineno, message, ('x.mp4',), None)
+    record.created = created
+    return record
+
+
+def test_rate_limit_filter_suppresses_repeats_from_one_line():
+    log_filter = main.RateLimitFilter(burst=3, window=10.0)
+    passed = [log_filter.filter(make_record(1, 100 + index * 0.1)) for index in range(10)]
+    assert passed == [True] * 3 + [False] * 7
+    # Another call site has its own budget
+    assert log_filter.filter(make_record(2, 101))
+    # The first record after the window reports what was dropped
+    record = make_record(1, 110.5)
+    assert log_filter.filter(record)
+    assert record.getMessage() == "Could not parse x.mp4 (7 similar message(s) suppressed)"
+    record = make_record(1, 110.6)
+    assert log_filter.filter(record)
+    assert record.getMessage() == "Could not parse x.mp4"
+
+
+def test_rate_limit_filter_passes_info_records():
+    log_filter = main.RateLimitFilter(burst=1, window=10.0)
+    assert all(log_filter.filter(make_record(1, 100, level=logging.INFO)) for _ in range(5))
+
+
+def test_bandwidth_limiter_charges_beyond_the_burst():
+    limiter = main.BandwidthLimiter(1000)
+    # The bucket starts with one second's worth of bytes
+    assert limiter.reserve(1000) == 0
+    assert 0.49 < limiter.reserve(500) <= 0.5
+    # Debt accumulates for callers that do not sleep it off
+    assert 0.99 < limiter.reserve(500) <= 1.0
+
+
+def test_bandwidth_limiter_disabled():
+    limiter = main.BandwidthLimiter(0)
+    assert limiter.reserve(10 ** 9) == 0
+
+
+STREAM = {'container': 'mov,mp4,m4a,3gp,3g2,mj2', 'video': 'h264', 'pix_fmt': 'yuv420p', 'size': '1920x1080',
+          'audio': 'aac', 'audio_rate': '48000', 'audio_layout': 'stereo'}
+
+
+def test_copy_blocker():
+    assert main.copy_blocker([STREAM, dict(STREAM)], 'mp4') is None
+    assert main.copy_blocker([STREAM, None], 'mp4') == "Could not probe every clip"
+    assert main.copy_blocker([STREAM, dict(STREAM, size='1280x720', audio_rate='44100')], 'mp4') == \
+        "Clips differ in audio_rate, size"
+    pcm = dict(STREAM, audio='pcm_s16le')
+    assert main.copy_blocker([pcm, pcm], 'mp4') == "mp4 cannot hold h264/pcm_s16le without re-encoding"
+    # Matroska holds any codec
+    assert main.copy_blocker([pcm, pcm], 'matroska') is None
+    # Silent clips only need a video codec the container can hold
+    silent = dict(STREAM, audio=None)
+    assert main.copy_blocker([silent, silent], 'mp4') is None
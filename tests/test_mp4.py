@@ -0,0 +1,84 @@
+"""Keyframe indexes read from the sample tables of small hand-built MP4 files."""
+import struct
+
+import main
+
+TIMESCALE = 1000
+
+
+def box(kind, *payloads):
+    payload = b''.join(payloads)
+    return struct.pack('>I4s', 8 + len(payload), kind.encode()) + payload
+
+
+def full_box(kind, version, *payloads):
+    return box(kind, struct.pack('>B3x', version), *payloads)
+
+
+def table(kind, entry_format, entries, version=0):
+    """A sample table box: version and flags, an entry count and the entries."""
+    return full_box(kind, version, struct.pack('>I', len(entries)),
+                    b''.join(struct.pack('>' + entry_format, *entry) for entry in entries))
+
+
+def sample_tables(ctts=None, chunk_offsets=('stco', 'I', [(1000,), (5000,)]), sizes=True):
+    """Four samples of 0.5 s in two chunks of two; samples 1 and 3 are keyframes."""
+    boxes = [
+        table('stts', 'II', [(4, 500)]),
+        table('stss', 'I', [(1,), (3,)]),
+        table('stsc', 'III', [(1, 2, 1)]),
+        table(*chunk_offsets),
+    ]
+    if ctts is not None:
+        boxes.append(ctts)
+    if sizes:
+        boxes.append(full_box('stsz', 0, struct.pack('>II', 0, 4), struct.pack('>4I', 100, 10, 100, 10)))
+    return box('stbl', *boxes)
+
+
+def write_mp4(path, stbl, moov_first=True):
+    mdhd = full_box('mdhd', 0, struct.pack('>IIII', 0, 0, TIMESCALE, 2000), b'\0' * 4)
+    hdlr = full_box('hdlr', 0, struct.pack('>I4s', 0, b'vide'), b'\0' * 12)
+    moov = box('moov', box('trak', box('mdia', mdhd, hdlr, box('minf', stbl))))
+    mdat = box('mdat', b'\0' * 64)
+    ftyp = box('ftyp', b'isom', b'\0\0\0\0')
+    path.write_bytes(ftyp + (moov + mdat if moov_first else mdat + moov))
+    return str(path)
+
+
+def test_keyframes_come_from_the_sync_samples(tmp_path):
+    index = main.mp4_keyframe_index(write_mp4(tmp_path / 'a.mp4', sample_tables()))
+    assert index == {'duration': 2.0, 'faststart': True, 'keyframes': [[0.0, 1000], [1.0, 5000]]}
+
+
+def test_index_after_the_media_is_not_faststart(tmp_path):
+    index = main.mp4_keyframe_index(write_mp4(tmp_path / 'a.mp4', sample_tables(), moov_first=False))
+    assert not index['faststart']
+    assert index['keyframes'] == [[0.0, 1000], [1.0, 5000]]
+
+
+def test_version_1_composition_offsets_are_signed(tmp_path):
+    ctts = table('ctts', 'Ii', [(2, 250), (2, -250)], version=1)
+    index = main.mp4_keyframe_index(write_mp4(tmp_path / 'a.mp4', sample_tables(ctts=ctts)))
+    assert index['keyframes'] == [[0.25, 1000], [0.75, 5000]]
+
+
+def test_64_bit_chunk_offsets(tmp_path):
+    offsets = ('co64', 'Q', [(2 ** 32 + 10,), (2 ** 32 + 500,)])
+    index = main.mp4_keyframe_index(write_mp4(tmp_path / 'a.mp4', sample_tables(chunk_offsets=offsets)))
+    assert index['keyframes'] == [[0.0, 2 ** 32 + 10], [1.0, 2 ** 32 + 500]]
+
+
+def test_empty_chunk_offset_table_is_not_replaced_by_co64(tmp_path):
+    index = main.mp4_keyframe_index(write_mp4(tmp_path / 'a.mp4', sample_tables(chunk_offsets=('stco', 'I', []))))
+    assert index['keyframes'] == []
+
+
+def test_missing_sample_sizes_give_no_index(tmp_path):
+    assert main.mp4_keyframe_index(write_mp4(tmp_path / 'a.mp4', sample_tables(sizes=False))) is None
+
+
+def test_file_without_an_index_gives_none(tmp_path):
+    path = tmp_path / 'a.mp4'
+    path.write_bytes(box('ftyp', b'isom', b'\0\0\0\0') + box('mdat', b'\0' * 16))
+    assert main.mp4_keyframe_index(str(path)) is None